@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史报告批量回填
+扫描 linuxdo/data/*.json 和 reddit_scraper/data/*.json，把归档的 JSON 报告一次性导入数据库：
+- 在进程池中并行解析 JSON 文件
+- 按帖子 id 去重，generation_time 最新的报告为准
+- 在一个事务中通过 COPY 写入临时表，再 upsert 到 posts / reddit_posts
+- --dry-run 只对比归档与数据库的差异，不写入
+
+取代 manual_upload.py / upload_0925_data.py / upload_reddit_data.py 逐行插入的做法。
+
+使用方法:
+  python backfill.py                    # 回填全部数据源
+  python backfill.py --sources reddit   # 只回填 reddit
+  python backfill.py --dry-run          # 只显示差异
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+SCRAPER_ROOT = Path(__file__).resolve().parent
+if str(SCRAPER_ROOT) not in sys.path:
+    sys.path.insert(0, str(SCRAPER_ROOT))
+
+load_dotenv(dotenv_path=SCRAPER_ROOT.parent / '.env')
+load_dotenv(dotenv_path=SCRAPER_ROOT / '.env')
+
+from common import db
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger("backfill")
+
+# 各数据源：归档目录、目标表、列（顺序即 COPY 的列顺序，id 必须在第一位）
+SOURCES = {
+    "linuxdo": {
+        "pattern": "linuxdo/data/*.json",
+        "table": "posts",
+        "columns": ["id", "title", "url", "core_issue", "key_info", "post_type",
+                    "value_assessment", "detailed_analysis", "timestamp"],
+    },
+    "reddit": {
+        "pattern": "reddit_scraper/data/*.json",
+        "table": "reddit_posts",
+        "columns": ["id", "title", "title_cn", "url", "core_issue", "key_info", "post_type",
+                    "value_assessment", "detailed_analysis", "subreddit", "timestamp"],
+    },
+}
+
+# 归档中可能缺失的列：为 NULL 时保留数据库中的原值
+NULLABLE_COLUMNS = {"title_cn", "core_issue", "key_info", "post_type", "value_assessment",
+                    "detailed_analysis", "subreddit"}
+
+# 报告文件名中的日期，如 linux.do_report_2025-09-25.json
+REPORT_DATE_RE = re.compile(r'_(\d{4}-\d{2}-\d{2})\.json$')
+
+
+def parse_generation_time(meta: dict, path: str) -> datetime:
+    """
+    报告生成时间；缺失或无法解析时使用文件名中的日期（*_YYYY-MM-DD.json），
+    都没有时才使用文件修改时间（检出仓库时的时间，不代表报告日期）
+    """
+    value = meta.get('generation_time', '')
+    if value:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            # 与文件名日期、数据库中的 timestamp 一样按本地时间比较（不带时区）
+            return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+        except ValueError:
+            pass
+    match = REPORT_DATE_RE.search(os.path.basename(path))
+    if match:
+        try:
+            return datetime.strptime(match.group(1), '%Y-%m-%d')
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+def parse_report(source: str, path: str) -> Tuple[str, List[tuple], Optional[str]]:
+    """
+    解析一个报告文件（在子进程中运行）
+
+    Returns:
+        (文件路径, 行列表, 错误信息)；行的列顺序与 SOURCES[source]['columns'] 一致
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    except Exception as e:
+        return path, [], str(e)
+
+    meta = report.get('meta', {})
+    generation_time = parse_generation_time(meta, path)
+    # 早期的 reddit 报告只抓取 r/technology，帖子上没有 subreddit 字段
+    default_subreddit = None if meta.get('subreddits') else 'technology'
+
+    rows = []
+    for post in report.get('posts', []):
+        post_id = post.get('id')
+        if not post_id or post_id == 'N/A':
+            continue
+        analysis = post.get('analysis') or {}
+        key_info = analysis.get('key_info')
+        values = {
+            "id": str(post_id),
+            "title": post.get('title') or '无标题',
+            "title_cn": post.get('title_cn') or analysis.get('title_cn'),
+            "url": post.get('url') or '#',
+            "core_issue": analysis.get('core_issue'),
+            "key_info": json.dumps(key_info, ensure_ascii=False) if key_info is not None else None,
+            "post_type": analysis.get('post_type'),
+            "value_assessment": analysis.get('value_assessment'),
+            "detailed_analysis": analysis.get('detailed_analysis'),
+            "subreddit": post.get('subreddit') or default_subreddit,
+            "timestamp": generation_time,
+        }
+        rows.append(tuple(values[column] for column in SOURCES[source]['columns']))
+    return path, rows, None
+
+
+def collect_rows(source: str, workers: int) -> Dict[str, tuple]:
+    """并行解析某个数据源的全部归档，按 id 去重（generation_time 最新的为准）"""
+    config = SOURCES[source]
+    paths = sorted(str(path) for path in SCRAPER_ROOT.glob(config['pattern']))
+    if not paths:
+        logger.warning(f"⚠️ [{source}] 未找到归档文件: {config['pattern']}")
+        return {}
+
+    timestamp_index = config['columns'].index('timestamp')
+    latest: Dict[str, tuple] = {}
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(paths) // (workers * 4))
+        for path, rows, error in executor.map(parse_report, [source] * len(paths), paths,
+                                              chunksize=chunksize):
+            if error:
+                logger.error(f"❌ [{source}] 解析失败 {Path(path).name}: {error}")
+                continue
+            total += len(rows)
+            for row in rows:
+                current = latest.get(row[0])
+                if current is None or row[timestamp_index] >= current[timestamp_index]:
+                    latest[row[0]] = row
+
+    logger.info(f"📄 [{source}] {len(paths)} 个文件，{total} 条记录，去重后 {len(latest)} 条")
+    return latest
+
+
+async def diff_rows(conn, source: str, rows: Dict[str, tuple]) -> Dict[str, list]:
+    """对比归档与数据库：新增 / 有变化 / 无变化"""
+    config = SOURCES[source]
+    columns = config['columns']
+    existing = await conn.fetch(
+        f"SELECT {', '.join(columns)} FROM {config['table']} WHERE id = ANY($1::text[])",
+        list(rows),
+    )
+    existing = {record['id']: record for record in existing}
+
+    result = {"new": [], "changed": [], "unchanged": []}
+    for post_id, row in rows.items():
+        record = existing.get(post_id)
+        if record is None:
+            result["new"].append(post_id)
+            continue
+        changed = []
+        for column, value in zip(columns, row):
+            if value is None and column in NULLABLE_COLUMNS:
+                continue
+            current = record[column]
+            if column == 'key_info':
+                value = json.loads(value)
+                current = json.loads(current) if current is not None else None
+            elif column == 'timestamp' and current is not None:
+                current = current.astimezone().replace(tzinfo=None)
+            if value != current:
+                changed.append(column)
+        result["changed" if changed else "unchanged"].append((post_id, changed) if changed else post_id)
+    return result
+
+
+async def load_rows(conn, source: str, rows: Dict[str, tuple]) -> str:
+    """COPY 到临时表，再 upsert 到目标表（调用方负责事务）"""
+    config = SOURCES[source]
+    table, columns = config['table'], config['columns']
+    staging = f"backfill_{table}"
+
+    await conn.execute(
+        f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    await conn.copy_records_to_table(staging, records=list(rows.values()), columns=columns)
+
+    updates = []
+    for column in columns[1:]:
+        if column in NULLABLE_COLUMNS:
+            updates.append(f"{column} = COALESCE(EXCLUDED.{column}, {table}.{column})")
+        else:
+            updates.append(f"{column} = EXCLUDED.{column}")
+    return await conn.execute(f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM {staging}
+        ON CONFLICT (id) DO UPDATE SET {', '.join(updates)}
+    """)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='把归档的 JSON 报告批量回填到数据库')
+    parser.add_argument('--sources', '-s', nargs='+', choices=list(SOURCES),
+                        help='只回填指定数据源（默认全部）')
+    parser.add_argument('--dry-run', '-n', action='store_true', help='只显示与数据库的差异，不写入')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1,
+                        help='解析 JSON 的进程数（默认 CPU 核数）')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    sources = args.sources or list(SOURCES)
+    collected = {source: collect_rows(source, args.workers) for source in sources}
+    collected = {source: rows for source, rows in collected.items() if rows}
+    logger.info(f"⏱️ 解析用时 {time.monotonic() - start:.2f} 秒")
+    if not collected:
+        logger.warning("没有可回填的数据")
+        return True
+
+    pool = await db.get_pool()
+    async with pool.acquire() as conn:
+        if args.dry_run:
+            for source, rows in collected.items():
+                diff = await diff_rows(conn, source, rows)
+                logger.info(f"🔍 [{source}] 新增 {len(diff['new'])} 条，有变化 {len(diff['changed'])} 条，"
+                            f"无变化 {len(diff['unchanged'])} 条")
+                for post_id in diff['new'][:10]:
+                    logger.info(f"  + {post_id}")
+                for post_id, changed in diff['changed'][:10]:
+                    logger.info(f"  ~ {post_id}: {', '.join(changed)}")
+            return True
+
+        async with conn.transaction():
+            for source, rows in collected.items():
+                status = await load_rows(conn, source, rows)
+                logger.info(f"✅ [{source}] {SOURCES[source]['table']}: {status}")
+
+    logger.info(f"🎉 回填完成，总用时 {time.monotonic() - start:.2f} 秒")
+    return True
+
+
+if __name__ == "__main__":
+    success = asyncio.run(db.run_and_close(main()))
+    exit(0 if success else 1)
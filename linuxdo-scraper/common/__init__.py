@@ -0,0 +1,4 @@
+"""
+爬虫公共模块
+linux.do / reddit / heybox 三个数据源共享的基础设施（数据库连接池、DeepSeek 调用与速率预算等）
+"""
@@ -0,0 +1,198 @@
+"""
+自适应并发窗口（AIMD）
+固定的请求间隔（AI_REQUEST_DELAY = 3）和固定并发数都只能按最坏情况配置，
+而接口的实际承载能力随时段变化。这里按观测到的信号调整并发窗口：
+
+- 加性增: 请求成功、延迟正常且窗口已被占满时，窗口增加 1/窗口（每轮满窗口的请求约 +1）
+- 乘性减: 过载信号（429、5xx、超时、连接错误）或中位延迟超过基线的 AIMD_LATENCY_TOLERANCE 倍时，
+  窗口乘以 AIMD_BACKOFF；同一轮请求只收缩一次（收缩前发出的请求再失败不重复收缩）
+- 延迟基线: 最近 AIMD_WINDOW 个样本的中位数的历史最低值，每个样本缓慢上浮，以适应不同时段的基准延迟；
+  样本为每次请求的耗时，按调用类型（ticket.kind，如完整分析 / 简要分析 / 翻译）分别计算中位数和基线，
+  长短请求不混在一起比较（按输出 token 数折算会把固定开销摊到短请求上，短请求看起来总是更慢）
+
+当前窗口、收缩次数和延迟分位数见 summary() / snapshot()；窗口收缩时记录日志（扩大只记 DEBUG）。
+基于 threading，适用于同步调用和 asyncio.to_thread / 线程池中的调用（DeepSeek、PRAW 等）。
+
+环境变量:
+- AIMD_BACKOFF: 收缩系数（默认 0.5）
+- AIMD_LATENCY_TOLERANCE: 中位延迟超过基线多少倍视为拥塞（默认 2.0）
+- AIMD_WINDOW: 计算延迟分位数的最近样本数（默认 50）
+"""
+
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+AIMD_BACKOFF = float(os.getenv("AIMD_BACKOFF", "0.5"))
+AIMD_LATENCY_TOLERANCE = float(os.getenv("AIMD_LATENCY_TOLERANCE", "2.0"))
+AIMD_WINDOW = int(os.getenv("AIMD_WINDOW", "50"))
+
+# 判断拥塞前至少需要的样本数
+MIN_SAMPLES = 5
+# 每个样本基线上浮的比例（约 1400 个样本翻倍，单次运行内基本不变）
+BASELINE_DRIFT = 0.0005
+
+OK, OVERLOAD, ERROR = "ok", "overload", "error"
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Ticket:
+    """一次请求占用的名额"""
+
+    def __init__(self, epoch, saturated):
+        self.started = time.monotonic()
+        self.epoch = epoch
+        self.saturated = saturated
+        self.kind = None
+        self.overloaded = False
+
+    def mark_overloaded(self):
+        """请求没有抛出异常，但调用方判断为过载（如返回了限流提示）"""
+        self.overloaded = True
+
+
+class AdaptiveLimit:
+    """AIMD 并发窗口：slot() 占用一个名额，退出时按结果调整窗口"""
+
+    def __init__(self, name, initial, minimum=1, maximum=16, backoff=AIMD_BACKOFF,
+                 tolerance=AIMD_LATENCY_TOLERANCE, window=AIMD_WINDOW, is_overload=None):
+        """
+        Args:
+            is_overload: 判断异常是否为过载信号的函数；其他异常只释放名额，不调整窗口
+        """
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.is_overload = is_overload or (lambda error: False)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._epoch = 0
+        self._sample_size = max(MIN_SAMPLES, window)
+        self._samples = {}      # {调用类型: 最近的延迟样本}
+        self._all_samples = deque(maxlen=1000)
+        self._baseline = {}     # {调用类型: 延迟基线}
+        self.requests = 0
+        self.increases = 0
+        self.decreases = {OVERLOAD: 0, "latency": 0}
+        self.low = self.high = self.window
+
+    @property
+    def window(self):
+        """当前并发窗口（整数）"""
+        return max(self.minimum, int(self.limit))
+
+    def _acquire(self):
+        with self._cond:
+            while self._in_flight >= self.window:
+                self._cond.wait()
+            self._in_flight += 1
+            self.requests += 1
+            return Ticket(self._epoch, saturated=self._in_flight >= self.window)
+
+    def _set_limit(self, value, reason):
+        before = self.window
+        self.limit = min(float(self.maximum), max(float(self.minimum), value))
+        after = self.window
+        self.low, self.high = min(self.low, after), max(self.high, after)
+        if after != before:
+            logger.log(logging.INFO if after < before else logging.DEBUG,
+                       f"🎚️ [{self.name}] 并发窗口 {before} → {after}（{reason}）")
+
+    def _decrease(self, ticket, kind, reason):
+        # 同一轮请求只收缩一次：收缩之前发出的请求随后失败，不再重复收缩
+        if ticket.epoch != self._epoch:
+            return
+        self._epoch += 1
+        self._samples.clear()
+        self.decreases[kind] += 1
+        self._set_limit(self.limit * self.backoff, reason)
+
+    def _release(self, ticket, outcome):
+        elapsed = time.monotonic() - ticket.started
+        with self._cond:
+            self._in_flight -= 1
+            if outcome == OVERLOAD:
+                self._decrease(ticket, OVERLOAD, "过载")
+            elif outcome == OK:
+                self._all_samples.append(elapsed)
+                if ticket.epoch != self._epoch:
+                    # 上次收缩前发出的请求反映的是旧窗口下的延迟，不参与判断
+                    self._cond.notify_all()
+                    return
+                samples = self._samples.setdefault(ticket.kind, deque(maxlen=self._sample_size))
+                samples.append(elapsed)
+                median = statistics.median(samples) if len(samples) >= MIN_SAMPLES else None
+                baseline = None
+                if median is not None:
+                    previous = self._baseline.get(ticket.kind)
+                    baseline = median if previous is None else min(previous * (1 + BASELINE_DRIFT), median)
+                    self._baseline[ticket.kind] = baseline
+                if median is not None and median > baseline * self.tolerance:
+                    self._decrease(ticket, "latency",
+                                   f"中位延迟 {median:.3g}s 超过基线 {baseline:.3g}s 的 {self.tolerance:g} 倍")
+                elif ticket.saturated and self.limit < self.maximum:
+                    before = self.window
+                    self._set_limit(self.limit + 1 / self.limit, "延迟正常，窗口已占满")
+                    if self.window > before:
+                        self.increases += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个名额，yield Ticket；退出时按结果调整窗口
+
+        - 正常退出: 记录延迟样本（按 ticket.kind 分类型比较）；ticket.mark_overloaded() 视为过载
+        - 抛出异常: is_overload(异常) 为真时视为过载，否则只释放名额
+        """
+        ticket = self._acquire()
+        try:
+            yield ticket
+        except BaseException as e:
+            self._release(ticket, OVERLOAD if isinstance(e, Exception) and self.is_overload(e) else ERROR)
+            raise
+        self._release(ticket, OVERLOAD if ticket.overloaded else OK)
+
+    def snapshot(self):
+        """当前状态（用于日志和报告）"""
+        with self._cond:
+            latencies = list(self._all_samples)
+            return {
+                "window": self.window,
+                "limit": round(self.limit, 2),
+                "in_flight": self._in_flight,
+                "low": self.low,
+                "high": self.high,
+                "requests": self.requests,
+                "increases": self.increases,
+                "decreases_overload": self.decreases[OVERLOAD],
+                "decreases_latency": self.decreases["latency"],
+                "latency_p50": _percentile(latencies, 0.5),
+                "latency_p90": _percentile(latencies, 0.9),
+            }
+
+    def summary(self):
+        stats = self.snapshot()
+        if not stats["requests"]:
+            return f"[{self.name}] 自适应并发: 无请求"
+        latency = (f"，延迟 p50 {stats['latency_p50']:.1f}s / p90 {stats['latency_p90']:.1f}s"
+                   if stats["latency_p50"] is not None else "")
+        return (f"[{self.name}] 自适应并发: 当前窗口 {stats['window']}（本次范围 {stats['low']}-{stats['high']}，"
+                f"上限 {self.maximum}），{stats['requests']} 次请求，扩大 {stats['increases']} 次，"
+                f"收缩 {stats['decreases_overload'] + stats['decreases_latency']} 次"
+                f"（过载 {stats['decreases_overload']}，延迟 {stats['decreases_latency']}）{latency}")
@@ -0,0 +1,234 @@
+"""
+浏览器生命周期管理
+长时间复用同一个标签页抓取详情页时，渲染进程内存会持续增长，最终拖慢甚至崩溃浏览器。
+这里按标签页统计导航次数，并通过 CDP Performance.getMetrics 读取 JS 堆内存：
+
+- 单个标签页导航超过 BROWSER_TAB_MAX_PAGES 次，或堆内存超过 BROWSER_TAB_MAX_HEAP_MB，
+  就新开一个标签页并关闭旧的（同一浏览器/上下文，Cookie 和 localStorage 保留）
+- BROWSER_RESTART_PAGES > 0 时（仅 DrissionPage），每抓取这么多页整体重启浏览器，
+  Cookie 复制到新浏览器（未使用 USER_DATA_DIR 时 localStorage 不保留）
+
+TabRecycler 用于 DrissionPage（同步），AsyncPageRecycler 用于 Playwright。
+
+环境变量:
+- BROWSER_TAB_MAX_PAGES: 单个标签页最多导航次数（默认 20）
+- BROWSER_TAB_MAX_HEAP_MB: 单个标签页 JS 堆内存上限（默认 512）
+- BROWSER_RESTART_PAGES: 每抓取多少页重启浏览器（默认 0，不重启）
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TAB_MAX_PAGES = int(os.getenv("BROWSER_TAB_MAX_PAGES", "20"))
+TAB_MAX_HEAP_MB = float(os.getenv("BROWSER_TAB_MAX_HEAP_MB", "512"))
+BROWSER_RESTART_PAGES = int(os.getenv("BROWSER_RESTART_PAGES", "0"))
+
+
+def heap_mb_from_metrics(result):
+    """从 Performance.getMetrics 的返回值中取出 JSHeapUsedSize（MB）"""
+    for metric in (result or {}).get("metrics", []):
+        if metric.get("name") == "JSHeapUsedSize":
+            return metric.get("value", 0) / (1024 * 1024)
+    return None
+
+
+class _RecyclerStats:
+    """两种实现共用的计数与判断逻辑"""
+
+    def __init__(self, source, max_pages, max_heap_mb):
+        self.source = source
+        self.max_pages = max_pages
+        self.max_heap_mb = max_heap_mb
+        self.tab_pages = 0
+        self.total_pages = 0
+        self.recycles = 0
+        self.restarts = 0
+        self.last_heap_mb = None
+        self.peak_heap_mb = 0.0
+
+    def _count_navigation(self):
+        self.tab_pages += 1
+        self.total_pages += 1
+
+    def _recycle_reason(self, heap_mb):
+        if heap_mb is not None:
+            self.last_heap_mb = heap_mb
+            self.peak_heap_mb = max(self.peak_heap_mb, heap_mb)
+        if self.max_pages and self.tab_pages >= self.max_pages:
+            return f"已导航 {self.tab_pages} 页"
+        if self.max_heap_mb and heap_mb is not None and heap_mb >= self.max_heap_mb:
+            return f"JS 堆 {heap_mb:.0f} MB"
+        return None
+
+    def summary(self):
+        heap = f"，峰值 JS 堆 {self.peak_heap_mb:.0f} MB" if self.peak_heap_mb else ""
+        return (f"[{self.source}] 共导航 {self.total_pages} 页，回收标签页 {self.recycles} 次，"
+                f"重启浏览器 {self.restarts} 次{heap}")
+
+
+class TabRecycler(_RecyclerStats):
+    """
+    DrissionPage 标签页回收
+
+    Args:
+        browser: ChromiumPage（浏览器主标签页，只用于开新标签页）
+        source: 数据源名称（日志用）
+        setup_tab: 新标签页创建后的回调（如设置请求过滤）
+        browser_factory: 重启浏览器时调用，返回新的 ChromiumPage；为 None 时不重启
+    """
+
+    def __init__(self, browser, source, setup_tab=None, browser_factory=None,
+                 max_pages=TAB_MAX_PAGES, max_heap_mb=TAB_MAX_HEAP_MB,
+                 restart_pages=BROWSER_RESTART_PAGES):
+        super().__init__(source, max_pages, max_heap_mb)
+        self.browser = browser
+        self._setup_tab = setup_tab
+        self._browser_factory = browser_factory
+        self._restart_pages = restart_pages
+        self._tab = None
+
+    @property
+    def tab(self):
+        """当前工作标签页（不存在时新建）"""
+        if self._tab is None:
+            self._tab = self.browser.new_tab()
+            self.tab_pages = 0
+            if self._setup_tab:
+                self._setup_tab(self._tab)
+            try:
+                self._tab.run_cdp("Performance.enable")
+            except Exception as e:
+                logger.debug(f"启用 Performance 域失败: {e}")
+        return self._tab
+
+    def heap_mb(self):
+        if self._tab is None:
+            return None
+        try:
+            return heap_mb_from_metrics(self._tab.run_cdp("Performance.getMetrics"))
+        except Exception as e:
+            logger.debug(f"读取标签页内存失败: {e}")
+            return None
+
+    def after_navigation(self):
+        """每抓取完一页调用：必要时回收标签页或重启浏览器"""
+        self._count_navigation()
+        if (self._restart_pages and self._browser_factory
+                and self.total_pages % self._restart_pages == 0):
+            self.restart()
+            return
+        reason = self._recycle_reason(self.heap_mb())
+        if reason:
+            self.recycle(reason)
+
+    def _close_tab(self):
+        tab, self._tab = self._tab, None
+        if tab is not None:
+            try:
+                tab.close()
+            except Exception as e:
+                logger.debug(f"关闭标签页失败: {e}")
+
+    def recycle(self, reason=""):
+        """关闭当前标签页，下次访问 tab 时新建"""
+        self._close_tab()
+        self.recycles += 1
+        logger.info(f"♻️ [{self.source}] 回收标签页（{reason}）")
+
+    def restart(self):
+        """重启浏览器并复制 Cookie"""
+        cookies = []
+        try:
+            cookies = self.browser.cookies(all_domains=True, all_info=True)
+        except Exception as e:
+            logger.warning(f"⚠️ [{self.source}] 读取 Cookie 失败: {e}")
+        self._close_tab()
+        try:
+            self.browser.quit()
+        except Exception:
+            pass
+        self.browser = self._browser_factory()
+        if cookies:
+            try:
+                self.browser.set.cookies(cookies)
+            except Exception as e:
+                logger.warning(f"⚠️ [{self.source}] 恢复 Cookie 失败: {e}")
+        self.restarts += 1
+        logger.info(f"🔄 [{self.source}] 已重启浏览器（第 {self.total_pages} 页，恢复 {len(cookies)} 个 Cookie）")
+
+    def close(self):
+        """关闭工作标签页（浏览器本身由调用方关闭）"""
+        self._close_tab()
+
+
+class AsyncPageRecycler(_RecyclerStats):
+    """
+    Playwright 页面回收：同一 BrowserContext 内新建页面，Cookie 和存储自动共享
+
+    Args:
+        context: BrowserContext
+        source: 数据源名称（日志用）
+        setup_page: 新页面创建后的异步回调（可选）
+    """
+
+    def __init__(self, context, source, setup_page=None,
+                 max_pages=TAB_MAX_PAGES, max_heap_mb=TAB_MAX_HEAP_MB):
+        super().__init__(source, max_pages, max_heap_mb)
+        self.context = context
+        self._setup_page = setup_page
+        self._page = None
+        self._cdp = None
+
+    async def get_page(self):
+        """当前工作页面（不存在时新建）"""
+        if self._page is None:
+            self._page = await self.context.new_page()
+            self.tab_pages = 0
+            if self._setup_page:
+                await self._setup_page(self._page)
+            try:
+                self._cdp = await self.context.new_cdp_session(self._page)
+                await self._cdp.send("Performance.enable")
+            except Exception as e:
+                # 非 Chromium 浏览器不支持 CDP，只按导航次数回收
+                logger.debug(f"启用 Performance 域失败: {e}")
+                self._cdp = None
+        return self._page
+
+    async def heap_mb(self):
+        if self._cdp is None:
+            return None
+        try:
+            return heap_mb_from_metrics(await self._cdp.send("Performance.getMetrics"))
+        except Exception as e:
+            logger.debug(f"读取页面内存失败: {e}")
+            return None
+
+    async def after_navigation(self):
+        """每抓取完一页调用：必要时回收页面"""
+        self._count_navigation()
+        reason = self._recycle_reason(await self.heap_mb())
+        if reason:
+            await self.recycle(reason)
+
+    async def recycle(self, reason=""):
+        """关闭当前页面，下次 get_page 时新建"""
+        await self.close()
+        self.recycles += 1
+        logger.info(f"♻️ [{self.source}] 回收页面（{reason}）")
+
+    async def close(self):
+        page, self._page = self._page, None
+        cdp, self._cdp = self._cdp, None
+        if cdp is not None:
+            try:
+                await cdp.detach()
+            except Exception:
+                pass
+        if page is not None:
+            try:
+                await page.close()
+            except Exception as e:
+                logger.debug(f"关闭页面失败: {e}")
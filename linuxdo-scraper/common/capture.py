@@ -0,0 +1,204 @@
+"""
+调试存档（页面 / RSS 原文）
+原来每次抓取 RSS 都把整页写到当前目录的 debug_rss_content_<时间>.html，每次解析失败再写一个
+debug_page_<时间>.html，都是在事件循环里同步写几百 KB，文件只增不减。这里统一存到 data/captures/：
+
+- 压缩: gzip（common.html_extract 可以直接读取 .html.gz 重新提取）
+- 去重: 文件名为内容的 SHA-256 前缀，相同内容只存一份，再次出现只更新索引并刷新其新旧顺序；
+  文件在存档外被删掉时重新写入
+- 环形缓冲: 存档总大小超过 CAPTURE_MAX_BYTES 时删除最久未出现的内容，同时从索引中去掉对应记录
+- 索引: index.jsonl，每个文件一行（最近一次的 time / url / status / reason，以及 file / bytes /
+  first_seen / seen），行数不超过存档文件数
+- 后台写入: capture() 只计算哈希并放入队列（队列满时丢弃并计数），压缩和写盘在后台线程中完成，
+  进程退出前写完队列
+
+环境变量:
+- CAPTURE_ENABLED: 是否保存调试存档（默认 true）
+- CAPTURE_MAX_BYTES: 存档总大小上限（压缩后字节数，默认 50MB）
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_ENABLED = os.getenv("CAPTURE_ENABLED", "true").lower() == "true"
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+SCRAPER_ROOT = Path(__file__).resolve().parents[1]
+CAPTURE_DIR = SCRAPER_ROOT / "data" / "captures"
+INDEX_NAME = "index.jsonl"
+SUFFIX = ".html.gz"
+
+# 队列中最多等待写入的存档数（超过时丢弃，不阻塞抓取）
+QUEUE_SIZE = 32
+# 进程退出时等待写完队列的最长秒数
+CLOSE_TIMEOUT = 10
+
+
+class CaptureStore:
+    """压缩、去重、总大小有上限的调试存档"""
+
+    def __init__(self, root=CAPTURE_DIR, max_bytes=CAPTURE_MAX_BYTES, enabled=CAPTURE_ENABLED):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._files = None      # {文件名: 压缩后字节数}，按最近出现的顺序排列
+        self._index = {}        # {文件名: 索引记录}
+        self._total = 0
+        self.captured = 0
+        self.deduped = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.failed = 0
+
+    def capture(self, body, url="", status=None, reason=""):
+        """
+        提交一份存档（不等待写盘）
+
+        Returns:
+            存档文件相对 linuxdo-scraper 的路径（用于日志）；未启用或队列已满时为 None
+        """
+        if not self.enabled or body is None:
+            return None
+        data = body.encode("utf-8", errors="replace") if isinstance(body, str) else bytes(body)
+        name = hashlib.sha256(data).hexdigest()[:24] + SUFFIX
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "url": url,
+            "status": status,
+            "reason": reason,
+            "file": name,
+            "bytes": len(data),
+        }
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="capture-store", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        try:
+            self._queue.put_nowait((data, entry))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return os.path.relpath(self.root / name, SCRAPER_ROOT)
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        while True:
+            data, entry = self._queue.get()
+            try:
+                self._store(data, entry)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"⚠️ 保存调试存档失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _load(self):
+        """扫描已有存档（按修改时间排列新旧顺序），读入索引（旧版每次存档一行，合并为每个文件最后一行）"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = sorted((path.stat().st_mtime, path.name, path.stat().st_size)
+                       for path in self.root.glob(f"*{SUFFIX}"))
+        self._files = {name: size for _, name, size in files}
+        self._total = sum(self._files.values())
+        self._index = {}
+        index_path = self.root / INDEX_NAME
+        if index_path.exists():
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("file") in self._files:
+                        self._index[entry["file"]] = entry
+
+    def _store(self, data, entry):
+        if self._files is None:
+            self._load()
+        name = entry["file"]
+        path = self.root / name
+        if name in self._files:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # 文件在存档外被删掉了：按新内容重新写入
+                self._total -= self._files.pop(name)
+        if name in self._files:
+            # 相同内容已存档：只刷新新旧顺序
+            self._files[name] = self._files.pop(name)
+            self.deduped += 1
+        else:
+            compressed = gzip.compress(data, compresslevel=6)
+            temp_path = path.with_name(path.name + ".tmp")
+            with open(temp_path, "wb") as f:
+                f.write(compressed)
+            os.replace(temp_path, path)
+            self._files[name] = len(compressed)
+            self._total += len(compressed)
+            self.captured += 1
+        previous = self._index.pop(name, {})
+        entry["compressed"] = self._files[name]
+        entry["first_seen"] = previous.get("first_seen") or previous.get("time") or entry["time"]
+        entry["seen"] = int(previous.get("seen") or 1) + 1 if previous else 1
+        self._index[name] = entry
+        self._evict()
+        self._write_index()
+
+    def _evict(self):
+        """超过总大小上限时删除最久未出现的存档（至少保留最新一份），同时去掉索引记录"""
+        while self._total > self.max_bytes and len(self._files) > 1:
+            name, size = next(iter(self._files.items()))
+            del self._files[name]
+            self._index.pop(name, None)
+            self._total -= size
+            try:
+                (self.root / name).unlink()
+            except FileNotFoundError:
+                pass
+            self.evicted += 1
+
+    def _write_index(self):
+        """重写索引（每个文件一行，按最近出现的顺序）"""
+        index_path = self.root / INDEX_NAME
+        temp_path = index_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for name in self._files:
+                if name in self._index:
+                    f.write(json.dumps(self._index[name], ensure_ascii=False) + "\n")
+        os.replace(temp_path, index_path)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """写完队列中的存档（进程退出时自动调用）"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def summary(self):
+        if self._thread is None:
+            return "调试存档: 本次无存档"
+        files = self._files or {}
+        pending = self._queue.unfinished_tasks
+        return (f"调试存档: 本次新增 {self.captured} 份，重复 {self.deduped} 份，丢弃 {self.dropped} 份，"
+                f"淘汰 {self.evicted} 份{f'，待写入 {pending} 份' if pending else ''}；"
+                f"共 {len(files)} 份 / {self._total / 1024 / 1024:.1f}MB"
+                f"（上限 {self.max_bytes / 1024 / 1024:.0f}MB，{os.path.relpath(self.root, SCRAPER_ROOT)}）")
+
+
+store = CaptureStore()
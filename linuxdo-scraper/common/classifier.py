@@ -0,0 +1,420 @@
+"""
+本地帖子预分类器（post_type / value_assessment）
+两个字段都是固定类别，DeepSeek 对每个帖子都要生成一遍。历史报告
+（linuxdo/data/*.json、reddit_scraper/data/*.json）里已经有几百条带标签的样本，
+足够训练一个轻量的线性模型：
+
+- 特征: 标题规范化后，汉字取单字 + 双字，英文取单词 + 相邻词对，再加数据源标记；
+  哈希到 HASH_DIM 维，TF 取 1+log(tf)，乘以训练集 IDF 后 L2 归一化
+- 模型: 每个字段一个 softmax 线性分类器（NumPy 稀疏全量梯度下降 + L2 正则）
+- 预测: 各数据源只在自己出现过的类别中选择（各数据源提示词里的类别列表不同），
+  一批几十个帖子只需要几毫秒
+
+用途（common.triage）: 分析前批量预测，P(高) - P(低) 计入热度排序，高置信度「低」价值的帖子降一档；
+不调用 AI 的帖子用预测结果预填 post_type / value_assessment。
+只用标题训练和预测（历史报告里没有正文），标题信息有限，value_assessment 的准确率接近多数类基线，
+所以只作为排序的辅助信号，不直接替代 AI 判断。
+
+模型缓存在 data/post_classifier.npz，报告文件更新后在后台线程中重新训练（几百条样本只需几秒）：
+训练期间沿用旧的缓存模型（没有缓存时暂不预分类），不阻塞事件循环和同进程内的其他数据源。
+
+命令行（在 linuxdo-scraper 目录下）:
+  python -m common.classifier             # 训练并输出留出集准确率
+  python -m common.classifier --db        # 同时使用数据库中已分析的帖子（包含小黑盒）
+
+环境变量:
+- CLASSIFIER_ENABLED: 是否启用本地预分类（默认 true）
+- CLASSIFIER_GATE_CONFIDENCE: 预测为「低」价值且概率不低于该值时降档（默认 0.7）
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_ENABLED = os.getenv("CLASSIFIER_ENABLED", "true").lower() == "true"
+CLASSIFIER_GATE_CONFIDENCE = float(os.getenv("CLASSIFIER_GATE_CONFIDENCE", "0.7"))
+
+SCRAPER_ROOT = Path(__file__).resolve().parents[1]
+MODEL_PATH = SCRAPER_ROOT / "data" / "post_classifier.npz"
+REPORT_GLOBS = {
+    "linuxdo": str(SCRAPER_ROOT / "linuxdo" / "data" / "*.json"),
+    "reddit": str(SCRAPER_ROOT / "reddit_scraper" / "data" / "*.json"),
+}
+
+FIELDS = ("post_type", "value_assessment")
+# 不作为训练标签的取值（分析失败、未调用 AI 的占位）
+IGNORED_LABELS = {"错误", "未知", "未分类", "未分析", "N/A", ""}
+
+HASH_DIM = 1 << 15
+EPOCHS = 300
+# 短标题的 L2 归一化特征值很小，需要较大的学习率
+LEARNING_RATE = 30.0
+L2 = 1e-4
+
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text, source=""):
+    """标题 -> 特征词列表（汉字单字/双字，英文单词/词对，数据源标记）"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = [f"__src_{source}"] if source else []
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    words = _WORD_RE.findall(text)
+    tokens.extend(words)
+    tokens.extend(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+
+def _hash(token):
+    return zlib.crc32(token.encode("utf-8")) % HASH_DIM
+
+
+def hash_counts(text, source=""):
+    """-> (特征下标数组, 1+log(tf) 数组)"""
+    counts = {}
+    for token in tokenize(text, source):
+        index = _hash(token)
+        counts[index] = counts.get(index, 0) + 1
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return indices, values.astype(np.float32)
+
+
+def _csr(rows, idf):
+    """稀疏行 -> L2 归一化的 TF-IDF（CSR: indptr, 特征下标, 取值）；每行至少有数据源标记一个特征"""
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(indices) for indices, _ in rows])
+    cols = np.concatenate([indices for indices, _ in rows])
+    vals = np.concatenate([values for _, values in rows]) * idf[cols]
+    norms = np.sqrt(np.add.reduceat(vals * vals, indptr[:-1]))
+    vals /= np.repeat(np.where(norms > 0, norms, 1.0), np.diff(indptr))
+    return indptr, cols, vals.astype(np.float32)
+
+
+def _logits(X, W, b):
+    indptr, cols, vals = X
+    return np.add.reduceat(vals[:, None] * W[cols], indptr[:-1]) + b
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _train_softmax(X, y, n_classes):
+    """全量梯度下降训练 softmax 线性分类器（梯度只更新出现过的特征行），返回 (W, b)"""
+    indptr, cols, vals = X
+    n = len(indptr) - 1
+    row_of = np.repeat(np.arange(n), np.diff(indptr))
+    Y = np.eye(n_classes, dtype=np.float32)[y]
+    W = np.zeros((HASH_DIM, n_classes), dtype=np.float32)
+    b = np.zeros(n_classes, dtype=np.float32)
+    for _ in range(EPOCHS):
+        G = (_softmax(_logits(X, W, b)) - Y) / n
+        W *= 1 - LEARNING_RATE * L2
+        for k in range(n_classes):
+            W[:, k] -= LEARNING_RATE * np.bincount(cols, weights=vals * G[row_of, k], minlength=HASH_DIM)
+        b -= LEARNING_RATE * G.sum(axis=0)
+    return W, b
+
+
+def load_examples(db_rows=()):
+    """
+    读取历史报告中带标签的样本
+
+    Returns:
+        [{"source", "title", "post_type", "value_assessment"}]（同一帖子以最新报告为准）
+    """
+    examples = {}
+    for source, pattern in REPORT_GLOBS.items():
+        for path in sorted(glob.glob(pattern)):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    report = json.load(f)
+            except Exception as e:
+                logger.warning(f"⚠️ 跳过无法读取的报告 {path}: {e}")
+                continue
+            for post in report.get("posts", []):
+                analysis = post.get("analysis") or {}
+                title = post.get("title")
+                # 跳过失败的分析和按热度分级未调用 AI 的帖子（其标签就是本分类器的预测）
+                if not title or analysis.get("error") or analysis.get("analysis_tier") == "skip":
+                    continue
+                examples[(source, str(post.get("id") or title))] = {
+                    "source": source,
+                    "title": title,
+                    "post_type": analysis.get("post_type"),
+                    "value_assessment": analysis.get("value_assessment"),
+                }
+    for row in db_rows:
+        examples[(row["source"], str(row["id"]))] = dict(row)
+    return list(examples.values())
+
+
+async def load_db_examples():
+    """从数据库读取三个数据源已分析的帖子（需要 DATABASE_URL）"""
+    from common import db
+    from common.seen_index import SOURCE_TABLES
+
+    rows = []
+    pool = await db.get_pool()
+    for source, table in SOURCE_TABLES.items():
+        records = await pool.fetch(
+            f"SELECT id, title, post_type, value_assessment FROM {table} "
+            f"WHERE post_type IS NOT NULL AND COALESCE(key_info::text, '[]') <> '[]'"
+        )
+        rows.extend({"source": source, **dict(record)} for record in records)
+    return rows
+
+
+class PostClassifier:
+    """post_type / value_assessment 两个 softmax 分类器"""
+
+    def __init__(self, idf, heads, source_labels):
+        self.idf = idf
+        # heads: {field: (labels, W, b)}
+        self.heads = heads
+        # source_labels: {field: {source: [label, ...]}}
+        self.source_labels = source_labels
+
+    @classmethod
+    def train(cls, examples):
+        rows = [hash_counts(e["title"], e["source"]) for e in examples]
+        df = np.zeros(HASH_DIM, dtype=np.float32)
+        for indices, _ in rows:
+            df[indices] += 1
+        idf = (np.log((1 + len(rows)) / (1 + df)) + 1).astype(np.float32)
+
+        heads, source_labels = {}, {}
+        for field in FIELDS:
+            keep = [i for i, e in enumerate(examples) if (e.get(field) or "") not in IGNORED_LABELS]
+            labels = sorted({examples[i][field] for i in keep})
+            index = {label: k for k, label in enumerate(labels)}
+            y = np.array([index[examples[i][field]] for i in keep], dtype=np.int64)
+            W, b = _train_softmax(_csr([rows[i] for i in keep], idf), y, len(labels))
+            heads[field] = (labels, W, b)
+            per_source = {}
+            for i in keep:
+                per_source.setdefault(examples[i]["source"], set()).add(examples[i][field])
+            source_labels[field] = {source: sorted(values) for source, values in per_source.items()}
+        return cls(idf, heads, source_labels)
+
+    def predict(self, posts, source):
+        """
+        批量预测
+
+        Args:
+            posts: [{"title": ...}]
+            source: 数据源（只在该数据源出现过的类别中选择；没有训练样本时返回空字典）
+
+        Returns:
+            [{field: (label, probability), "value_score": P(高) - P(低)}]，与 posts 一一对应
+        """
+        if not posts:
+            return []
+        X = _csr([hash_counts(post.get("title", ""), source) for post in posts], self.idf)
+        results = [{} for _ in posts]
+        for field, (labels, W, b) in self.heads.items():
+            allowed = self.source_labels[field].get(source)
+            if not allowed:
+                continue
+            mask = np.array([label in allowed for label in labels])
+            logits = _logits(X, W, b)
+            logits[:, ~mask] = -np.inf
+            P = _softmax(logits)
+            best = P.argmax(axis=1)
+            for i, k in enumerate(best):
+                results[i][field] = (labels[k], float(P[i, k]))
+            if field == "value_assessment" and "高" in labels and "低" in labels:
+                value_score = P[:, labels.index("高")] - P[:, labels.index("低")]
+                for i, score in enumerate(value_score):
+                    results[i]["value_score"] = float(score)
+        return results
+
+    def save(self, path=MODEL_PATH):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        arrays = {"idf": self.idf}
+        for field, (labels, W, b) in self.heads.items():
+            arrays[f"{field}_W"] = W.astype(np.float16)
+            arrays[f"{field}_b"] = b
+        meta = {
+            "labels": {field: head[0] for field, head in self.heads.items()},
+            "source_labels": self.source_labels,
+        }
+        # 先写临时文件再替换：后台训练中途退出时不留下损坏的缓存
+        temp_path = Path(path).with_name(Path(path).name + ".tmp")
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        data = np.load(path)
+        meta = json.loads(str(data["meta"]))
+        heads = {
+            field: (labels, data[f"{field}_W"].astype(np.float32), data[f"{field}_b"])
+            for field, labels in meta["labels"].items()
+        }
+        return cls(data["idf"], heads, meta["source_labels"])
+
+
+def evaluate(examples, holdout=0.2, seed=0):
+    """
+    留出集评估：按比例随机留出样本，报告每个字段的准确率、多数类基线，
+    以及概率不低于 CLASSIFIER_GATE_CONFIDENCE 的预测所占比例和其准确率（降档依据的就是这部分预测）
+
+    Returns:
+        {field: {"accuracy", "baseline", "test", "confident", "confident_accuracy"}}
+    """
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(examples))
+    n_test = max(1, int(len(examples) * holdout))
+    test = [examples[i] for i in order[:n_test]]
+    train = [examples[i] for i in order[n_test:]]
+    model = PostClassifier.train(train)
+
+    report = {}
+    for field in FIELDS:
+        correct = total = baseline = confident = confident_correct = 0
+        for source in sorted({e["source"] for e in test}):
+            items = [e for e in test if e["source"] == source and (e.get(field) or "") not in IGNORED_LABELS]
+            predictions = model.predict(items, source)
+            train_labels = [e[field] for e in train if e["source"] == source and e.get(field)]
+            majority = max(set(train_labels), key=train_labels.count) if train_labels else None
+            for item, prediction in zip(items, predictions):
+                label, probability = prediction.get(field, (None, 0.0))
+                total += 1
+                correct += label == item[field]
+                baseline += item[field] == majority
+                if probability >= CLASSIFIER_GATE_CONFIDENCE:
+                    confident += 1
+                    confident_correct += label == item[field]
+        report[field] = {
+            "accuracy": correct / total if total else 0.0,
+            "baseline": baseline / total if total else 0.0,
+            "test": total,
+            "confident": confident / total if total else 0.0,
+            "confident_accuracy": confident_correct / confident if confident else 0.0,
+        }
+    return report
+
+
+def _newest_report_mtime():
+    paths = [path for pattern in REPORT_GLOBS.values() for path in glob.glob(pattern)]
+    return max((os.path.getmtime(path) for path in paths), default=0.0)
+
+
+_model = None
+_checked = False
+_lock = threading.Lock()
+
+
+def _train():
+    """后台线程：用历史报告重新训练并写入缓存，完成后替换当前模型"""
+    global _model
+    try:
+        started = time.time()
+        examples = load_examples()
+        if not examples:
+            logger.warning("⚠️ 没有可用的历史报告，跳过本地预分类")
+            return
+        model = PostClassifier.train(examples)
+        model.save()
+        _model = model
+        logger.info(f"✓ 本地预分类器训练完成: {len(examples)} 条样本，用时 {time.time() - started:.1f} 秒")
+    except Exception as e:
+        logger.warning(f"⚠️ 本地预分类器训练失败: {e}")
+
+
+def get_classifier():
+    """
+    取得预分类器（不阻塞）：第一次调用时读取缓存的模型，报告更新或缓存不存在时在后台线程中重新训练，
+    训练完成后的调用返回新模型；未启用、还没有可用模型或没有训练样本时返回 None（调用方按没有预分类处理）
+    """
+    global _model, _checked
+    if not CLASSIFIER_ENABLED:
+        return None
+    with _lock:
+        if _checked:
+            return _model
+        _checked = True
+        try:
+            stale = True
+            if MODEL_PATH.exists():
+                _model = PostClassifier.load()
+                stale = MODEL_PATH.stat().st_mtime < _newest_report_mtime()
+        except Exception as e:
+            logger.warning(f"⚠️ 读取本地预分类器缓存失败: {e}")
+            _model, stale = None, True
+        if stale:
+            threading.Thread(target=_train, name="classifier-train", daemon=True).start()
+            logger.info(f"⏳ 本地预分类器在后台重新训练（完成前{'使用旧模型' if _model else '不做预分类'}）")
+        return _model
+
+
+def agreement(posts, field="value_assessment"):
+    """预测与 AI 分析结果的一致率（只统计两者都有的帖子），用于在线观察预分类质量"""
+    pairs = [
+        (post["predicted"][field][0], post["analysis"].get(field))
+        for post in posts
+        if field in (post.get("predicted") or {}) and (post.get("analysis") or {}).get(field)
+        and post["analysis"].get("analysis_tier") != "skip"
+    ]
+    if not pairs:
+        return None
+    return sum(predicted == actual for predicted, actual in pairs) / len(pairs), len(pairs)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="训练本地帖子预分类器并输出留出集准确率")
+    parser.add_argument("--db", action="store_true", help="同时使用数据库中已分析的帖子")
+    parser.add_argument("--holdout", type=float, default=0.2, help="留出集比例（默认 0.2）")
+    args = parser.parse_args()
+
+    db_rows = []
+    if args.db:
+        from common import db
+        db_rows = asyncio.run(db.run_and_close(load_db_examples()))
+    examples = load_examples(db_rows)
+    by_source = {}
+    for e in examples:
+        by_source[e["source"]] = by_source.get(e["source"], 0) + 1
+    logger.info(f"📚 样本: {len(examples)} 条 {by_source}")
+
+    for field, result in evaluate(examples, args.holdout).items():
+        logger.info(f"🎯 {field}: 准确率 {result['accuracy'] * 100:.1f}%"
+                    f"（多数类基线 {result['baseline'] * 100:.1f}%，测试 {result['test']} 条）；"
+                    f"置信度≥{CLASSIFIER_GATE_CONFIDENCE} 的预测占 {result['confident'] * 100:.0f}%，"
+                    f"准确率 {result['confident_accuracy'] * 100:.1f}%")
+
+    started = time.time()
+    model = PostClassifier.train(examples)
+    model.save()
+    logger.info(f"✓ 全量训练用时 {time.time() - started:.1f} 秒，模型已保存: {MODEL_PATH}")
+
+    sample = [{"title": e["title"]} for e in examples[:50]]
+    started = time.perf_counter()
+    model.predict(sample, examples[0]["source"])
+    logger.info(f"⚡ 批量预测 {len(sample)} 条用时 {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    _main()
@@ -0,0 +1,184 @@
+"""
+评论区统计（本地计算）
+原来的提示词让 DeepSeek 从截断到 150 字的评论里「统计支持/反对/中立的比例」，
+既浪费输出 token，得到的数字也是编的。这里在本地对帖子的全部评论做统计，
+结果写进提示词让 AI 直接引用，同时作为结构化字段入库：
+
+- 立场: 词典打分（支持词 / 反对词，含「不」「没」否定翻转，中间可隔一个字），tanh 压缩到 [-1, 1]，
+  超过 ±STANCE_THRESHOLD 判为支持 / 反对，其余为中立
+- 分布: 按 (1 + 点赞数) 加权的支持 / 反对 / 中立占比
+- 争议度: 支持与反对势均力敌时接近 1，一边倒或没有表态时接近 0
+- 讨论热度: 回复数 + 0.5 × 评论总点赞数，按 HEAT_SCALE 饱和映射到 0-100
+
+所有帖子的评论拼成一个数组，中文词用 np.char.count 按子串一次匹配完成；
+英文词（mark、bug、sb 等）按词边界匹配，避免命中 markdown、debug、usb 这类单词的一部分；
+否定形式用正则匹配。
+再按帖子分段聚合。
+
+环境变量:
+- COMMENT_STANCE_THRESHOLD: 判定支持 / 反对的分数阈值（默认 0.2）
+- COMMENT_HEAT_SCALE: 热度饱和尺度，活跃度达到该值时热度约 63（默认 40）
+"""
+
+import logging
+import os
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STANCE_THRESHOLD = float(os.getenv("COMMENT_STANCE_THRESHOLD", "0.2"))
+HEAT_SCALE = float(os.getenv("COMMENT_HEAT_SCALE", "40"))
+
+SUPPORT_TERMS = {
+    "支持": 1.0, "赞同": 1.0, "同意": 1.0, "感谢": 1.0, "谢谢": 0.8, "好用": 1.0, "有用": 1.0,
+    "推荐": 0.8, "厉害": 1.0, "牛": 0.8, "强": 0.5, "学到了": 1.0, "已用": 0.8,
+    "真香": 1.0, "不错": 1.0, "靠谱": 1.0, "太棒": 1.0, "点赞": 0.8, "收藏": 0.5, "mark": 0.5,
+    "+1": 0.8, "顶": 0.5, "好评": 1.0, "确实": 0.5, "赞": 0.8, "nice": 0.8, "thanks": 0.8,
+}
+OPPOSE_TERMS = {
+    "反对": 1.0, "垃圾": 1.0, "坑": 0.8, "骗": 1.0, "智商税": 1.0, "割韭菜": 1.0, "失望": 1.0,
+    "差评": 1.0, "扯": 0.8, "没用": 1.0, "难用": 1.0, "别买": 1.0, "不行": 0.8,
+    "离谱": 0.8, "拉胯": 1.0, "封号": 0.5, "翻车": 0.8, "吐槽": 0.5, "质疑": 0.8,
+    "bug": 0.5, "sb": 1.0,
+}
+NEGATIONS = ("不", "没")
+# 否定词和支持词之间允许隔一个字：「没有用」「不太好用」「不是推荐」
+NEGATION_GAP = "有太很大是算"
+
+HEAT_LEVELS = ((60, "高"), (25, "中"), (0, "低"))
+
+
+def _term_pattern(term, negated=False):
+    """
+    匹配一个词的正则；不需要正则时返回 None（中文词直接按子串计数）
+
+    - 英文词按词边界匹配
+    - 否定形式：否定词 + 可选的一个间隔字（NEGATION_GAP）+ 支持词
+    """
+    if negated:
+        tail = r"(?![a-z0-9])" if term.isascii() else ""
+        return re.compile(
+            "[" + "".join(NEGATIONS) + "][" + NEGATION_GAP + "]?" + re.escape(term) + tail
+        )
+    if not term.isascii():
+        return None
+    return re.compile(r"(?<![a-z0-9])" + re.escape(term) + r"(?![a-z0-9])")
+
+
+def _build_lexicon():
+    """
+    词典 -> (词表, 匹配正则, 权重)；支持词前加否定词时整体翻转为反对：
+    「不好用」同时命中「好用」(+1) 和否定形式 (-2)，合计 -1。
+    否定形式由规则生成，OPPOSE_TERMS 里不再重复收录「不推荐」这类词，否则会被算两次
+    """
+    entries = []
+    for term, weight in SUPPORT_TERMS.items():
+        entries.append((term, _term_pattern(term), weight))
+        entries.append(("~" + term, _term_pattern(term, negated=True), -2 * weight))
+    for term, weight in OPPOSE_TERMS.items():
+        entries.append((term, _term_pattern(term), -weight))
+    terms, patterns, weights = zip(*entries)
+    return list(terms), list(patterns), np.array(weights, dtype=np.float32)
+
+
+LEXICON_TERMS, LEXICON_PATTERNS, LEXICON_WEIGHTS = _build_lexicon()
+
+
+def _likes(comment):
+    return int(comment.get("likes") or comment.get("likes_count") or 0)
+
+
+def score_comments(texts):
+    """每条评论的立场分数，范围 [-1, 1]"""
+    if not len(texts):
+        return np.zeros(0, dtype=np.float32)
+    array = np.char.lower(np.array(texts, dtype=str))
+    lowered = array.tolist()
+    hits = np.stack([
+        np.char.count(array, term) if pattern is None else [len(pattern.findall(text)) for text in lowered]
+        for term, pattern in zip(LEXICON_TERMS, LEXICON_PATTERNS)
+    ], axis=1).astype(np.float32)
+    return np.tanh(hits @ LEXICON_WEIGHTS)
+
+
+def heat_level(heat):
+    return next(label for threshold, label in HEAT_LEVELS if heat >= threshold)
+
+
+def compute_many(comment_lists, replies_counts=None):
+    """
+    批量计算多个帖子的评论区统计
+
+    Args:
+        comment_lists: [[{content, likes / likes_count}]]，每个帖子一个列表
+        replies_counts: 每个帖子的总回复数（RSS 统计，可能多于抓取到的评论），缺省用评论条数
+
+    Returns:
+        [dict]: comment_count, support_ratio, oppose_ratio, neutral_ratio（点赞加权），
+                sentiment（点赞加权平均分）, controversy, heat, heat_level
+    """
+    lengths = np.array([len(comments) for comments in comment_lists], dtype=np.int64)
+    all_comments = [comment for comments in comment_lists for comment in comments]
+    scores = score_comments([comment.get("content") or "" for comment in all_comments])
+    likes = np.array([_likes(comment) for comment in all_comments], dtype=np.float32).reshape(-1)
+    weights = 1.0 + likes
+    stance = np.where(scores > STANCE_THRESHOLD, 0, np.where(scores < -STANCE_THRESHOLD, 1, 2))
+
+    # 按帖子分段求和：reduceat 不支持空段，只对有评论的帖子计算（非空段的起点严格递增，分段正确）
+    starts = np.cumsum(lengths) - lengths
+    columns = np.stack([
+        weights * (stance == 0), weights * (stance == 1), weights * (stance == 2),
+        weights * scores, likes,
+    ], axis=1)
+    sums = np.zeros((len(lengths), 5), dtype=np.float64)
+    nonempty = lengths > 0
+    if nonempty.any():
+        sums[nonempty] = np.add.reduceat(columns, starts[nonempty], axis=0)
+    support, oppose, neutral, weighted_score, total_likes = sums.T
+
+    total = support + oppose + neutral
+    safe_total = np.where(total > 0, total, 1.0)
+    decided = support + oppose
+    controversy = 2 * np.minimum(support, oppose) / np.where(decided > 0, decided, 1.0)
+    replies = np.maximum(np.asarray(replies_counts if replies_counts is not None else lengths, dtype=np.float64), lengths)
+    heat = np.rint(100 * (1 - np.exp(-(replies + 0.5 * total_likes) / HEAT_SCALE))).astype(int)
+
+    return [
+        {
+            "comment_count": int(lengths[i]),
+            "support_ratio": round(float(support[i] / safe_total[i]), 3),
+            "oppose_ratio": round(float(oppose[i] / safe_total[i]), 3),
+            "neutral_ratio": round(float(neutral[i] / safe_total[i]), 3),
+            "sentiment": round(float(weighted_score[i] / safe_total[i]), 3),
+            "controversy": round(float(controversy[i]), 3),
+            "heat": int(heat[i]),
+            "heat_level": heat_level(heat[i]),
+        }
+        for i in range(len(lengths))
+    ]
+
+
+def annotate(posts):
+    """为每个帖子计算 post['comment_stats']（一次批量计算）"""
+    stats = compute_many(
+        [post.get("comments") or [] for post in posts],
+        [int(post.get("replies_count") or post.get("comments_count") or 0) for post in posts],
+    )
+    for post, post_stats in zip(posts, stats):
+        post["comment_stats"] = post_stats
+    return posts
+
+
+def prompt_section(stats):
+    """提示词中的评论区统计（让 AI 直接引用，不再自行估算）"""
+    if not stats or not stats["comment_count"]:
+        return ""
+    return (
+        f"\n**评论区统计**（本地计算，共{stats['comment_count']}条评论，按点赞加权，请直接引用，不要重新估算）：\n"
+        f"- 讨论热度: {stats['heat']}/100（{stats['heat_level']}）\n"
+        f"- 立场分布: 支持 {stats['support_ratio'] * 100:.0f}% / 反对 {stats['oppose_ratio'] * 100:.0f}% / "
+        f"中立 {stats['neutral_ratio'] * 100:.0f}%\n"
+        f"- 争议度: {stats['controversy']:.2f}（0 为一边倒，1 为势均力敌）\n"
+    )
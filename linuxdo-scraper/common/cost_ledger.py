@@ -0,0 +1,225 @@
+"""
+DeepSeek token / 费用账本（按数据源、按天）
+common.deepseek.chat_completion 的每次调用都会按接口返回的 usage 记账：
+
+- 计费: prompt token 按前缀缓存命中 / 未命中分别计价，加上输出 token，单位为元（价格按百万 token 配置）
+- 账本: 本次运行的合计保存在内存中，每日合计持久化到 data/ai_usage_ledger.json，
+  同一天多次运行（手动重跑、各数据源分开运行）累计到同一天；只保留最近 LEDGER_RETENTION_DAYS 天
+- 预算: 每个数据源每天的 token 预算，加上所有数据源每天的费用预算。
+  common.triage 按剩余额度逐级降档（完整分析 → 简要分析 → 不分析），
+  额度用完后 chat_completion 直接抛出 BudgetExhausted，不再发出请求
+- 单篇成本: 各数据源结束时记录本次处理的帖子数，summary() 输出每篇帖子的平均 token 和费用，
+  用于预估增加抓取数量后的成本
+
+环境变量:
+- AI_DAILY_TOKEN_BUDGET: 每个数据源每天的 token 预算（默认 300000，0 表示不限；
+  可加 _<SOURCE> 后缀单独配置，如 AI_DAILY_TOKEN_BUDGET_REDDIT）
+- AI_DAILY_COST_BUDGET: 所有数据源每天的费用预算，单位元（默认 0，不限）
+- DEEPSEEK_PRICE_CACHE_HIT / DEEPSEEK_PRICE_CACHE_MISS / DEEPSEEK_PRICE_OUTPUT:
+  每百万 token 的价格（元，默认 0.2 / 2 / 3）
+- LEDGER_RETENTION_DAYS: 账本保留天数（默认 30）
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+AI_DAILY_COST_BUDGET = float(os.getenv("AI_DAILY_COST_BUDGET", "0"))
+PRICE_CACHE_HIT = float(os.getenv("DEEPSEEK_PRICE_CACHE_HIT", "0.2"))
+PRICE_CACHE_MISS = float(os.getenv("DEEPSEEK_PRICE_CACHE_MISS", "2"))
+PRICE_OUTPUT = float(os.getenv("DEEPSEEK_PRICE_OUTPUT", "3"))
+LEDGER_RETENTION_DAYS = int(os.getenv("LEDGER_RETENTION_DAYS", "30"))
+
+SCRAPER_ROOT = Path(__file__).resolve().parents[1]
+LEDGER_PATH = SCRAPER_ROOT / "data" / "ai_usage_ledger.json"
+
+FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cache_hit_tokens", "cache_miss_tokens",
+          "total_tokens", "cost", "posts")
+
+
+class BudgetExhausted(Exception):
+    """今日预算已用完，不再调用 DeepSeek"""
+
+    def __init__(self, source, reason):
+        super().__init__(f"[{source}] 今日 AI 预算已用完: {reason}")
+        self.source = source
+        self.reason = reason
+
+
+def daily_token_budget(source):
+    value = os.getenv(f"AI_DAILY_TOKEN_BUDGET_{source.upper()}", os.getenv("AI_DAILY_TOKEN_BUDGET"))
+    return int(value) if value not in (None, "") else 300000
+
+
+def usage_cost(usage):
+    """一次调用的费用（元）；没有返回缓存字段时 prompt token 全部按未命中计价"""
+    prompt = int(usage.get("prompt_tokens") or 0)
+    hit = int(usage.get("prompt_cache_hit_tokens") or 0)
+    miss = int(usage.get("prompt_cache_miss_tokens", prompt - hit) or 0)
+    output = int(usage.get("completion_tokens") or 0)
+    return (hit * PRICE_CACHE_HIT + miss * PRICE_CACHE_MISS + output * PRICE_OUTPUT) / 1_000_000
+
+
+def _entry(usage):
+    prompt = int(usage.get("prompt_tokens") or 0)
+    hit = int(usage.get("prompt_cache_hit_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or 0)
+    return {
+        "calls": 1,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "cache_hit_tokens": hit,
+        "cache_miss_tokens": int(usage.get("prompt_cache_miss_tokens", prompt - hit) or 0),
+        "total_tokens": int(usage.get("total_tokens") or prompt + completion),
+        "cost": usage_cost(usage),
+    }
+
+
+def _add(totals, delta):
+    for key, value in delta.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+def _format_cost(cost):
+    return f"¥{cost:.4f}" if cost < 1 else f"¥{cost:.2f}"
+
+
+class CostLedger:
+    """进程内共享的 token / 费用账本，每日合计持久化到本地 JSON 文件"""
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._run = {}
+        self._days = None
+        self._persistent = True
+
+    def _today(self):
+        return datetime.now().strftime("%Y-%m-%d")
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ 读取 AI 用量账本失败，从空账本开始: {e}")
+            return {}
+
+    def _loaded(self):
+        if self._days is None:
+            self._days = self._read()
+        return self._days
+
+    def _persist(self, day, source, delta):
+        """重新读取文件后加上本次增量再写回（同一天分开运行的数据源不会互相覆盖）"""
+        days = self._read()
+        _add(days.setdefault(day, {}).setdefault(source, {}), delta)
+        cutoff = (datetime.now() - timedelta(days=LEDGER_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        days = {key: value for key, value in days.items() if key >= cutoff}
+        if not self._persistent:
+            return days
+        try:
+            os.makedirs(self.path.parent, exist_ok=True)
+            temp_path = self.path.with_suffix(".tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(days, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ 写入 AI 用量账本失败，本次运行只在内存中记账: {e}")
+            self._persistent = False
+        return days
+
+    def _apply(self, source, delta):
+        with self._lock:
+            day = self._today()
+            _add(self._run.setdefault(source, {}), delta)
+            if self._persistent:
+                self._days = self._persist(day, source, delta)
+            else:
+                _add(self._loaded().setdefault(day, {}).setdefault(source, {}), delta)
+
+    def record(self, source, usage):
+        """记录一次调用的 usage"""
+        if usage:
+            self._apply(source, _entry(usage))
+
+    def record_posts(self, source, count):
+        """记录本次处理的帖子数（用于单篇成本）"""
+        if count:
+            self._apply(source, {"posts": int(count)})
+
+    def today(self, source=None):
+        """今日合计（source 为 None 时是所有数据源之和）"""
+        with self._lock:
+            day = self._loaded().get(self._today(), {})
+            if source is not None:
+                return dict(day.get(source, {}))
+            totals = {}
+            for entry in day.values():
+                _add(totals, entry)
+            return totals
+
+    def remaining_tokens(self, source):
+        """今日剩余可用 token：数据源 token 预算与全局费用预算（按今日平均单价折算）中较小者"""
+        remaining = math.inf
+        token_budget = daily_token_budget(source)
+        if token_budget:
+            remaining = token_budget - self.today(source).get("total_tokens", 0)
+        if AI_DAILY_COST_BUDGET:
+            totals = self.today()
+            spent_tokens = totals.get("total_tokens", 0)
+            # 还没有调用时按未命中输入和输出价格的均值估算
+            price = (totals.get("cost", 0) / spent_tokens if spent_tokens
+                     else (PRICE_CACHE_MISS + PRICE_OUTPUT) / 2 / 1_000_000)
+            remaining = min(remaining, (AI_DAILY_COST_BUDGET - totals.get("cost", 0)) / price)
+        return max(0, remaining)
+
+    def check(self, source):
+        """调用前检查今日预算，已用完时抛出 BudgetExhausted"""
+        token_budget = daily_token_budget(source)
+        if token_budget and self.today(source).get("total_tokens", 0) >= token_budget:
+            raise BudgetExhausted(source, f"token 预算 {token_budget}")
+        if AI_DAILY_COST_BUDGET and self.today().get("cost", 0) >= AI_DAILY_COST_BUDGET:
+            raise BudgetExhausted(source, f"费用预算 {_format_cost(AI_DAILY_COST_BUDGET)}")
+
+    def summary(self, source):
+        """本次运行与今日累计的用量，以及每篇帖子的平均成本"""
+        with self._lock:
+            run = dict(self._run.get(source, {}))
+        if not run.get("calls"):
+            return f"[{source}] AI 用量: 无调用"
+        text = (f"[{source}] AI 用量: {run['calls']} 次调用，{run['total_tokens']} tokens"
+                f"（输入 {run['prompt_tokens']}，其中缓存命中 {run['cache_hit_tokens']}；输出 {run['completion_tokens']}），"
+                f"{_format_cost(run['cost'])}")
+        if run.get("posts"):
+            text += (f"；每篇 {run['total_tokens'] / run['posts']:.0f} tokens / "
+                     f"{_format_cost(run['cost'] / run['posts'])}（{run['posts']} 篇）")
+        today = self.today(source)
+        token_budget = daily_token_budget(source)
+        text += f"；今日累计 {today.get('total_tokens', 0)}{f'/{token_budget}' if token_budget else ''} tokens，" \
+                f"{_format_cost(today.get('cost', 0))}"
+        return text
+
+    def daily_summary(self):
+        """今日所有数据源的合计（统一调度结束时输出）"""
+        totals = self.today()
+        if not totals.get("calls"):
+            return "今日 AI 用量: 无调用"
+        budget = f"/{_format_cost(AI_DAILY_COST_BUDGET)}" if AI_DAILY_COST_BUDGET else ""
+        text = (f"今日 AI 用量: {totals['calls']} 次调用，{totals['total_tokens']} tokens，"
+                f"{_format_cost(totals['cost'])}{budget}")
+        if totals.get("posts"):
+            text += f"，平均每篇帖子 {_format_cost(totals['cost'] / totals['posts'])}"
+        return text
+
+
+ledger = CostLedger()
@@ -0,0 +1,101 @@
+"""
+共享数据库连接池
+同一进程内的所有爬虫共用一个 asyncpg 连接池，避免每次读写都重新握手；
+建立连接的超时不超过当前运行的最终截止时间（common.deadline）；
+关闭连接池之前先执行 on_close() 注册的收尾协程（common.spool 在此把本地队列最后写一次）
+
+环境变量:
+- DATABASE_URL: PostgreSQL 数据库连接 URL（查询参数会被清理，asyncpg 不支持）
+- DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE: 连接池大小（默认 1 / 5）
+"""
+
+import asyncio
+import logging
+import os
+import ssl
+from urllib.parse import urlparse, parse_qs
+
+import asyncpg
+
+from common import deadline
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_CONNECT_TIMEOUT = 60
+
+_pool = None
+_pool_lock = None
+_close_hooks = []
+
+
+def clean_dsn(url):
+    """去掉 URL 中的查询参数（asyncpg 不支持 channel_binding 等参数）"""
+    if url and '?' in url:
+        return url.split('?')[0]
+    return url
+
+
+def create_ssl_context(url):
+    """
+    Neon 需要 SSL 连接；显式声明 sslmode=disable 时（本地数据库）不使用 SSL
+    """
+    query = parse_qs(urlparse(url).query) if url else {}
+    if query.get('sslmode', [''])[0] == 'disable':
+        return None
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+async def get_pool():
+    """获取（必要时创建）进程级共享连接池"""
+    global _pool, _pool_lock
+    if _pool is not None:
+        return _pool
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            raw_url = os.getenv("DATABASE_URL")
+            if not raw_url:
+                raise RuntimeError("未找到 DATABASE_URL 环境变量")
+            _pool = await asyncpg.create_pool(
+                dsn=clean_dsn(raw_url),
+                ssl=create_ssl_context(raw_url),
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                timeout=deadline.current().timeout(DB_CONNECT_TIMEOUT, final=True, stage="数据库连接"),
+            )
+            logger.info(f"✓ 数据库连接池已创建 (size {DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE})")
+    return _pool
+
+
+def on_close(hook):
+    """注册关闭连接池之前执行的协程函数（重复注册只执行一次）"""
+    if hook not in _close_hooks:
+        _close_hooks.append(hook)
+
+
+async def close_pool():
+    """执行收尾协程后关闭共享连接池（进程退出前调用）"""
+    global _pool
+    for hook in list(_close_hooks):
+        try:
+            await hook()
+        except Exception as e:
+            logger.warning(f"⚠️ 关闭连接池前的收尾操作失败: {e}")
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+        logger.info("数据库连接池已关闭")
+
+
+async def run_and_close(coro):
+    """独立运行脚本时使用：执行主协程，结束后关闭连接池"""
+    try:
+        return await coro
+    finally:
+        await close_pool()
@@ -0,0 +1,155 @@
+"""
+运行截止时间（deadline）与剩余时间预算
+各阶段原来各自写死超时（Cloudflare 挑战 90 秒、page.goto 60 / 120 秒、DeepSeek 60–90 秒、
+数据库连接 60 秒），重试装饰器还会把整个抓取再乘以 3，一次定时运行没有确定的结束时间，
+可能与下一次运行重叠。这里给每次运行一个截止时间，所有阶段从同一个对象读取剩余时间：
+
+- 超时: timeout(默认值) 取默认值与剩余时间中较小者，剩余时间不足以完成一次调用时抛出 DeadlineExceeded
+- 重试: can_retry(等待时间, 上次耗时) 判断剩余时间是否还够再试一次，不够就不再重试
+- 降级: 剩余时间少于 RUN_SHED_RESERVE 时 should_shed() 为真，各数据源放弃低优先级工作
+  （尾部帖子的 AI 分析、详情页 / 评论抓取、评论展开），shed() 记录放弃的数量
+- 保存: 截止前留出 RUN_SAVE_RESERVE 秒给入库和报告，timeout(..., final=True) 按最终截止时间计算，
+  已经得到的部分结果总能保存
+
+截止时间通过 contextvars 传递：start() 在当前 asyncio 任务中设置，current() 在任意阶段读取，
+派生的任务和 asyncio.to_thread 自动继承；run_in_executor 不复制上下文，
+提交到自建线程池时使用 contextvars.copy_context().run（common.deepseek.run_in_thread 已处理）。
+统一调度时 orchestrator 设置整个调度的截止时间，各数据源在其内部再按 RUN_TIME_BUDGET_<SOURCE> 收窄。
+
+环境变量:
+- RUN_TIME_BUDGET: 一次运行的总时长（秒，默认 0 表示不限）；统一调度时为整个调度的时间片
+- RUN_TIME_BUDGET_<SOURCE>: 单个数据源的时长（如 RUN_TIME_BUDGET_HEYBOX=900），不超过调度的截止时间
+- RUN_SAVE_RESERVE: 截止前留给保存结果的秒数（默认 60）
+- RUN_SHED_RESERVE: 剩余时间少于该秒数时放弃低优先级工作（默认 180）
+"""
+
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RUN_TIME_BUDGET = float(os.getenv("RUN_TIME_BUDGET", "0"))
+RUN_SAVE_RESERVE = float(os.getenv("RUN_SAVE_RESERVE", "60"))
+RUN_SHED_RESERVE = float(os.getenv("RUN_SHED_RESERVE", "180"))
+
+# 剩余时间少于该秒数时不再发起新的网络调用
+MIN_TIMEOUT = 3.0
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """剩余时间不足以完成本次调用"""
+
+    def __init__(self, name, stage=""):
+        super().__init__(f"[{name}] 已接近截止时间{f'，跳过{stage}' if stage else ''}")
+        self.name = name
+        self.stage = stage
+
+
+def source_budget(name):
+    """数据源的时长配置（秒），没有配置时为 None"""
+    value = os.getenv(f"RUN_TIME_BUDGET_{name.upper()}")
+    return float(value) if value not in (None, "") else None
+
+
+class Deadline:
+    """一次运行的截止时间（end 为 time.monotonic() 时刻，无限制时为 inf）"""
+
+    def __init__(self, name, end=math.inf, reserve=RUN_SAVE_RESERVE, shed_reserve=RUN_SHED_RESERVE):
+        self.name = name
+        self.started = time.monotonic()
+        self.end = end
+        self.reserve = reserve
+        self.shed_reserve = shed_reserve
+        self._lock = threading.Lock()
+        self._shed = {}
+
+    @property
+    def limited(self):
+        return self.end != math.inf
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self, final=False):
+        """剩余的工作时间（秒）；final=True 时不扣除保存结果的预留时间"""
+        if not self.limited:
+            return math.inf
+        return self.end - time.monotonic() - (0 if final else self.reserve)
+
+    def expired(self, final=False):
+        return self.remaining(final) <= 0
+
+    def timeout(self, default, floor=MIN_TIMEOUT, final=False, stage=""):
+        """
+        按剩余时间收紧一次调用的超时（秒）
+
+        Raises:
+            DeadlineExceeded: 剩余时间少于 floor，不值得再发起调用
+        """
+        remaining = self.remaining(final)
+        if remaining < floor:
+            raise DeadlineExceeded(self.name, stage)
+        return min(default, remaining)
+
+    def can_retry(self, delay, attempt_seconds=0.0, final=False):
+        """等待 delay 秒后再试一次（按上次耗时估算）是否还来得及；保存阶段使用 final=True"""
+        return self.remaining(final) > delay + max(attempt_seconds, MIN_TIMEOUT)
+
+    def should_shed(self):
+        """剩余时间已进入降级区间，应放弃低优先级工作"""
+        return self.remaining() < self.shed_reserve
+
+    def shed(self, stage, count=1):
+        """记录放弃的低优先级工作（每个阶段第一次放弃时记录日志，合计见 summary()）"""
+        if count <= 0:
+            return
+        with self._lock:
+            first = stage not in self._shed
+            self._shed[stage] = self._shed.get(stage, 0) + count
+        if first:
+            logger.info(f"⏱️ [{self.name}] 剩余 {max(0, self.remaining()):.0f}s，开始放弃{stage}")
+
+    def summary(self):
+        shed = "，".join(f"{stage} {count}" for stage, count in self._shed.items())
+        if not self.limited:
+            return f"[{self.name}] 时间预算: 不限，用时 {self.elapsed():.0f}s"
+        return (f"[{self.name}] 时间预算: 用时 {self.elapsed():.0f}s，"
+                f"距截止还有 {max(0, self.remaining(final=True)):.0f}s"
+                f"{f'；放弃 {shed}' if shed else '；未放弃任何工作'}")
+
+
+UNLIMITED = Deadline("unlimited")
+
+
+def current():
+    """当前上下文的截止时间（没有设置时不限）"""
+    return _current.get() or UNLIMITED
+
+
+def start(name, budget=None):
+    """
+    为当前任务设置截止时间并返回
+
+    budget 为 None 时读取 RUN_TIME_BUDGET_<NAME>；没有上层截止时间时再读取 RUN_TIME_BUDGET。
+    有上层截止时间（统一调度）时，结束时间不晚于上层。
+    """
+    parent = _current.get()
+    if budget is None:
+        budget = source_budget(name)
+        if budget is None and parent is None:
+            budget = RUN_TIME_BUDGET
+    end = time.monotonic() + budget if budget else math.inf
+    if parent is not None:
+        end = min(end, parent.end)
+    deadline = Deadline(name, end)
+    _current.set(deadline)
+    if deadline.limited:
+        logger.info(f"⏱️ [{name}] 时间预算 {deadline.remaining(final=True):.0f}s"
+                    f"（保存预留 {deadline.reserve:.0f}s，剩余 {deadline.shed_reserve:.0f}s 时开始降级）")
+    return deadline
@@ -0,0 +1,232 @@
+"""
+DeepSeek 调用公共模块
+所有数据源共享同一个速率预算：全局自适应并发窗口（common.adaptive_limit）+ 请求最小间隔，
+可另外按数据源限制并发。并发窗口从 DEEPSEEK_INITIAL_CONCURRENCY 开始，
+请求成功且延迟正常时逐步扩大，遇到 429 / 5xx / 超时或同类请求的延迟明显升高时减半，
+不需要手动调整请求间隔或并发数；当前窗口见 budget.window.summary()。
+
+调用方可以在线程中或同步代码中直接调用 chat_completion，限流基于 threading 原语，
+在同一进程内的所有线程间生效。异步代码使用 run_in_thread()：等待并发窗口的线程留在
+DeepSeek 专用线程池中，不占用事件循环的默认线程池（其他数据源的 to_thread 调用不受影响）。
+请求超时按当前运行的剩余时间收紧（common.deadline），接近截止时间时不再发出请求；
+low_priority=True 的请求（逐帖分析）在进入降级区间后放弃，名额留给汇总等收尾工作。
+
+每次调用按数据源记录接口返回的 usage，包括前缀缓存的命中 / 未命中 token 数
+（prompt_cache_hit_tokens / prompt_cache_miss_tokens），见 cache_stats；
+同时计入 common.cost_ledger 的 token / 费用账本，今日预算用完后不再发出请求。
+
+环境变量:
+- DEEPSEEK_API_KEY: API 密钥
+- DEEPSEEK_INITIAL_CONCURRENCY: 全局并发窗口的初始值（默认 4）
+- DEEPSEEK_MAX_CONCURRENCY: 全局并发窗口的上限（默认 16）
+- DEEPSEEK_MIN_INTERVAL: 相邻两次请求的最小间隔秒数（默认 0.5）
+- DEEPSEEK_CONCURRENCY_<SOURCE>: 单个数据源的最大并发（如 DEEPSEEK_CONCURRENCY_REDDIT=3，默认只受全局窗口限制）
+"""
+
+import asyncio
+import contextvars
+import functools
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+
+from common import adaptive_limit, cost_ledger, deadline
+
+logger = logging.getLogger(__name__)
+
+DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+DEEPSEEK_MODEL = "deepseek-chat"
+
+INITIAL_CONCURRENCY = int(os.getenv("DEEPSEEK_INITIAL_CONCURRENCY", "4"))
+MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "16"))
+MIN_INTERVAL = float(os.getenv("DEEPSEEK_MIN_INTERVAL", "0.5"))
+
+
+class DeepSeekAPIError(Exception):
+    """DeepSeek 返回非 200 状态码"""
+
+    def __init__(self, status_code, text=""):
+        super().__init__(f"DeepSeek API error: {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+
+def is_overload(error):
+    """过载信号：限流、服务端错误、超时和连接错误（窗口减半）"""
+    if isinstance(error, DeepSeekAPIError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+
+class RateBudget:
+    """进程级共享的 DeepSeek 速率预算"""
+
+    def __init__(self, initial_concurrency=INITIAL_CONCURRENCY, max_concurrency=MAX_CONCURRENCY,
+                 min_interval=MIN_INTERVAL, source_limits=None):
+        self.window = adaptive_limit.AdaptiveLimit(
+            "deepseek", initial_concurrency, maximum=max_concurrency, is_overload=is_overload,
+        )
+        self._min_interval = min_interval
+        self._source_limits = dict(source_limits or {})
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._sources = {}
+
+    def _source_semaphore(self, source):
+        with self._lock:
+            if source not in self._sources:
+                limit = os.getenv(f"DEEPSEEK_CONCURRENCY_{source.upper()}", self._source_limits.get(source))
+                self._sources[source] = threading.BoundedSemaphore(max(1, int(limit))) if limit else None
+            return self._sources[source]
+
+    @contextmanager
+    def slot(self, source):
+        """
+        占用一个请求名额：先过数据源并发（如有配置），再过全局自适应窗口，最后保证请求间隔
+
+        yield adaptive_limit.Ticket：调用方设置 ticket.kind（调用类型）后，延迟只和同类请求比较
+        """
+        semaphore = self._source_semaphore(source)
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            with self.window.slot() as ticket:
+                with self._lock:
+                    now = time.monotonic()
+                    wait = self._next_slot - now
+                    self._next_slot = max(now, self._next_slot) + self._min_interval
+                if wait > 0:
+                    time.sleep(wait)
+                    ticket.started = time.monotonic()
+                yield ticket
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+
+budget = RateBudget()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+async def run_in_thread(fn, *args, **kwargs):
+    """在 DeepSeek 专用线程池（线程数为并发窗口上限）中运行同步调用（复制当前上下文，截止时间随之传递）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="deepseek")
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+class CacheStats:
+    """按数据源统计 prompt token 的前缀缓存命中情况"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}
+
+    def record(self, source, usage):
+        if not usage:
+            return
+        with self._lock:
+            stats = self._sources.setdefault(source, {"calls": 0, "hit": 0, "miss": 0})
+            stats["calls"] += 1
+            stats["hit"] += int(usage.get("prompt_cache_hit_tokens") or 0)
+            # 没有返回缓存字段时，全部 prompt token 计为未命中
+            stats["miss"] += int(usage.get("prompt_cache_miss_tokens",
+                                           usage.get("prompt_tokens", 0)) or 0)
+
+    def hit_rate(self, source):
+        stats = self._sources.get(source)
+        if not stats or not stats["hit"] + stats["miss"]:
+            return None
+        return stats["hit"] / (stats["hit"] + stats["miss"])
+
+    def summary(self, source):
+        stats = self._sources.get(source)
+        if not stats:
+            return f"[{source}] 前缀缓存: 无调用"
+        rate = self.hit_rate(source)
+        rate_text = f"{rate * 100:.0f}%" if rate is not None else "N/A"
+        return (f"[{source}] 前缀缓存命中 {rate_text}（{stats['calls']} 次调用，"
+                f"命中 {stats['hit']} / 未命中 {stats['miss']} prompt tokens）")
+
+
+cache_stats = CacheStats()
+
+
+def _call_kind(messages, source):
+    first = messages[0] if messages else {}
+    if first.get("role") == "system":
+        return hashlib.sha1(first.get("content", "").encode("utf-8")).hexdigest()[:8]
+    return source
+
+
+def chat_completion(messages, source, max_tokens=2000, temperature=0.3,
+                    timeout=60, proxies=None, api_key=None, low_priority=False, kind=None):
+    """
+    调用 DeepSeek chat completions 接口
+
+    Args:
+        messages: OpenAI 格式的消息列表
+        source: 数据源名称（linuxdo / reddit / heybox），用于按来源限流
+        low_priority: 低优先级请求，运行接近截止时间（deadline.should_shed()）时放弃
+        kind: 调用类型，并发窗口按类型比较延迟；默认按系统消息（common.prompts 的静态前缀，
+            每种调用一份）区分，没有系统消息时按数据源
+        proxies: requests 代理配置（可选）
+
+    Returns:
+        dict: 接口返回的 JSON
+
+    Raises:
+        DeepSeekAPIError: 非 200 状态码
+        cost_ledger.BudgetExhausted: 今日预算已用完（未发出请求）
+        deadline.DeadlineExceeded: 剩余时间不足，或低优先级请求已被放弃（未发出请求）
+        requests.exceptions.RequestException: 网络错误或超时
+    """
+    cost_ledger.ledger.check(source)
+    with budget.slot(source) as ticket:
+        ticket.kind = kind or _call_kind(messages, source)
+        # 等待名额之后再按剩余时间计算超时；排队到降级区间的低优先级请求直接放弃
+        run_deadline = deadline.current()
+        if low_priority and run_deadline.should_shed():
+            run_deadline.shed("帖子AI分析")
+            raise deadline.DeadlineExceeded(run_deadline.name, "帖子AI分析")
+        timeout = run_deadline.timeout(timeout, stage="AI请求")
+        response = requests.post(
+            DEEPSEEK_API_URL,
+            headers={
+                "Authorization": f"Bearer {api_key or os.getenv('DEEPSEEK_API_KEY')}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": DEEPSEEK_MODEL,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+            },
+            proxies=proxies,
+            timeout=timeout,
+        )
+        # 非 200 在名额内抛出，429 / 5xx 作为过载信号收缩并发窗口
+        if response.status_code != 200:
+            raise DeepSeekAPIError(response.status_code, response.text)
+        data = response.json()
+
+    cache_stats.record(source, data.get("usage"))
+    cost_ledger.ledger.record(source, data.get("usage"))
+    return data
+
+
+def extract_content(data):
+    """从接口返回中取出第一条回复内容"""
+    return data.get("choices", [{}])[0].get("message", {}).get("content", "")
@@ -0,0 +1,79 @@
+"""
+带利用率统计的执行器
+把阻塞调用（浏览器驱动、HTML 解析）从事件循环中移出，同时记录每个执行器的忙碌程度：
+
+- TrackedExecutor.threads(name, 1): 专用线程，串行执行浏览器操作（DrissionPage 不支持并发调用）
+- TrackedExecutor.threads(name, 1) 也用于抓取过程中的 HTML 解析（逐页解析，页面数不多）
+- TrackedExecutor.processes(name): 进程池，只用于离线批量解析（common.html_extract 命令行）；
+  爬虫进程中有日志、写入队列等后台线程，fork 出的子进程可能继承被占用的锁，不在其中创建进程池
+
+summary() 输出调用次数、平均排队时间、平均执行时间和利用率（执行时间 / (墙钟时间 × 工作者数)），
+利用率接近 100% 说明该执行器是瓶颈，很低则说明流水线在等别的阶段。
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_call(fn, args, kwargs):
+    """在工作线程/进程中执行，返回 (开始时间, 执行时长, 结果)"""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time() - started, result
+
+
+class TrackedExecutor:
+    """线程池 / 进程池的异步包装，统计排队与执行时间"""
+
+    def __init__(self, executor, name, workers):
+        self._executor = executor
+        self.name = name
+        self.workers = workers
+        self.calls = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._created = time.time()
+
+    @classmethod
+    def threads(cls, name, workers=1):
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        return cls(executor, name, workers)
+
+    @classmethod
+    def processes(cls, name, workers=None):
+        workers = workers or os.cpu_count() or 1
+        return cls(ProcessPoolExecutor(max_workers=workers), name, workers)
+
+    async def run(self, fn, *args, **kwargs):
+        """在执行器中运行 fn(*args, **kwargs)；进程池要求 fn 和参数可 pickle"""
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        started, duration, result = await loop.run_in_executor(
+            self._executor, functools.partial(_timed_call, fn, args, kwargs)
+        )
+        self.calls += 1
+        self.busy_seconds += duration
+        self.wait_seconds += max(0.0, started - submitted)
+        return result
+
+    def utilization(self):
+        elapsed = time.time() - self._created
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, self.busy_seconds / (elapsed * self.workers))
+
+    def summary(self):
+        if not self.calls:
+            return f"[{self.name}] 未执行任务"
+        return (f"[{self.name}] {self.calls} 次调用，平均排队 {self.wait_seconds / self.calls * 1000:.0f} ms，"
+                f"平均执行 {self.busy_seconds / self.calls * 1000:.0f} ms，"
+                f"利用率 {self.utilization() * 100:.0f}%（{self.workers} 个工作者）")
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,200 @@
+"""
+浏览器请求过滤配置（fetch profile）
+详情页只读取正文文本和评论元数据，图片、头像、字体、视频和统计脚本都不需要下载。
+
+- Playwright：apply_playwright(context, profile) 通过 context.route 按资源类型和域名拦截
+- DrissionPage：apply_cdp(page, profile) 通过 CDP Network.setBlockedURLs 按 URL 模式拦截
+  （CDP 只支持 URL 通配符，资源类型换算为文件扩展名）
+- 白名单域名（如 Cloudflare 挑战脚本）永远放行
+- FetchStats 统计每页传输字节数和页面就绪时间，关闭过滤（FETCH_BLOCKING=false）运行一次即可对比前后效果
+
+环境变量:
+- FETCH_BLOCKING: 是否启用请求过滤（默认 true）
+- FETCH_BLOCK_TYPES_<SOURCE>: 拦截的资源类型，逗号分隔（如 image,media,font）
+- FETCH_BLOCK_HOSTS_<SOURCE>: 额外拦截的第三方域名，逗号分隔
+- FETCH_ALLOW_HOSTS_<SOURCE>: 额外放行的域名，逗号分隔
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+FETCH_BLOCKING = os.getenv("FETCH_BLOCKING", "true").lower() == "true"
+
+# 统计 / 广告域名，所有数据源都不需要
+ANALYTICS_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "clarity.ms",
+    "hm.baidu.com",
+    "cnzz.com",
+)
+
+# CDP 模式下资源类型对应的 URL 模式
+TYPE_URL_PATTERNS = {
+    "image": ("*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*"),
+    "media": ("*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*", "*.ogg*"),
+    "font": ("*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*"),
+    "stylesheet": ("*.css*",),
+}
+
+# 每页统计：导航本身 + 所有子资源的传输字节数，DOMContentLoaded 耗时
+# 跨域且未设置 Timing-Allow-Origin 的资源 transferSize 为 0，数值偏小但前后可比
+PAGE_STATS_JS = """(() => {
+    const nav = performance.getEntriesByType('navigation')[0];
+    const resources = performance.getEntriesByType('resource');
+    let bytes = nav ? nav.transferSize : 0;
+    for (const r of resources) bytes += r.transferSize || 0;
+    return {
+        bytes: bytes,
+        resources: resources.length,
+        ready_ms: nav ? Math.round(nav.domContentLoadedEventEnd) : 0
+    };
+})()"""
+
+
+def _env_list(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return frozenset(default)
+    return frozenset(item.strip() for item in value.split(",") if item.strip())
+
+
+def _host_matches(host, hosts):
+    return any(host == h or host.endswith("." + h) for h in hosts)
+
+
+@dataclass(frozen=True)
+class FetchProfile:
+    """一个数据源的请求过滤规则"""
+    source: str
+    blocked_types: FrozenSet[str] = frozenset()
+    blocked_hosts: FrozenSet[str] = frozenset()
+    allowed_hosts: FrozenSet[str] = frozenset()
+    enabled: bool = True
+
+    def should_block(self, url, resource_type):
+        """Playwright 路由判断：白名单优先，其次第三方域名，最后资源类型"""
+        if not self.enabled:
+            return False
+        host = urlparse(url).hostname or ""
+        if _host_matches(host, self.allowed_hosts):
+            return False
+        if _host_matches(host, self.blocked_hosts):
+            return True
+        return resource_type in self.blocked_types
+
+    def blocked_url_patterns(self) -> List[str]:
+        """CDP Network.setBlockedURLs 使用的 URL 模式（白名单域名不加入拦截）"""
+        if not self.enabled:
+            return []
+        patterns = []
+        for resource_type in sorted(self.blocked_types):
+            patterns.extend(TYPE_URL_PATTERNS.get(resource_type, ()))
+        for host in sorted(self.blocked_hosts - self.allowed_hosts):
+            patterns.append(f"*://{host}/*")
+            patterns.append(f"*.{host}/*")
+        return patterns
+
+
+# 各数据源默认规则
+DEFAULT_PROFILES = {
+    # 详情页只解析 .cooked 文本和评论元数据；Cloudflare 挑战脚本必须放行
+    "linuxdo": {
+        "blocked_types": ("image", "media", "font"),
+        "blocked_hosts": ANALYTICS_HOSTS,
+        "allowed_hosts": ("challenges.cloudflare.com",),
+    },
+    # 小黑盒是前端渲染，脚本和样式都要保留（评论定位依赖 DOM 结构）
+    "heybox": {
+        "blocked_types": ("image", "media", "font"),
+        "blocked_hosts": ANALYTICS_HOSTS,
+    },
+}
+
+
+def get_profile(source) -> FetchProfile:
+    """读取数据源的过滤规则（环境变量覆盖默认值）"""
+    defaults = DEFAULT_PROFILES.get(source, {})
+    suffix = source.upper()
+    return FetchProfile(
+        source=source,
+        blocked_types=_env_list(f"FETCH_BLOCK_TYPES_{suffix}", defaults.get("blocked_types", ())),
+        blocked_hosts=_env_list(f"FETCH_BLOCK_HOSTS_{suffix}", defaults.get("blocked_hosts", ())),
+        allowed_hosts=_env_list(f"FETCH_ALLOW_HOSTS_{suffix}", defaults.get("allowed_hosts", ())),
+        enabled=FETCH_BLOCKING,
+    )
+
+
+@dataclass
+class FetchStats:
+    """累计每页传输字节数、页面就绪时间和被拦截的请求数"""
+    source: str
+    enabled: bool = True
+    pages: int = 0
+    bytes: int = 0
+    ready_ms: int = 0
+    blocked_requests: int = 0
+    blocked_by_type: Dict[str, int] = field(default_factory=dict)
+
+    def record_block(self, resource_type):
+        self.blocked_requests += 1
+        self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+
+    def record_page(self, page_stats):
+        """记录 PAGE_STATS_JS 的返回值"""
+        if not page_stats:
+            return
+        self.pages += 1
+        self.bytes += int(page_stats.get("bytes") or 0)
+        self.ready_ms += int(page_stats.get("ready_ms") or 0)
+
+    def summary(self):
+        if not self.pages:
+            return f"[{self.source}] 请求过滤{'开启' if self.enabled else '关闭'}，未记录页面"
+        text = (f"[{self.source}] 请求过滤{'开启' if self.enabled else '关闭'}: {self.pages} 页，"
+                f"平均 {self.bytes / self.pages / 1024:.0f} KB/页，"
+                f"平均就绪 {self.ready_ms / self.pages:.0f} ms")
+        if self.blocked_requests:
+            text += f"，拦截 {self.blocked_requests} 个请求 {self.blocked_by_type}"
+        return text
+
+
+async def apply_playwright(context, profile: FetchProfile, stats: FetchStats = None):
+    """在 Playwright BrowserContext 上注册请求过滤（对之后创建的所有页面生效）"""
+    if not profile.enabled:
+        logger.info(f"[{profile.source}] 请求过滤已关闭")
+        return
+
+    async def handle(route):
+        request = route.request
+        if profile.should_block(request.url, request.resource_type):
+            if stats is not None:
+                stats.record_block(request.resource_type)
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle)
+    logger.info(f"✓ [{profile.source}] 请求过滤已启用: 类型 {sorted(profile.blocked_types)}，"
+                f"域名 {len(profile.blocked_hosts)} 个，白名单 {sorted(profile.allowed_hosts)}")
+
+
+def apply_cdp(page, profile: FetchProfile):
+    """在 DrissionPage 标签页上通过 CDP 设置拦截的 URL 模式（每个新标签页都需要调用）"""
+    patterns = profile.blocked_url_patterns()
+    if not patterns:
+        logger.info(f"[{profile.source}] 请求过滤已关闭")
+        return
+    try:
+        page.run_cdp("Network.enable")
+        page.run_cdp("Network.setBlockedURLs", urls=patterns)
+        logger.info(f"✓ [{profile.source}] 请求过滤已启用: {len(patterns)} 个 URL 模式")
+    except Exception as e:
+        logger.warning(f"⚠️ [{profile.source}] 设置请求过滤失败，继续无过滤抓取: {e}")
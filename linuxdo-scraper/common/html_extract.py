@@ -0,0 +1,303 @@
+"""
+HTML 解析（纯函数，可在进程池中执行）
+BeautifulSoup 解析是 CPU 密集操作，放在事件循环里会阻塞其他数据源的数据库写入和 AI 调用。
+
+- parse_linuxdo_topic: linux.do 帖子详情页（楼主正文 + 评论）
+- parse_heybox_comments: 小黑盒详情页评论（heybox_playwright_scraper 抓取时在线程中调用，与批量重新提取共用同一份规则）
+- ExtractionService: 批量解析服务，原始 HTML 或抓取存档文件按块分发到进程池，
+  按完成顺序流式返回紧凑的评论记录，用于对成千上万个存档页面重新提取
+
+命令行（在 linuxdo-scraper 目录下）:
+  python -m common.html_extract linuxdo data/captures/*.html.gz -o comments.jsonl
+  （调试存档见 common.capture，按 data/captures/index.jsonl 中的 url / reason 筛选文件）
+
+环境变量:
+- EXTRACT_WORKERS: 解析进程数（默认 CPU 核数）
+- EXTRACT_CHUNK_SIZE: 每个任务包含的页面数（默认 16）
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+from pathlib import Path
+from typing import AsyncIterator, Iterable, NamedTuple, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+from common.executors import TrackedExecutor
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+EXTRACT_CHUNK_SIZE = int(os.getenv("EXTRACT_CHUNK_SIZE", "16"))
+
+
+class CommentRecord(NamedTuple):
+    """紧凑的评论记录（跨进程传输开销小）"""
+    page_id: str
+    author: str
+    content: str
+    likes: int
+    time: str
+
+
+class PageExtract(NamedTuple):
+    """单个页面的解析结果"""
+    page_id: str
+    posts_found: int
+    main_content: str
+    comments: Tuple[CommentRecord, ...]
+    error: str = ""
+
+
+def _parse_likes(text):
+    return int("".join(filter(str.isdigit, text)) or "0")
+
+
+def parse_linuxdo_topic(html):
+    """
+    解析 linux.do 帖子详情页
+
+    Returns:
+        dict: posts_found（楼层数，0 表示页面结构异常）、fallback（是否使用 article 标签）、
+              main_content（楼主正文）、comments（[{author, content, likes, time}]）
+    """
+    soup = BeautifulSoup(html, "lxml")
+    posts_elements = soup.select(".topic-post")
+    fallback = False
+    if not posts_elements:
+        posts_elements = soup.select("article")
+        fallback = bool(posts_elements)
+
+    result = {
+        "posts_found": len(posts_elements),
+        "fallback": fallback,
+        "main_content": "",
+        "comments": [],
+    }
+    if not posts_elements:
+        return result
+
+    content_elem = posts_elements[0].select_one(".cooked")
+    if content_elem:
+        result["main_content"] = content_elem.get_text(strip=True)
+
+    for i, reply_elem in enumerate(posts_elements[1:], start=1):
+        try:
+            author_elem = reply_elem.select_one(".username")
+            author = author_elem.get_text(strip=True) if author_elem else ""
+
+            content_elem = reply_elem.select_one(".cooked")
+            content = content_elem.get_text(strip=True) if content_elem else ""
+
+            likes_elem = reply_elem.select_one(".likes")
+            likes = _parse_likes(likes_elem.get_text(strip=True)) if likes_elem else 0
+
+            time_elem = reply_elem.select_one(".post-date")
+            time_str = (time_elem.get("title") or "") if time_elem else ""
+
+            if content:
+                result["comments"].append({
+                    "author": author,
+                    "content": content,
+                    "likes": likes,
+                    "time": time_str,
+                })
+        except Exception as e:
+            logger.warning(f"      ⚠️ 提取评论{i}失败: {e}")
+            continue
+
+    return result
+
+
+# 小黑盒评论内容中需要排除的文本（时间、等级、回复按钮）
+HEYBOX_NOISE = ("小时前", "天前", "Lv.", "回复")
+
+
+def _heybox_comment_container(link):
+    """最近的 class 含 comment 的 div 祖先，没有时取链接的祖父元素"""
+    for parent in link.parents:
+        if parent.name == "div" and "comment" in " ".join(parent.get("class", [])):
+            return parent
+    if link.parent is not None:
+        return link.parent.parent
+    return None
+
+
+def parse_heybox_comments(html, limit=None):
+    """
+    解析小黑盒帖子详情页评论：通过用户主页链接反向定位评论容器，取最长的非噪声文本作为内容
+
+    Returns:
+        list: [{author, content, likes, time}]
+    """
+    soup = BeautifulSoup(html, "lxml")
+    comments = []
+    processed = set()
+    for link in soup.select('a[href*="/app/user/profile/"]'):
+        if limit and len(comments) >= limit:
+            break
+        container = _heybox_comment_container(link)
+        if container is None or id(container) in processed:
+            continue
+        processed.add(id(container))
+
+        author = re.sub(r"作者|Lv\.\d+", "", link.get_text().strip().split("\n")[0]).strip()
+
+        content = ""
+        for elem in container.find_all(["div", "p", "span"]):
+            text = elem.get_text().strip()
+            if len(text) > max(20, len(content)) and not any(noise in text for noise in HEYBOX_NOISE):
+                content = text[:200]
+
+        likes = 0
+        for button in container.find_all("button"):
+            text = button.get_text().strip()
+            if text.isdigit():
+                likes = int(text)
+                break
+
+        if author and len(content) > 10:
+            comments.append({
+                "author": author,
+                "content": content,
+                "likes": likes,
+                "time": "最近",
+            })
+    return comments
+
+
+def _read_capture(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _extract_page(kind, page_id, html):
+    if kind == "linuxdo":
+        parsed = parse_linuxdo_topic(html)
+        posts_found, main_content, comments = parsed["posts_found"], parsed["main_content"], parsed["comments"]
+    elif kind == "heybox":
+        comments = parse_heybox_comments(html)
+        posts_found, main_content = len(comments), ""
+    else:
+        raise ValueError(f"未知的页面类型: {kind}")
+    records = tuple(
+        CommentRecord(page_id, c["author"], c["content"], c["likes"], c["time"]) for c in comments
+    )
+    return PageExtract(page_id, posts_found, main_content, records)
+
+
+def extract_chunk(kind, items):
+    """
+    解析一批页面（在子进程中运行）
+
+    Args:
+        kind: linuxdo / heybox
+        items: [(page_id, html, path)]，html 为 None 时在子进程中读取 path，避免跨进程传输大文本
+    """
+    results = []
+    for page_id, html, path in items:
+        try:
+            if html is None:
+                html = _read_capture(path)
+            results.append(_extract_page(kind, page_id, html))
+        except Exception as e:
+            results.append(PageExtract(page_id, 0, "", (), str(e)))
+    return results
+
+
+class ExtractionService:
+    """进程池批量解析服务（进程数默认等于 CPU 核数）"""
+
+    def __init__(self, workers=EXTRACT_WORKERS, chunk_size=EXTRACT_CHUNK_SIZE):
+        self.chunk_size = max(1, chunk_size)
+        self.executor = TrackedExecutor.processes("html-extract", workers)
+
+    async def extract(self, kind, html, page_id=""):
+        """解析单个页面"""
+        results = await self.executor.run(extract_chunk, kind, [(page_id, html, None)])
+        return results[0]
+
+    async def stream(self, kind, items: Iterable[Tuple[str, Optional[str], Optional[str]]]) -> AsyncIterator[PageExtract]:
+        """
+        按块分发并按完成顺序返回解析结果；同时在途的块数限制为进程数的 2 倍，
+        数千个页面也不会一次性读入内存
+        """
+        max_in_flight = self.executor.workers * 2
+        pending = set()
+        chunk = []
+
+        async def drain(until):
+            nonlocal pending
+            while len(pending) > until:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for result in task.result():
+                        yield result
+
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                pending.add(asyncio.ensure_future(self.executor.run(extract_chunk, kind, chunk)))
+                chunk = []
+                async for result in drain(max_in_flight - 1):
+                    yield result
+        if chunk:
+            pending.add(asyncio.ensure_future(self.executor.run(extract_chunk, kind, chunk)))
+        async for result in drain(0):
+            yield result
+
+    def stream_html(self, kind, pages: Iterable[Tuple[str, str]]):
+        """pages: [(page_id, html)]"""
+        return self.stream(kind, ((page_id, html, None) for page_id, html in pages))
+
+    def stream_files(self, kind, paths: Iterable[str]):
+        """paths: 抓取存档文件（.html / .html.gz），page_id 为文件名"""
+        return self.stream(kind, ((Path(path).name, None, str(path)) for path in paths))
+
+    def summary(self):
+        return self.executor.summary()
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="批量从存档页面中提取评论")
+    parser.add_argument("kind", choices=["linuxdo", "heybox"], help="页面类型")
+    parser.add_argument("paths", nargs="+", help="存档 HTML 文件（支持 .gz）")
+    parser.add_argument("--output", "-o", help="输出 JSON Lines 文件（默认标准输出）")
+    parser.add_argument("--workers", "-w", type=int, default=EXTRACT_WORKERS, help="解析进程数")
+    parser.add_argument("--chunk-size", "-c", type=int, default=EXTRACT_CHUNK_SIZE, help="每个任务的页面数")
+    args = parser.parse_args()
+
+    service = ExtractionService(args.workers, args.chunk_size)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    pages = records = failed = 0
+    try:
+        async for result in service.stream_files(args.kind, args.paths):
+            pages += 1
+            if result.error:
+                failed += 1
+                logger.warning(f"⚠️ {result.page_id}: {result.error}")
+                continue
+            for record in result.comments:
+                out.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+                records += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        service.shutdown()
+    logger.info(f"✅ {pages} 个页面（失败 {failed} 个），{records} 条评论")
+    logger.info(f"⚙️ {service.summary()}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    asyncio.run(_main())
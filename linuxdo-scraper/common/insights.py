@@ -0,0 +1,267 @@
+"""
+今日热点洞察（分层 map-reduce 汇总）
+原来把所有帖子的完整分析 json.dumps 进一个提示词，长度随帖子数线性增长，
+几百篇时就会超出上下文窗口。这里分层汇总：
+
+- 摘要: 每篇帖子压缩成一条记录（标题、分类、价值、核心议题、关键信息、分析节选）
+- 分块: 按话题聚类和 post_type 分组、组内按价值排序，再按预估 token 装箱，每块不超过 INSIGHT_CHUNK_TOKENS
+- map: 各块并发调用 AI，提炼本块的主题、干货、资源和热点（部分洞察）
+- reduce: 部分洞察放得进一块时直接生成最终的 overview / highlights / conclusion；
+  放不下时先逐层合并，层数按对数增长，整体耗时基本不随帖子数增加
+
+整个汇总按预估 token 装入 INSIGHT_TOKEN_BUDGET：超出时先去掉分析节选，
+仍然超出则按价值从低到高舍弃帖子。
+
+环境变量:
+- INSIGHT_CHUNK_TOKENS: 每次 map / reduce 调用的输入 token 上限（默认 6000）
+- INSIGHT_TOKEN_BUDGET: 一次汇总的总 token 预算（默认 60000，0 表示不限）
+- INSIGHT_MAX_WORKERS: map 阶段的并发调用数（默认 4，同时受 DeepSeek 全局并发限制）
+
+汇总调用记在调用方数据源名下（成本账本、每日预算和分诊剩余额度都算上这部分），
+并发窗口按调用类型（提示词名称）与逐帖分析分开比较延迟。
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import llm_json, prompts
+from common.triage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+INSIGHT_CHUNK_TOKENS = int(os.getenv("INSIGHT_CHUNK_TOKENS", "6000"))
+INSIGHT_TOKEN_BUDGET = int(os.getenv("INSIGHT_TOKEN_BUDGET", "60000"))
+INSIGHT_MAX_WORKERS = int(os.getenv("INSIGHT_MAX_WORKERS", "4"))
+
+EXCERPT_CHARS = 200
+MAP_OUTPUT_TOKENS = 600
+FINAL_OUTPUT_TOKENS = 800
+PROMPT_OVERHEAD = 400
+VALUE_ORDER = {"高": 0, "中": 1, "低": 2}
+
+HIGHLIGHT_KEYS = ("tech_savvy", "resources_deals", "hot_topics")
+
+PARTIAL_PROMPT = prompts.StaticPrompt("insight-partial", """
+你是一名资深的论坛内容分析师。用户消息是今天论坛帖子的一部分，可能是逐帖摘要（JSON Lines），
+也可能是其他分析师对其他部分帖子提炼的部分洞察。请合并提炼这一部分的要点，供最终汇总使用。
+你的回复必须是一个有效的JSON对象，不要包含任何解释性文字或Markdown的```json ```标记。
+
+**请输出以下结构的JSON**：
+{
+  "themes": ["这一部分的主要讨论主题，1-5条，每条一句话"],
+  "tech_savvy": ["最硬核的技术干货，0-3条，注明来源帖子标题"],
+  "resources_deals": ["最值得关注的优惠或资源分享，0-3条，注明来源帖子标题"],
+  "hot_topics": ["引发最广泛讨论的话题，0-3条"],
+  "mood": "一句话概括这一部分的社区氛围"
+}
+""")
+
+FINAL_PROMPT = prompts.StaticPrompt("insight-final", """
+你是一名资深的论坛内容分析师。用户消息是今天论坛热门帖子的摘要，可能是逐帖摘要（JSON Lines），
+也可能是按分块提炼的部分洞察（themes / tech_savvy / resources_deals / hot_topics / mood）。
+请根据这些信息，生成一份高度浓缩的中文"今日热点洞察"报告，并严格以指定的JSON格式返回。
+你的回复必须是一个有效的JSON对象，不要包含任何解释性文字或Markdown的```json ```标记。
+
+**请输出以下结构的JSON**：
+{
+  "overview": "用一两句话总结今天社区的整体氛围和讨论焦点。",
+  "highlights": {
+    "tech_savvy": ["提炼1-3条最硬核的技术干货"],
+    "resources_deals": ["提炼1-3条最值得关注的优惠或资源分享"],
+    "hot_topics": ["提炼1-3个引发最广泛讨论的话题"]
+  },
+  "conclusion": "用一句话对今天的内容做个风趣或深刻的总结。"
+}
+""")
+
+
+def digest(post, excerpt=True):
+    """单篇帖子的压缩记录（JSON 单行）"""
+    analysis = post.get("analysis") or {}
+    record = {
+        "title": post.get("title", ""),
+        "type": analysis.get("post_type"),
+        "value": analysis.get("value_assessment"),
+        "core_issue": analysis.get("core_issue"),
+        "key_info": analysis.get("key_info") or [],
+    }
+    if post.get("cluster_id"):
+        record["topic"] = post.get("cluster_label")
+    if excerpt and analysis.get("detailed_analysis"):
+        record["excerpt"] = " ".join(analysis["detailed_analysis"].split())[:EXCERPT_CHARS]
+    return json.dumps(record, ensure_ascii=False)
+
+
+def pack(lines, limit):
+    """按预估 token 把行装箱（保持顺序），单行超过上限时独占一块"""
+    chunks, current, size = [], [], 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if current and size + tokens > limit:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def plan_cost(chunk_count, input_tokens, chunk_tokens=INSIGHT_CHUNK_TOKENS):
+    """预估汇总的总 token：所有输入 + 每次调用的模板和输出（含逐层合并）"""
+    calls, reduce_input = 0, 0
+    count = chunk_count
+    while count > 1:
+        calls += count
+        reduce_input += count * MAP_OUTPUT_TOKENS
+        count = min(count - 1, -(-count * MAP_OUTPUT_TOKENS // chunk_tokens))
+    return input_tokens + reduce_input + calls * (PROMPT_OVERHEAD + MAP_OUTPUT_TOKENS) \
+        + PROMPT_OVERHEAD + FINAL_OUTPUT_TOKENS
+
+
+def _ordered(posts):
+    """按话题聚类（common.topic_cluster，未聚类的排在最后）和 post_type 分组、组内按价值从高到低，相近主题落在同一块里"""
+    return sorted(posts, key=lambda p: (
+        p.get("cluster_id") or float("inf"),
+        (p.get("analysis") or {}).get("post_type") or "",
+        VALUE_ORDER.get((p.get("analysis") or {}).get("value_assessment"), 3),
+    ))
+
+
+def fallback_summary(error):
+    return {
+        "error": error,
+        "overview": "今日AI总结生成失败，请查看日志。",
+        "highlights": {},
+        "conclusion": "",
+    }
+
+
+class InsightSummarizer:
+    """一次「今日热点洞察」的分层汇总"""
+
+    def __init__(self, source, chunk_tokens=INSIGHT_CHUNK_TOKENS, token_budget=INSIGHT_TOKEN_BUDGET,
+                 max_workers=INSIGHT_MAX_WORKERS, proxies=None, api_key=None):
+        self.source = source
+        self.chunk_tokens = chunk_tokens
+        self.token_budget = token_budget
+        self.max_workers = max(1, max_workers)
+        self.proxies = proxies
+        self.api_key = api_key
+        self.calls = 0
+        self.spent = 0
+        self.failures = 0
+        self.levels = 0
+        self._lock = threading.Lock()
+
+    def _call(self, static_prompt, text, max_tokens, required=()):
+        result = llm_json.complete_json(
+            static_prompt.messages(text),
+            source=self.source,
+            kind=static_prompt.name,
+            required=required,
+            max_tokens=max_tokens,
+            temperature=0.3,
+            timeout=60,
+            proxies=self.proxies,
+            api_key=self.api_key,
+        )
+        with self._lock:
+            self.calls += 1
+            self.spent += int(result.usage.get("total_tokens") or 0)
+        if result.data is None:
+            raise ValueError(f"无法解析的JSON输出: {result.text[:100]}")
+        return result.data
+
+    def _select(self, posts):
+        """在预算内选出参与汇总的帖子摘要，返回分块后的行"""
+        ordered = _ordered(posts)
+        for excerpt in (True, False):
+            lines = [digest(post, excerpt) for post in ordered]
+            chunks = pack(lines, self.chunk_tokens)
+            input_tokens = sum(estimate_tokens(line) for line in lines)
+            if not self.token_budget or plan_cost(len(chunks), input_tokens, self.chunk_tokens) <= self.token_budget:
+                if not excerpt:
+                    logger.info(f"  ✂️ [{self.source}] 超出洞察预算，摘要去掉分析节选")
+                return chunks
+
+        # 仍然超出：按价值从高到低保留帖子，直到装得进预算
+        by_value = sorted(ordered, key=lambda p: VALUE_ORDER.get(
+            (p.get("analysis") or {}).get("value_assessment"), 3))
+        kept = list(by_value)
+        while len(kept) > 1:
+            lines = [digest(post, False) for post in _ordered(kept)]
+            chunks = pack(lines, self.chunk_tokens)
+            if plan_cost(len(chunks), sum(estimate_tokens(line) for line in lines), self.chunk_tokens) <= self.token_budget:
+                break
+            kept = kept[:max(1, int(len(kept) * 0.9))]
+        logger.info(f"  ✂️ [{self.source}] 超出洞察预算，按价值保留 {len(kept)}/{len(posts)} 篇帖子")
+        return pack([digest(post, False) for post in _ordered(kept)], self.chunk_tokens)
+
+    def _map(self, texts):
+        """并发提炼每块的部分洞察，失败的块跳过"""
+        def run(text):
+            try:
+                return self._call(PARTIAL_PROMPT, text, MAP_OUTPUT_TOKENS)
+            except Exception as e:
+                logger.warning(f"  ⚠️ [{self.source}] 分块洞察失败，跳过该块: {e}")
+                with self._lock:
+                    self.failures += 1
+                return None
+
+        # 复制上下文，运行的截止时间（common.deadline）传递到工作线程
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(texts))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, run, text) for text in texts]
+            results = [future.result() for future in futures]
+        return [json.dumps(result, ensure_ascii=False) for result in results if result]
+
+    def summarize(self, posts):
+        """
+        生成今日热点洞察
+
+        Args:
+            posts: 分析成功的帖子（含 title / analysis）
+
+        Returns:
+            dict: overview / highlights / conclusion；失败时带 error
+        """
+        started = time.time()
+        chunks = self._select(posts)
+        if not chunks:
+            return fallback_summary("没有可汇总的帖子")
+        logger.info(f"🧭 [{self.source}] 今日洞察: {len(posts)} 篇帖子分为 {len(chunks)} 块"
+                    f"（每块 ≤{self.chunk_tokens} tokens）")
+
+        # 逐层合并，直到剩下的内容放得进一次调用
+        while len(chunks) > 1:
+            self.levels += 1
+            partials = self._map(["\n".join(chunk) for chunk in chunks])
+            if not partials:
+                return fallback_summary("所有分块洞察均生成失败")
+            merged = pack(partials, self.chunk_tokens)
+            if len(merged) >= len(chunks):
+                # 部分洞察本身接近分块上限时，两两合并保证每层都在收敛
+                merged = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+            chunks = merged
+            logger.info(f"  🧩 第 {self.levels} 层: 得到 {len(partials)} 份部分洞察，合并为 {len(chunks)} 块")
+
+        try:
+            summary = self._call(FINAL_PROMPT, "\n".join(chunks[0]), FINAL_OUTPUT_TOKENS, required=("overview",))
+        except Exception as e:
+            logger.error(f"生成整体洞察报告失败: {e}")
+            return fallback_summary(f"AI生成整体报告失败: {e}")
+
+        highlights = summary.get("highlights") if isinstance(summary.get("highlights"), dict) else {}
+        summary["highlights"] = {key: highlights.get(key) or [] for key in HIGHLIGHT_KEYS}
+        logger.info(f"✓ [{self.source}] 今日洞察完成: {self.summary()}，耗时 {time.time() - started:.1f}s")
+        return summary
+
+    def summary(self):
+        budget = f"/{self.token_budget}" if self.token_budget else ""
+        return (f"AI 调用 {self.calls} 次（合并 {self.levels} 层，失败 {self.failures} 块），"
+                f"消耗 {self.spent}{budget} tokens")
@@ -0,0 +1,296 @@
+"""
+容错的 LLM JSON 输出解析
+三个数据源原来各自去掉 ``` 标记后直接 json.loads（小黑盒用贪婪正则截取 {...}），
+只要有一处语法错误，整段 2000 token 的生成就被丢弃。常见的问题其实都能在本地修好：
+
+- 修复: 去掉 Markdown 代码块标记和前后的说明文字，字符串中未转义的换行 / 制表符转义，
+  删除 } ] 前多余的逗号，对象结束后的多余内容丢弃
+- 截断: 字符串或括号没有闭合即判定为截断（接口返回 finish_reason=length 时同样处理）。
+  先只请求续写剩余部分（把已有输出作为 assistant 消息，要求从截断处继续），拼接后重新解析；
+  续写次数用完仍不完整时，补齐引号和括号，或退回到最后一个完整的字段
+- 逐字段恢复: 整体仍无法解析时（如字符串里有未转义的引号），按 "key": value 逐个字段提取
+
+每次解析的结果按数据源计数（直接成功 / 修复 / 续写 / 部分恢复 / 失败），stats.summary() 输出修复率。
+
+环境变量:
+- LLM_JSON_MAX_CONTINUATIONS: 截断时最多请求续写的次数（默认 1，0 表示不续写）
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+
+from common import deepseek
+
+logger = logging.getLogger(__name__)
+
+MAX_CONTINUATIONS = int(os.getenv("LLM_JSON_MAX_CONTINUATIONS", "1"))
+
+CLEAN, REPAIRED, CONTINUED, PARTIAL, FAILED = "clean", "repaired", "continued", "partial", "failed"
+OUTCOME_NAMES = {CLEAN: "直接成功", REPAIRED: "修复", CONTINUED: "续写", PARTIAL: "部分恢复", FAILED: "失败"}
+
+CONTINUE_PROMPT = ("上面的JSON输出在中途被截断了。请从截断处继续输出剩余内容，"
+                   "不要重复已经输出的部分，不要添加任何解释或```标记。")
+
+_LEADING_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*")
+_TRAILING_FENCE_RE = re.compile(r"\s*```\s*$")
+_KEY_RE = re.compile(r'"([A-Za-z_][A-Za-z0-9_]*)"\s*:\s*')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_decoder = json.JSONDecoder()
+
+
+class ParseResult:
+    """parse() 的结果：data 为 None 表示无法恢复"""
+
+    def __init__(self, data, outcome, truncated=False):
+        self.data = data
+        self.outcome = outcome
+        self.truncated = truncated
+
+
+class Completion:
+    """complete_json() 的结果"""
+
+    def __init__(self, data, outcome, text, usage, continuations=0):
+        self.data = data
+        self.outcome = outcome
+        self.text = text
+        self.usage = usage
+        self.continuations = continuations
+
+
+def strip_fences(text):
+    """去掉首尾的 Markdown 代码块标记（detailed_analysis 里的代码块保留）"""
+    return _TRAILING_FENCE_RE.sub("", _LEADING_FENCE_RE.sub("", text or "")).strip()
+
+
+def _closers(stack):
+    return "".join(reversed(stack))
+
+
+def _trim_tail(chars):
+    """去掉末尾的空白和逗号（截断处补括号前）"""
+    while chars and (chars[-1].isspace() or chars[-1] == ","):
+        chars.pop()
+    return chars
+
+
+def _scan(text):
+    """
+    逐字符扫描第一个 JSON 值，修复可以确定的语法问题
+
+    Returns:
+        (修复后的文本, 是否截断, 截断时的退路 [退回到某个完整字段后补齐括号的文本]，从后往前)
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return "", False, []
+    out, stack, safe_points = [], [], []
+    in_string = escape = False
+    for ch in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch < " ":
+                ch = _CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}")
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            safe_points.append((len(out), tuple(stack)))
+            continue
+        elif ch in "}]":
+            _trim_tail(out)
+            if not stack or stack[-1] != ch:
+                continue
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                return "".join(out), False, []
+            continue
+        elif ch == ",":
+            safe_points.append((len(out), tuple(stack)))
+        out.append(ch)
+
+    # 没有闭合：截断
+    if escape:
+        out.pop()
+    fallbacks = ["".join(_trim_tail(out[:position])) + _closers(point_stack)
+                 for position, point_stack in reversed(safe_points)]
+    if in_string:
+        out.append('"')
+    return "".join(_trim_tail(out)) + _closers(stack), True, fallbacks
+
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except (ValueError, TypeError):
+        return None
+
+
+def recover_fields(text):
+    """逐字段提取顶层的 "key": value（值无法解析的字符串字段取到下一个键之前）"""
+    data = {}
+    covered = 0
+    matches = list(_KEY_RE.finditer(text))
+    for match, following in zip(matches, matches[1:] + [None]):
+        if match.start() < covered or match.group(1) in data:
+            continue
+        try:
+            value, end = _decoder.raw_decode(text, match.end())
+            # 值之后必须是逗号或右括号，否则是字符串里有未转义的引号，只解析出了前半段
+            rest = text[end:].lstrip()
+            if not rest or rest[0] in ",}]":
+                data[match.group(1)] = value
+                covered = end
+                continue
+        except ValueError:
+            pass
+        raw = text[match.end():following.start() if following else len(text)].strip()
+        if not raw.startswith('"'):
+            continue
+        raw = raw[1:].rstrip().rstrip("}],").rstrip()
+        if raw.endswith('"'):
+            raw = raw[:-1]
+        data[match.group(1)] = raw.replace("\\n", "\n").replace('\\"', '"')
+        covered = following.start() if following else len(text)
+    return data
+
+
+def parse(text):
+    """
+    解析 LLM 输出中的 JSON 对象 / 数组
+
+    Returns:
+        ParseResult: outcome 为 clean / repaired / partial / failed；
+                     truncated 表示输出被截断（可以请求续写）
+    """
+    stripped = strip_fences(text)
+    data = _loads(stripped)
+    if data is not None:
+        return ParseResult(data, CLEAN)
+
+    repaired, truncated, fallbacks = _scan(stripped)
+    if not truncated:
+        data = _loads(repaired)
+        if data is not None:
+            return ParseResult(data, REPAIRED)
+    else:
+        # 先补齐引号和括号（保留截断字段的已有内容），不行再退回到最后一个完整的字段
+        for candidate in [repaired] + fallbacks:
+            data = _loads(candidate)
+            if data is not None:
+                return ParseResult(data, PARTIAL, truncated=True)
+
+    data = recover_fields(stripped)
+    if data:
+        return ParseResult(data, PARTIAL, truncated=truncated)
+    return ParseResult(None, FAILED, truncated=truncated)
+
+
+def loads(text):
+    """parse() 的简写：返回数据，无法恢复时抛出 ValueError"""
+    result = parse(text)
+    if result.data is None:
+        raise ValueError(f"无法解析的JSON输出: {strip_fences(text)[:100]}")
+    return result.data
+
+
+class ParseStats:
+    """按数据源统计解析结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}
+
+    def record(self, source, outcome):
+        with self._lock:
+            counts = self._sources.setdefault(source, dict.fromkeys(OUTCOME_NAMES, 0))
+            counts[outcome] += 1
+
+    def repair_rate(self, source):
+        """需要修复的输出中被救回的比例（没有需要修复的输出时为 None）"""
+        counts = self._sources.get(source)
+        if not counts:
+            return None
+        needed = sum(counts.values()) - counts[CLEAN]
+        return (needed - counts[FAILED]) / needed if needed else None
+
+    def summary(self, source):
+        counts = self._sources.get(source)
+        if not counts:
+            return f"[{source}] JSON 解析: 无调用"
+        rate = self.repair_rate(source)
+        rate_text = f"{rate * 100:.0f}%" if rate is not None else "N/A"
+        detail = "，".join(f"{OUTCOME_NAMES[outcome]} {count}" for outcome, count in counts.items())
+        return f"[{source}] JSON 解析: {detail}（修复率 {rate_text}）"
+
+
+stats = ParseStats()
+
+
+def _add_usage(total, usage):
+    for key, value in (usage or {}).items():
+        if isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+
+
+def complete_json(messages, source, required=(), max_continuations=MAX_CONTINUATIONS, **kwargs):
+    """
+    调用 deepseek.chat_completion 并解析 JSON 输出；截断时只请求续写剩余部分
+
+    Args:
+        required: 必须存在的字段，逐字段恢复后缺少这些字段视为失败
+        kwargs: 传给 chat_completion（max_tokens / temperature / timeout / proxies / api_key / low_priority / kind）
+
+    Returns:
+        Completion: data 为 None 表示无法恢复；usage 为所有请求（含续写）的合计
+
+    Raises:
+        与 chat_completion 相同（首次请求的网络错误和接口错误）
+    """
+    response = deepseek.chat_completion(messages, source, **kwargs)
+    usage = {}
+    _add_usage(usage, response.get("usage"))
+    text = deepseek.extract_content(response)
+    finish_reason = response.get("choices", [{}])[0].get("finish_reason")
+    result = parse(text)
+
+    continuations = 0
+    while (result.truncated or finish_reason == "length") and result.outcome != CLEAN \
+            and continuations < max_continuations:
+        continuations += 1
+        logger.info(f"  ✂️ [{source}] AI 输出被截断，请求续写（第 {continuations} 次）")
+        try:
+            response = deepseek.chat_completion(
+                messages + [{"role": "assistant", "content": text}, {"role": "user", "content": CONTINUE_PROMPT}],
+                source, **kwargs,
+            )
+        except Exception as e:
+            logger.warning(f"  ⚠️ [{source}] 续写请求失败，使用已有输出: {e}")
+            break
+        _add_usage(usage, response.get("usage"))
+        text += strip_fences(deepseek.extract_content(response))
+        finish_reason = response.get("choices", [{}])[0].get("finish_reason")
+        result = parse(text)
+
+    outcome = result.outcome
+    if continuations and outcome in (CLEAN, REPAIRED):
+        outcome = CONTINUED
+    data = result.data
+    if data is not None and required and (not isinstance(data, dict) or any(key not in data for key in required)):
+        data, outcome = None, FAILED
+    stats.record(source, outcome)
+    if outcome not in (CLEAN, FAILED):
+        logger.info(f"  🩹 [{source}] JSON 输出已{OUTCOME_NAMES[outcome]}")
+    return Completion(data, outcome, text, usage, continuations)
@@ -0,0 +1,197 @@
+"""
+日志配置（后台线程写入、JSON Lines、滚动、采样）
+各脚本原来用 logging.basicConfig + FileHandler 在事件循环里同步写日志，每篇帖子、每条评论都有几行，
+日志文件只增不减，也只能 grep 文本。setup() 统一配置根日志记录器：
+
+- 后台写入: 根日志记录器只挂一个 QueueHandler，控制台和文件输出都由 QueueListener 在后台线程中完成
+- 结构化: 除原有文本日志外，同名 .jsonl 文件每条记录一行 JSON（time / level / logger / message，
+  以及 source / post_id / stage / duration 等字段）。字段通过 bind() 按 asyncio 任务附加
+  （contextvars，common.deepseek.run_in_thread 的线程中同样可见），也可以用 extra={...} 单独指定；
+  duration 为进入最近一层 bind() 以来的秒数
+- 滚动: 文件超过 LOG_MAX_BYTES 或跨天（按文件最后修改日期，定时运行的脚本也会按天滚动）时滚动，
+  保留 LOG_BACKUP_COUNT 个备份（.1 为最新）
+- 采样: LOG_SAMPLE 按日志记录器名前缀配置保留比例，只对 INFO 及以下的记录生效（警告和错误全部保留），
+  被丢弃的记录在调用线程中就被过滤，不进入队列
+
+setup() 只在第一次调用时生效：统一调度先配置，之后导入的各数据源脚本沿用同一套输出。
+
+环境变量:
+- LOG_LEVEL: 日志级别（默认 INFO）
+- LOG_MAX_BYTES: 单个日志文件的大小上限（默认 10MB）
+- LOG_BACKUP_COUNT: 保留的滚动备份数（默认 7）
+- LOG_JSON: 是否同时写 JSON Lines 文件（默认 true）
+- LOG_SAMPLE: 高频日志采样，如 "scraper_optimized=0.2,common.html_extract=0.1"（__main__ 为直接运行的脚本）
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+LOG_JSON = os.getenv("LOG_JSON", "true").lower() == "true"
+
+# 写入 JSON 记录的结构化字段（bind() 或 extra 提供）
+FIELDS = ("source", "post_id", "stage", "duration")
+
+_STARTED = "_started"
+_fields = contextvars.ContextVar("log_fields", default={})
+_listener = None
+
+
+def parse_sample_rates(value):
+    """"name=rate,..." → {name: rate}，忽略格式不对的项"""
+    rates = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+LOG_SAMPLE = parse_sample_rates(os.getenv("LOG_SAMPLE", ""))
+
+
+@contextmanager
+def bind(**fields):
+    """在当前任务中为日志记录附加结构化字段（如 post_id、stage），退出时恢复上一层"""
+    token = _fields.set({**_fields.get(), **fields, _STARTED: time.monotonic()})
+    try:
+        yield
+    finally:
+        _fields.reset(token)
+
+
+class SampleFilter(logging.Filter):
+    """按日志记录器名前缀（最长匹配）保留一定比例的 INFO 及以下记录，按计数均匀保留"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._credit = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _rate(self, name):
+        best = None
+        for prefix in self.rates:
+            if (name == prefix or name.startswith(prefix + ".")) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return best
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        prefix = self._rate(record.name)
+        if prefix is None:
+            return True
+        with self._lock:
+            credit = self._credit.get(prefix, 0.0) + self.rates[prefix]
+            keep = credit >= 1.0
+            self._credit[prefix] = credit - 1.0 if keep else credit
+            if not keep:
+                self.dropped += 1
+        return keep
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """在调用线程中附加 bind() 字段后放入队列（格式化和写入在后台线程中进行）"""
+
+    def prepare(self, record):
+        fields = _fields.get()
+        for key, value in fields.items():
+            if key == _STARTED:
+                if getattr(record, "duration", None) is None:
+                    record.duration = round(time.monotonic() - value, 3)
+            elif getattr(record, key, None) is None:
+                setattr(record, key, value)
+        return super().prepare(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RotatingHandler(logging.handlers.RotatingFileHandler):
+    """按大小或跨天滚动（编号备份，.1 为最新）"""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=max(1, backup_count),
+                         encoding="utf-8", delay=True)
+        try:
+            self._day = date.fromtimestamp(os.path.getmtime(self.baseFilename))
+        except OSError:
+            self._day = date.today()
+
+    def shouldRollover(self, record):
+        if date.today() != self._day and os.path.exists(self.baseFilename):
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._day = date.today()
+
+
+def setup(log_file, fmt="%(asctime)s [%(levelname)s] %(message)s", source=None):
+    """
+    配置根日志记录器（进程内只生效一次）
+
+    Args:
+        log_file: 文本日志路径（JSON Lines 写到同名 .jsonl 文件）
+        fmt: 控制台和文本日志的格式
+        source: 附加到本进程所有记录的数据源名
+    """
+    global _listener
+    if source:
+        _fields.set({**_fields.get(), "source": source})
+    if _listener is not None:
+        return
+
+    log_file = Path(log_file)
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    formatter = logging.Formatter(fmt)
+    handlers = [logging.StreamHandler(), RotatingHandler(log_file)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if LOG_JSON:
+        json_handler = RotatingHandler(log_file.with_suffix(".jsonl"))
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+
+    queue_handler = ContextQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SampleFilter(LOG_SAMPLE))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
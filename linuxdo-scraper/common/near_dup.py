@@ -0,0 +1,279 @@
+"""
+近似重复帖子检测（SimHash）
+同一条新闻常常在不同日期被反复转发，标题和正文只有少量差异。
+在 AI 分析之前先计算 64 位 SimHash 指纹，与同一数据源的历史帖子和本批次前面的帖子比较，
+海明距离不超过 NEAR_DUP_MAX_DISTANCE 的帖子直接复用已有分析，并记录 duplicate_of。
+只在同一数据源内复用：各数据源提示词里的 post_type 类别不同，复制过来的分类在本数据源中不成立。
+历史帖子没有可用分析（分析失败或未调用 AI）时不作为重复来源，帖子按新帖分析并加入索引。
+
+- 特征: 标题 + 正文规范化（NFKC、小写、去 URL 和标点）后的字符 3-gram，中英文通用
+- 索引: 64 位指纹切成 4 段做多索引哈希（鸽巢原理），每段只探测小半径内的取值，
+  每次查询只是几十次字典查找加少量候选的海明距离计算，几万条指纹下也在几十微秒
+- 持久化: post_signatures 表（source, post_id, simhash, duplicate_of），
+  启动时一条查询载入内存，分析入库后经写入队列（common.spool）写回
+
+环境变量:
+- NEAR_DUP_ENABLED: 是否启用近似重复检测（默认 true）
+- NEAR_DUP_MAX_DISTANCE: 判定为重复的最大海明距离（默认 6）
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from itertools import combinations
+
+from common import db, spool
+from common.seen_index import SOURCE_TABLES
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "true").lower() == "true"
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "6"))
+
+SHINGLE_SIZE = 3
+BAND_BITS = 16
+MIN_SHINGLES = 8      # 特征太少（如只有短标题）时指纹不可靠，不参与去重
+MAX_TEXT_LENGTH = 4000
+
+_URL_RE = re.compile(r"https?://\S+")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+# 分析结果字段（title_cn 只有 reddit / 小黑盒表有）
+ANALYSIS_COLUMNS = ("core_issue", "key_info", "post_type", "value_assessment", "detailed_analysis")
+TITLE_CN_SOURCES = ("reddit", "heybox")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _URL_RE.sub(" ", text)
+    # 去掉所有空白和标点：中文本身没有空格，中英文混排时空格有无不应影响特征
+    return _NON_WORD_RE.sub("", text)
+
+
+def post_text(post):
+    """参与指纹计算的文本：标题 + 正文（linux.do / reddit 为 content，小黑盒为 summary）"""
+    body = post.get("content") or post.get("summary") or ""
+    return f"{post.get('title', '')} {body}"[:MAX_TEXT_LENGTH]
+
+
+def simhash(text):
+    """64 位 SimHash；特征不足时返回 None"""
+    text = normalize(text)
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _to_signed(value):
+    """PostgreSQL BIGINT 是有符号的"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _split_key(key):
+    source, _, post_id = key.partition(":")
+    return source, post_id
+
+
+class SignatureIndex:
+    """所有数据源帖子指纹的内存索引（键为 "source:post_id"）"""
+
+    def __init__(self, rows=(), max_distance=NEAR_DUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        # 多索引哈希: 64 位切成 4 段 16 位，距离不超过 k 的两个指纹至少有一段距离不超过 k // 4，
+        # 查询时每段只探测该半径内的取值（k=6 时每段 17 个），每个桶平均不到一条记录
+        self._bands = [(offset, (1 << BAND_BITS) - 1) for offset in range(0, 64, BAND_BITS)]
+        self._probes = [0]
+        for radius in range(1, max_distance // len(self._bands) + 1):
+            self._probes.extend(sum(1 << bit for bit in bits)
+                                for bits in combinations(range(BAND_BITS), radius))
+        self._buckets = [{} for _ in self._bands]
+        self._signatures = {}
+        self.hits = 0
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        for key, value in rows:
+            self.add(key, value)
+
+    @classmethod
+    async def load(cls, max_distance=NEAR_DUP_MAX_DISTANCE):
+        """从数据库载入所有指纹（一条查询）；失败时返回空索引，本次只在批次内去重"""
+        rows = []
+        try:
+            pool = await db.get_pool()
+            rows = await pool.fetch("SELECT source, post_id, simhash FROM post_signatures")
+        except Exception as e:
+            logger.warning(f"⚠️ 读取帖子指纹失败，本次仅在批次内去重: {e}")
+        index = cls(((f"{row['source']}:{row['post_id']}", _to_unsigned(row["simhash"])) for row in rows),
+                    max_distance)
+        logger.info(f"✓ 帖子指纹索引: {len(index)} 条（最大海明距离 {max_distance}）")
+        return index
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def add(self, key, value):
+        if key in self._signatures:
+            return
+        self._signatures[key] = value
+        for (offset, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((value >> offset) & mask, []).append(key)
+
+    def candidates(self, value):
+        """距离阈值内的所有指纹 {键: 海明距离}"""
+        started = time.perf_counter()
+        found = {}
+        for (offset, mask), buckets in zip(self._bands, self._buckets):
+            band = (value >> offset) & mask
+            for probe in self._probes:
+                for key in buckets.get(band ^ probe, ()):
+                    if key in found:
+                        continue
+                    distance = hamming(value, self._signatures[key])
+                    found[key] = distance if distance <= self.max_distance else None
+        self.lookups += 1
+        self.lookup_seconds += time.perf_counter() - started
+        return {key: distance for key, distance in found.items() if distance is not None}
+
+    def lookup(self, value, exclude=None, accept=None):
+        """返回 (最相近的键, 海明距离)，没有距离阈值内（且 accept(键) 为真）的指纹时返回 None"""
+        matches = [(distance, key) for key, distance in self.candidates(value).items()
+                   if key != exclude and (accept is None or accept(key))]
+        if not matches:
+            return None
+        distance, key = min(matches)
+        return key, distance
+
+    async def resolve(self, posts, source, text_of=post_text):
+        """
+        把帖子分成需要 AI 分析的和近似重复的（保持原有顺序）
+
+        重复帖子会带上 duplicate_of；与历史帖子重复的直接填入已有分析，
+        与本批次前面帖子重复的在分析完成后由 fill_batch_duplicates 复制。
+        只匹配同一数据源中有可用分析的历史帖子（先一次查询出候选帖子的分析），
+        其余帖子按新帖处理并加入索引，本批次后面的近似重复帖子可以复用它的分析。
+
+        Returns:
+            (to_analyze, duplicates)
+        """
+        if not NEAR_DUP_ENABLED:
+            return list(posts), []
+
+        prefix = f"{source}:"
+        for post in posts:
+            post["_simhash"] = simhash(text_of(post))
+        stored_keys = {
+            candidate
+            for post in posts if post["_simhash"] is not None
+            for candidate in self.candidates(post["_simhash"])
+            if candidate.startswith(prefix) and candidate != f"{prefix}{post['id']}"
+        }
+        analyses = await fetch_analyses(list(stored_keys)) if stored_keys else {}
+
+        batch = {}
+        for post in posts:
+            key = f"{source}:{post['id']}"
+            value = post["_simhash"]
+            if value is None:
+                continue
+            match = self.lookup(value, exclude=key, accept=lambda k: k in batch or k in analyses)
+            if match is None:
+                self.add(key, value)
+                batch[key] = post
+                continue
+            original_key, distance = match
+            post["duplicate_of"] = original_key
+            if original_key in batch:
+                post["_duplicate_post"] = batch[original_key]
+            else:
+                post["analysis"] = {**analyses[original_key], "duplicate_of": original_key}
+            logger.info(f"  🔁 近似重复（距离 {distance}）: {post.get('title', '')[:40]} → {original_key}")
+
+        to_analyze = [post for post in posts if not post.get("duplicate_of")]
+        duplicates = [post for post in posts if post.get("duplicate_of")]
+        self.hits += len(duplicates)
+        logger.info(f"🔁 [{source}] 近似重复 {len(duplicates)} 篇复用已有分析，{len(to_analyze)} 篇需要分析"
+                    f"（{self.summary()}）")
+        return to_analyze, duplicates
+
+    async def save(self, posts, source):
+        """分析入库后写回指纹（重复帖子同时记录 duplicate_of），经写入队列异步写入"""
+        rows = [
+            (source, str(post["id"]), _to_signed(post["_simhash"]), post.get("duplicate_of"))
+            for post in posts if post.get("_simhash") is not None
+        ]
+        if not rows:
+            return
+        spool.writer.executemany("""
+            INSERT INTO post_signatures (source, post_id, simhash, duplicate_of)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (source, post_id) DO UPDATE SET
+                simhash = EXCLUDED.simhash,
+                duplicate_of = EXCLUDED.duplicate_of
+        """, rows, label=f"{source} 帖子指纹", source=source)
+        logger.info(f"✓ [{source}] 已提交 {len(rows)} 条帖子指纹到写入队列")
+
+    def summary(self):
+        if not self.lookups:
+            return f"索引 {len(self)} 条，未查询"
+        return (f"索引 {len(self)} 条，查询 {self.lookups} 次，"
+                f"平均 {self.lookup_seconds / self.lookups * 1e6:.0f} µs")
+
+
+def fill_batch_duplicates(duplicates):
+    """本批次内的重复帖子：复制原帖分析完成后的结果"""
+    for post in duplicates:
+        original = post.pop("_duplicate_post", None)
+        if original is not None:
+            post["analysis"] = {**original.get("analysis", {}), "duplicate_of": post["duplicate_of"]}
+
+
+async def fetch_analyses(keys):
+    """按 "source:post_id" 从各数据源表读取已有分析，返回 {key: analysis}"""
+    by_source = {}
+    for key in keys:
+        source, post_id = _split_key(key)
+        if source in SOURCE_TABLES:
+            by_source.setdefault(source, []).append(post_id)
+
+    analyses = {}
+    try:
+        pool = await db.get_pool()
+        for source, post_ids in by_source.items():
+            columns = ANALYSIS_COLUMNS + (("title_cn",) if source in TITLE_CN_SOURCES else ())
+            rows = await pool.fetch(
+                f"SELECT id, {', '.join(columns)} FROM {SOURCE_TABLES[source]} WHERE id = ANY($1::text[])",
+                post_ids,
+            )
+            for row in rows:
+                analysis = {column: row[column] for column in columns}
+                if isinstance(analysis["key_info"], str):
+                    analysis["key_info"] = json.loads(analysis["key_info"])
+                # 分析失败或按热度分级未调用 AI 的帖子没有关键信息，不复用
+                if not analysis["core_issue"] or not analysis["key_info"]:
+                    continue
+                analyses[f"{source}:{row['id']}"] = analysis
+    except Exception as e:
+        logger.warning(f"⚠️ 读取已有分析失败，重复帖子将重新分析: {e}")
+    return analyses
@@ -0,0 +1,60 @@
+"""
+提示词布局（适配 DeepSeek 前缀缓存）
+DeepSeek 会自动缓存请求的公共前缀，命中部分按缓存价计费、首 token 也更快，
+但前提是前缀逐字节相同。原来的提示词把标题、正文插在说明文字中间，
+JSON 格式说明又排在帖子内容之后，每个请求从第一个变量起就不一样了。
+
+这里把提示词拆成两部分：
+- 静态前缀（系统消息）: 角色、要求和 JSON 格式说明，模块加载时构造一次，之后不再变化
+- 帖子数据（用户消息）: 标题、正文、评论等，全部放在最后
+
+命中情况由 common.deepseek 按数据源记录（usage 中的 prompt_cache_hit_tokens /
+prompt_cache_miss_tokens），见 deepseek.cache_stats。
+"""
+
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StaticPrompt:
+    """
+    静态前缀：构造后不再变化，所有帖子共用同一份字节
+
+    text 中不应包含任何帖子相关的内容（包括评论条数这类数字），
+    否则前缀会随帖子变化，缓存永远不会命中。
+    """
+
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text.strip()
+        # 前缀指纹：日志中对比不同运行 / 不同版本的前缀是否一致
+        self.digest = hashlib.sha1(self.text.encode("utf-8")).hexdigest()[:8]
+
+    def messages(self, data):
+        """OpenAI 格式的消息列表：静态前缀在前，帖子数据在后"""
+        return [
+            {"role": "system", "content": self.text},
+            {"role": "user", "content": data},
+        ]
+
+    def __repr__(self):
+        return f"StaticPrompt({self.name!r}, {len(self.text)} 字, {self.digest})"
+
+
+def render_post(fields, *sections, heading="待分析帖子"):
+    """
+    帖子数据块
+
+    Args:
+        fields: [(标签, 值)]，值为空的字段不输出
+        sections: 追加在字段之后的段落（评论区、评论区统计等），空字符串忽略
+    """
+    lines = [f"**{heading}**："]
+    lines.extend(f"- {label}: {value}" for label, value in fields if value not in (None, ""))
+    text = "\n".join(lines)
+    for section in sections:
+        if section and section.strip():
+            text += "\n\n" + section.strip()
+    return text
@@ -0,0 +1,147 @@
+"""
+已处理帖子索引
+启动时用一条查询把数据库中已有的帖子 id 和时间戳读入内存（排序数组 + 二分查找），
+解析 RSS / 首页列表时就丢弃已处理的帖子，避免重复访问详情页和重复调用 AI。
+
+对已处理帖子的策略（SEEN_POLICY_<SOURCE>）:
+- skip（默认）: 直接跳过
+- refresh: 不做详情抓取和 AI 分析，只用列表页上的数据刷新互动统计
+- stale: 超过 SEEN_STALE_HOURS 的帖子重新完整处理，其余跳过
+
+上次分析之后又补充了数据的帖子（reddit: 评论采集 reddit_comments_scraper 在分析之后写入
+comments_fetched_at）在 skip / stale 策略下重新分析一次，分析时带上已采集的评论；
+重新入库时 timestamp 更新，之后按正常策略处理。
+
+环境变量:
+- SEEN_POLICY_LINUXDO / SEEN_POLICY_REDDIT / SEEN_POLICY_HEYBOX: 策略（默认 skip）
+- SEEN_STALE_HOURS: stale 策略下的过期时间（默认 72 小时）
+"""
+
+import logging
+import os
+import time
+from array import array
+from bisect import bisect_left
+
+import asyncpg
+
+from common import db
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TABLES = {
+    "linuxdo": "posts",
+    "reddit": "reddit_posts",
+    "heybox": "heybox_posts",
+}
+# 分析之后补充数据的时间列：晚于 timestamp 时重新分析
+REVISIT_COLUMNS = {
+    "reddit": "comments_fetched_at",
+}
+POLICIES = ("skip", "refresh", "stale")
+SEEN_STALE_HOURS = float(os.getenv("SEEN_STALE_HOURS", "72"))
+
+# decide() 的返回值
+NEW, SKIP, REFRESH, REANALYZE = "new", "skip", "refresh", "reanalyze"
+
+
+def get_policy(source):
+    policy = os.getenv(f"SEEN_POLICY_{source.upper()}", "skip").lower()
+    if policy not in POLICIES:
+        logger.warning(f"⚠️ 未知的 SEEN_POLICY_{source.upper()}={policy}，使用 skip")
+        policy = "skip"
+    return policy
+
+
+class SeenIndex:
+    """一个数据源已入库帖子的 id 索引"""
+
+    def __init__(self, source, rows=(), policy=None, stale_hours=SEEN_STALE_HOURS):
+        """rows: (id, timestamp) 或 (id, timestamp, 补充数据的时间)"""
+        self.source = source
+        self.policy = policy or get_policy(source)
+        self.stale_seconds = stale_hours * 3600
+        entries = sorted(
+            (str(post_id), ts.timestamp() if ts else 0.0, rest[0].timestamp() if rest and rest[0] else 0.0)
+            for post_id, ts, *rest in rows
+        )
+        self._ids = [post_id for post_id, _, _ in entries]
+        self._seen_at = array("d", (seen_at for _, seen_at, _ in entries))
+        self._revised_at = array("d", (revised_at for _, _, revised_at in entries))
+        self.totals = {NEW: 0, SKIP: 0, REFRESH: 0, REANALYZE: 0}
+
+    @classmethod
+    async def load(cls, source, policy=None):
+        """从数据库同步索引（一条查询）；失败时返回空索引，所有帖子按新帖处理"""
+        table = SOURCE_TABLES[source]
+        columns = ["id", "timestamp"] + ([REVISIT_COLUMNS[source]] if source in REVISIT_COLUMNS else [])
+        try:
+            pool = await db.get_pool()
+            try:
+                rows = await pool.fetch(f"SELECT {', '.join(columns)} FROM {table}")
+            except asyncpg.exceptions.UndefinedColumnError:
+                # 表未迁移（还没有补充数据的时间列）
+                columns = columns[:2]
+                rows = await pool.fetch(f"SELECT {', '.join(columns)} FROM {table}")
+        except Exception as e:
+            logger.warning(f"⚠️ [{source}] 读取已处理帖子失败，本次不跳过任何帖子: {e}")
+            rows = []
+        index = cls(source, (tuple(row[column] for column in columns) for row in rows), policy)
+        logger.info(f"✓ [{source}] 已处理帖子索引: {len(index)} 条（策略: {index.policy}）")
+        return index
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _position(self, post_id):
+        post_id = str(post_id)
+        i = bisect_left(self._ids, post_id)
+        if i < len(self._ids) and self._ids[i] == post_id:
+            return i
+        return None
+
+    def __contains__(self, post_id):
+        return self._position(post_id) is not None
+
+    def decide(self, post_id, now=None):
+        """返回 new / skip / refresh / reanalyze"""
+        i = self._position(post_id)
+        if i is None:
+            return NEW
+        if self.policy == "refresh":
+            return REFRESH
+        if self._revised_at[i] > self._seen_at[i]:
+            return REANALYZE
+        if self.policy == "stale":
+            now = now if now is not None else time.time()
+            if now - self._seen_at[i] > self.stale_seconds:
+                return REANALYZE
+        return SKIP
+
+    def partition(self, items, key=lambda item: item["id"], label=""):
+        """
+        把帖子列表分成需要完整处理的和只需刷新统计的，跳过的直接丢弃（保持原有顺序）
+
+        Returns:
+            (to_process, to_refresh)
+        """
+        now = time.time()
+        to_process, to_refresh = [], []
+        counts = {NEW: 0, SKIP: 0, REFRESH: 0, REANALYZE: 0}
+        for item in items:
+            decision = self.decide(key(item), now)
+            counts[decision] += 1
+            if decision in (NEW, REANALYZE):
+                to_process.append(item)
+            elif decision == REFRESH:
+                to_refresh.append(item)
+        for decision, count in counts.items():
+            self.totals[decision] += count
+        logger.info(f"🔎 [{self.source}{' ' + label if label else ''}] 新帖 {counts[NEW]}，跳过 {counts[SKIP]}，"
+                    f"仅刷新统计 {counts[REFRESH]}，过期重新分析 {counts[REANALYZE]}")
+        return to_process, to_refresh
+
+    def all_known(self):
+        """目前为止 partition 过的帖子全部是已处理的（没有新帖是正常结果，不是抓取失败）"""
+        totals = self.totals
+        return not totals[NEW] and not totals[REANALYZE] and bool(totals[SKIP] or totals[REFRESH])
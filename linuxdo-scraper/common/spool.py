@@ -0,0 +1,398 @@
+"""
+数据库写入的本地队列（write-behind spool）
+原来各数据源直接写 Neon：连接失败时 linux.do 只生成 JSON 报告（之后要手动运行上传脚本），
+reddit 直接中止整个运行；远程数据库偶尔变慢或断开，写入就会阻塞或丢失。这里所有写入先进入本地队列：
+
+- 队列: data/db_spool.sqlite3（SQLite WAL，synchronous=FULL），每次写入是一批记录，按写入顺序编号；
+  write() 落盘后立即返回，不等待远程数据库
+- 写入函数: 每批记录指定一个已注册的写入函数（register()），在连接上把这批记录写入数据库，
+  必须是幂等的 upsert（中途失败或进程退出时整批重放）；通用的 "sql" 写入函数在一个事务中执行 executemany。
+  逐条写入的写入函数中单条失败不影响其他记录，写完后抛出 PartialWrite，整批按失败重试（不能正常返回，
+  否则这批记录会被当作已写入删除）。通用写入函数遇到表中还没有的列（表未迁移）时只记录警告，
+  不重试（迁移之前重试也不会成功）
+- 顺序: 每批记录属于一个数据源（write(source=...)），同一数据源的批次严格按写入顺序写入：
+  前面的批次在退避重试（或被其他进程取走）时，后面的批次也等待，避免帖子还没插入时
+  互动统计、话题聚类、指纹等 UPDATE 先执行、匹配 0 行后被当作已写入删除。死信不阻塞后面的批次
+  没有注册写入函数的批次（其他数据源的遗留数据）留在队列中，等对应数据源运行时再写入
+- 后台刷新: 第一次写入时在当前事件循环中启动刷新任务，有新数据或每 SPOOL_FLUSH_INTERVAL 秒
+  按顺序每次取 SPOOL_FLUSH_BATCH 批写入；数据库不可达（连接错误、超时）时指数退避，最长 SPOOL_RETRY_MAX 秒，
+  其他错误（约束、表结构）单独退避重试，超过 SPOOL_MAX_ATTEMPTS 次后标记为死信保留在队列文件中
+- 运行开始时 drain() 先写入上次遗留的数据（读取已处理帖子之前），关闭连接池之前（db.on_close）
+  在运行的截止时间内（common.deadline）最后写一次，没写完的留到下次运行
+- 多个进程共用同一个队列文件：取出的批次带租约（not_before），其他进程在租约到期前不会重复写入
+
+summary() 输出待写入的批次 / 行数、最早一批的等待时间、本次写入的延迟（入队到提交）和死信数量。
+
+环境变量:
+- SPOOL_FLUSH_INTERVAL: 后台刷新间隔（秒，默认 5）
+- SPOOL_FLUSH_BATCH: 每轮最多写入的批次（默认 50）
+- SPOOL_RETRY_MAX: 数据库不可达时的最长退避（秒，默认 300）
+- SPOOL_MAX_ATTEMPTS: 非连接错误的最多重试次数，超过后标记为死信（默认 5）
+- SPOOL_DRAIN_TIMEOUT: 运行开始 / 结束时写入遗留数据的最长等待（秒，默认 60）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import asyncpg
+
+from common import db, deadline
+
+logger = logging.getLogger(__name__)
+
+SPOOL_FLUSH_INTERVAL = float(os.getenv("SPOOL_FLUSH_INTERVAL", "5"))
+SPOOL_FLUSH_BATCH = int(os.getenv("SPOOL_FLUSH_BATCH", "50"))
+SPOOL_RETRY_MAX = float(os.getenv("SPOOL_RETRY_MAX", "300"))
+SPOOL_MAX_ATTEMPTS = int(os.getenv("SPOOL_MAX_ATTEMPTS", "5"))
+SPOOL_DRAIN_TIMEOUT = float(os.getenv("SPOOL_DRAIN_TIMEOUT", "60"))
+
+SCRAPER_ROOT = Path(__file__).resolve().parents[1]
+SPOOL_PATH = SCRAPER_ROOT / "data" / "db_spool.sqlite3"
+
+# 取出的批次在该秒数内不会被其他进程再次取出（写入完成或失败时提前释放）
+LEASE_SECONDS = 300
+
+PENDING, DEAD = "pending", "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    writer TEXT NOT NULL,
+    label TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    source TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS spool_status ON spool (status, id);
+"""
+
+_writers = {}
+
+
+def register(name):
+    """注册写入函数（装饰器）：async def fn(conn, payload)，payload 为 write() 时传入的数据（经过 JSON 往返）"""
+    def decorator(fn):
+        _writers[name] = fn
+        return fn
+    return decorator
+
+
+@register("sql")
+async def _write_sql(conn, payload):
+    """通用写入：[[sql, rows], ...] 在一个事务中依次 executemany（表未迁移时只记录警告）"""
+    try:
+        async with conn.transaction():
+            for sql, rows in payload["statements"]:
+                await conn.executemany(sql, [tuple(row) for row in rows])
+    except asyncpg.exceptions.UndefinedColumnError as e:
+        # 表未迁移时重试也不会成功，只记录警告
+        logger.warning(f"⚠️ 写入队列: 表未迁移，跳过这批记录: {e}")
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"无法写入队列的类型: {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def is_unreachable(error):
+    """数据库不可达（连接失败、断开、超时）：整轮停止，稍后重试，不计入批次的失败次数"""
+    return isinstance(error, (
+        OSError, asyncio.TimeoutError,
+        asyncpg.exceptions.InterfaceError,
+        asyncpg.exceptions.PostgresConnectionError,
+        asyncpg.exceptions.CannotConnectNowError,
+        asyncpg.exceptions.TooManyConnectionsError,
+    ))
+
+
+class PartialWrite(Exception):
+    """逐条写入时部分记录失败（其余记录已写入，整批重放时重新 upsert）"""
+
+    def __init__(self, failed, total, error):
+        super().__init__(f"{failed}/{total} 条记录写入失败: {error}")
+        self.failed = failed
+        self.total = total
+
+
+class _Entry:
+    def __init__(self, row):
+        self.id, self.writer, self.label, payload, self.rows, self.created, self.attempts, self.source = row
+        self.payload = json.loads(payload, object_hook=_decode)
+
+
+class WriteSpool:
+    """进程内共享的数据库写入队列"""
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._task = None
+        self._wake = None
+        self._flush_lock = None
+        self._loop = None
+        self.unreachable_since = None
+        self.written_batches = 0
+        self.written_rows = 0
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+        self.failures = 0
+        self.dead = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    # ---------- 本地队列 ----------
+
+    def _db(self):
+        if self._conn is None:
+            try:
+                os.makedirs(self.path.parent, exist_ok=True)
+                conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=FULL")
+            except sqlite3.Error as e:
+                logger.error(f"❌ 打开本地写入队列失败，本次运行只在内存中排队（进程退出前未写入的数据会丢失）: {e}")
+                conn = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+            conn.executescript(SCHEMA)
+            # 旧版本创建的队列文件没有 source 列（其中的批次不参与按数据源排序）
+            if "source" not in {row[1] for row in conn.execute("PRAGMA table_info(spool)")}:
+                conn.execute("ALTER TABLE spool ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+            conn.execute("CREATE INDEX IF NOT EXISTS spool_source ON spool (source, status, id)")
+            self._conn = conn
+        return self._conn
+
+    def write(self, writer, payload, rows=1, label="", source=""):
+        """
+        把一批记录写入本地队列（落盘后返回），由后台刷新任务写入数据库
+
+        Args:
+            writer: 已注册的写入函数名
+            payload: 可 JSON 序列化的数据（datetime / date 会被还原）
+            rows: 记录数（用于统计）
+            source: 数据源；同一数据源的批次按写入顺序写入（为空时不排序）
+        """
+        if writer not in _writers:
+            raise KeyError(f"未注册的写入函数: {writer}")
+        data = json.dumps(payload, ensure_ascii=False, default=_encode)
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO spool (writer, label, payload, rows, created, source) VALUES (?, ?, ?, ?, ?, ?)",
+                (writer, label, data, int(rows), time.time(), source),
+            )
+            self.written_batches += 1
+            self.written_rows += int(rows)
+        self._kick()
+
+    def executemany(self, sql, rows, label="", source=""):
+        """write() 的简写：一条 SQL 语句和参数列表（通用 "sql" 写入函数）"""
+        rows = [list(row) for row in rows]
+        if rows:
+            self.write("sql", {"statements": [[sql, rows]]}, rows=len(rows), label=label, source=source)
+
+    def _claim(self, limit):
+        """
+        按顺序取出可写入的批次并加租约（只取本进程注册了写入函数的批次）；
+        同一数据源前面还有不能写入的批次（退避中、被其他进程取走、本进程没有写入函数）时不取
+        """
+        names = list(_writers)
+        placeholders = ",".join("?" * len(names))
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    f"SELECT id, writer, label, payload, rows, created, attempts, source FROM spool AS s "
+                    f"WHERE status = ? AND not_before <= ? AND writer IN ({placeholders}) "
+                    f"AND NOT EXISTS (SELECT 1 FROM spool AS e WHERE e.source = s.source AND e.source != '' "
+                    f"AND e.status = ? AND e.id < s.id AND (e.not_before > ? OR e.writer NOT IN ({placeholders}))) "
+                    f"ORDER BY id LIMIT ?",
+                    (PENDING, now, *names, PENDING, now, *names, limit),
+                ).fetchall()
+                conn.executemany("UPDATE spool SET not_before = ? WHERE id = ?",
+                                 [(now + LEASE_SECONDS, row[0]) for row in rows])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return [_Entry(row) for row in rows]
+
+    def _release(self, entries):
+        with self._lock:
+            self._db().executemany("UPDATE spool SET not_before = 0 WHERE id = ?", [(e.id,) for e in entries])
+
+    def _done(self, entry):
+        lag = time.time() - entry.created
+        with self._lock:
+            self._db().execute("DELETE FROM spool WHERE id = ?", (entry.id,))
+            self.flushed_batches += 1
+            self.flushed_rows += entry.rows
+            self.lag_total += lag
+            self.lag_max = max(self.lag_max, lag)
+
+    def _fail(self, entry, error):
+        attempts = entry.attempts + 1
+        dead = attempts >= SPOOL_MAX_ATTEMPTS
+        with self._lock:
+            self._db().execute(
+                "UPDATE spool SET attempts = ?, last_error = ?, not_before = ?, status = ? WHERE id = ?",
+                (attempts, str(error)[:500], time.time() + min(SPOOL_RETRY_MAX, 30 * 2 ** attempts),
+                 DEAD if dead else PENDING, entry.id),
+            )
+            self.failures += 1
+            self.dead += dead
+        label = f"{entry.writer}{f' {entry.label}' if entry.label else ''}"
+        if dead:
+            logger.error(f"❌ 写入队列: [{label}] 第 {attempts} 次写入失败，标记为死信（{self.path}）: {error}")
+        else:
+            logger.warning(f"⚠️ 写入队列: [{label}] 写入失败（第 {attempts} 次），稍后重试: {error}")
+
+    def pending(self):
+        """待写入的批次数、行数和最早一批的等待秒数（含其他数据源的遗留数据，不含死信）"""
+        with self._lock:
+            count, rows, oldest = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(rows), 0), MIN(created) FROM spool WHERE status = ?", (PENDING,)
+            ).fetchone()
+        return count, rows, (time.time() - oldest) if oldest else 0.0
+
+    # ---------- 写入数据库 ----------
+
+    async def flush(self):
+        """按顺序把队列中可写入的批次写入数据库；数据库不可达（含未配置、连接池创建失败）时返回 False"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while True:
+                entries = self._claim(SPOOL_FLUSH_BATCH)
+                if not entries:
+                    return True
+                try:
+                    pool = await db.get_pool()
+                except Exception as e:
+                    self._release(entries)
+                    self._mark_unreachable(e)
+                    return False
+                blocked = set()     # 本轮有批次失败的数据源：其后的批次放回队列，等失败的批次重试成功
+                for i, entry in enumerate(entries):
+                    if entry.source and entry.source in blocked:
+                        self._release([entry])
+                        continue
+                    try:
+                        async with pool.acquire() as conn:
+                            await _writers[entry.writer](conn, entry.payload)
+                    except Exception as e:
+                        if is_unreachable(e):
+                            self._release(entries[i:])
+                            self._mark_unreachable(e)
+                            return False
+                        self._fail(entry, e)
+                        blocked.add(entry.source)
+                        continue
+                    except BaseException:
+                        self._release(entries[i:])
+                        raise
+                    self._done(entry)
+                if self.unreachable_since is not None:
+                    logger.info(f"✓ 写入队列: 数据库已恢复（中断 {time.time() - self.unreachable_since:.0f}s）")
+                    self.unreachable_since = None
+
+    def _mark_unreachable(self, error):
+        if self.unreachable_since is None:
+            self.unreachable_since = time.time()
+            logger.warning(f"⚠️ 写入队列: 数据库不可达，数据保留在本地队列中稍后写入: {error}")
+
+    async def drain(self, timeout=SPOOL_DRAIN_TIMEOUT):
+        """在 timeout 秒（不超过运行的最终截止时间）内尽量写完队列，超时或数据库不可达时返回 False"""
+        timeout = min(timeout, deadline.current().remaining(final=True))
+        if timeout <= 0:
+            return False
+        try:
+            return await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ 写入队列: {timeout:.0f}s 内未写完，剩余数据留在本地队列中")
+            return False
+
+    def _kick(self):
+        """唤醒（必要时启动）当前事件循环中的后台刷新任务；没有事件循环时等下次运行写入"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._flush_lock = None
+            self._task = loop.create_task(self._run())
+            db.on_close(self.close)
+        self._wake.set()
+
+    async def _run(self):
+        delay = SPOOL_FLUSH_INTERVAL
+        while True:
+            if self.unreachable_since is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), SPOOL_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # 数据库不可达：按退避间隔重试，新的写入不提前唤醒
+                await asyncio.sleep(delay)
+            self._wake.clear()
+            try:
+                drained = await self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ 写入队列: 后台刷新出错: {e}")
+                drained = False
+            delay = SPOOL_FLUSH_INTERVAL if drained else min(SPOOL_RETRY_MAX, delay * 2)
+
+    async def close(self):
+        """停止后台刷新，在截止时间内最后写一次（db.close_pool 之前调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self.drain()
+        logger.info(f"🗄️ {self.summary()}")
+
+    def summary(self):
+        count, rows, oldest = self.pending()
+        text = f"写入队列: 本次入队 {self.written_batches} 批（{self.written_rows} 行），" \
+               f"已写入数据库 {self.flushed_batches} 批（{self.flushed_rows} 行）"
+        if self.flushed_batches:
+            text += f"，延迟平均 {self.lag_total / self.flushed_batches:.1f}s / 最大 {self.lag_max:.1f}s"
+        text += f"；待写入 {count} 批（{rows} 行"
+        text += f"，最早 {oldest:.0f}s 前）" if count else "）"
+        if self.failures:
+            text += f"，失败 {self.failures} 次"
+        if self.dead:
+            text += f"，死信 {self.dead} 批"
+        return text
+
+
+writer = WriteSpool()
@@ -0,0 +1,199 @@
+"""
+当日帖子话题聚类（不依赖向量模型）
+报告原来只按板块平铺帖子，帖子一多就很难看出「今天大家在聊什么」。
+AI 分析完成后，在本地按话题把当天的帖子聚成若干组：
+
+- 文本: 标题（含中文标题）+ core_issue + key_info
+- 特征: NFKC、小写后的字符 2-3 gram，TF 取 1+log(tf)，乘以当天帖子的 IDF 后 L2 归一化；
+  只在一篇帖子中出现的特征对帖子间相似度没有贡献，归一化后即丢弃，剩下的列很少，可以直接用稠密矩阵
+- 相似度: 余弦相似度（归一化后的矩阵乘法）
+- 聚类: 平均连接的层次聚类，最相似的两组相似度低于 TOPIC_CLUSTER_THRESHOLD 时停止；
+  少于 TOPIC_MIN_CLUSTER_SIZE 篇的组归入「其他话题」（cluster_id 为 0）
+- 标签: 组内与其他帖子平均相似度最高的帖子（medoid）的标题
+
+两百篇帖子的特征提取和聚类在几十毫秒内完成。结果写入 post['cluster_id'] / post['cluster_label']，
+由各数据源写入 JSON 报告，save() 经写入队列（common.spool）写回数据库的 topic_cluster / topic_label 列。
+
+环境变量:
+- TOPIC_CLUSTER_ENABLED: 是否启用话题聚类（默认 true）
+- TOPIC_CLUSTER_THRESHOLD: 合并两组帖子的最低平均余弦相似度（默认 0.15）
+- TOPIC_MIN_CLUSTER_SIZE: 单独成组的最少帖子数（默认 2）
+"""
+
+import logging
+import os
+import re
+import time
+import unicodedata
+
+import asyncpg
+import numpy as np
+
+from common import spool
+from common.seen_index import SOURCE_TABLES
+
+logger = logging.getLogger(__name__)
+
+TOPIC_CLUSTER_ENABLED = os.getenv("TOPIC_CLUSTER_ENABLED", "true").lower() == "true"
+TOPIC_CLUSTER_THRESHOLD = float(os.getenv("TOPIC_CLUSTER_THRESHOLD", "0.15"))
+TOPIC_MIN_CLUSTER_SIZE = int(os.getenv("TOPIC_MIN_CLUSTER_SIZE", "2"))
+
+NGRAM_SIZES = (2, 3)
+LABEL_LENGTH = 40
+OTHER_CLUSTER_ID = 0
+OTHER_LABEL = "其他话题"
+
+_URL_RE = re.compile(r"https?://\S+")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def post_text(post):
+    """参与聚类的文本：标题（含中文标题）+ 核心议题 + 关键信息"""
+    analysis = post.get("analysis") or {}
+    key_info = analysis.get("key_info") or []
+    parts = [post.get("title") or "", post.get("title_cn") or analysis.get("title_cn") or "",
+             analysis.get("core_issue") or ""]
+    parts.extend(str(item) for item in key_info if item)
+    return " ".join(parts)
+
+
+def _ngrams(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _NON_WORD_RE.sub(" ", _URL_RE.sub(" ", text)).strip()
+    return [text[i:i + size] for size in NGRAM_SIZES for i in range(len(text) - size + 1)
+            if " " not in text[i:i + size]]
+
+
+def tfidf_matrix(texts):
+    """
+    文本 -> L2 归一化的 TF-IDF 稠密矩阵（只保留至少两篇帖子共有的特征列）
+
+    Returns:
+        np.ndarray: (帖子数, 特征数)，float32
+    """
+    vocabulary = {}
+    rows = []
+    for text in texts:
+        ids = np.fromiter((vocabulary.setdefault(gram, len(vocabulary)) for gram in _ngrams(text)), dtype=np.int64)
+        rows.append(np.unique(ids, return_counts=True))
+
+    n = len(texts)
+    lengths = np.array([len(cols) for cols, _ in rows], dtype=np.int64)
+    if not lengths.sum():
+        return np.zeros((n, 0), dtype=np.float32)
+    row_of = np.repeat(np.arange(n), lengths)
+    cols = np.concatenate([cols for cols, _ in rows])
+    counts = np.concatenate([counts for _, counts in rows]).astype(np.float32)
+
+    df = np.bincount(cols, minlength=len(vocabulary))
+    idf = np.log((1 + n) / (1 + df)) + 1
+    vals = (1 + np.log(counts)) * idf[cols]
+    norms = np.sqrt(np.bincount(row_of, weights=vals * vals, minlength=n))
+    vals /= np.where(norms > 0, norms, 1.0)[row_of]
+
+    shared = df[cols] >= 2
+    kept, compact = np.unique(cols[shared], return_inverse=True)
+    matrix = np.zeros((n, len(kept)), dtype=np.float32)
+    matrix[row_of[shared], compact] = vals[shared]
+    return matrix
+
+
+def agglomerate(similarity, threshold=TOPIC_CLUSTER_THRESHOLD):
+    """
+    平均连接层次聚类（Lance-Williams 更新），最相似的两组低于 threshold 时停止
+
+    Returns:
+        [[帖子下标]]，按组大小降序
+    """
+    n = len(similarity)
+    S = similarity.astype(np.float64, copy=True)
+    np.fill_diagonal(S, -np.inf)
+    sizes = np.ones(n)
+    members = [[i] for i in range(n)]
+    while n > 1:
+        a, b = divmod(int(np.argmax(S)), n)
+        if S[a, b] < threshold:
+            break
+        merged = (sizes[a] * S[a] + sizes[b] * S[b]) / (sizes[a] + sizes[b])
+        S[a, :] = merged
+        S[:, a] = merged
+        S[a, a] = -np.inf
+        S[b, :] = -np.inf
+        S[:, b] = -np.inf
+        sizes[a] += sizes[b]
+        members[a].extend(members[b])
+        members[b] = []
+    return sorted((group for group in members if group), key=len, reverse=True)
+
+
+def _medoid(group, similarity):
+    if len(group) == 1:
+        return group[0]
+    block = similarity[np.ix_(group, group)]
+    return group[int(np.argmax(block.sum(axis=1)))]
+
+
+def _label(post):
+    title = post.get("title_cn") or (post.get("analysis") or {}).get("title_cn") or post.get("title") or ""
+    return title[:LABEL_LENGTH]
+
+
+def annotate(posts, source="", threshold=TOPIC_CLUSTER_THRESHOLD, min_size=TOPIC_MIN_CLUSTER_SIZE):
+    """
+    为帖子写入 cluster_id / cluster_label（1 开始，按组大小编号；零散帖子为 0「其他话题」）
+
+    Returns:
+        [(cluster_id, cluster_label, [post])]，按编号排序，「其他话题」在最后
+    """
+    if not TOPIC_CLUSTER_ENABLED or not posts:
+        return []
+    started = time.perf_counter()
+    matrix = tfidf_matrix([post_text(post) for post in posts])
+    similarity = matrix @ matrix.T
+    groups = agglomerate(similarity, threshold)
+
+    clusters = []
+    others = []
+    for group in groups:
+        if len(group) < min_size:
+            others.extend(group)
+            continue
+        cluster_id = len(clusters) + 1
+        label = _label(posts[_medoid(group, similarity)])
+        clusters.append((cluster_id, label, [posts[i] for i in sorted(group)]))
+    if others:
+        clusters.append((OTHER_CLUSTER_ID, OTHER_LABEL, [posts[i] for i in sorted(others)]))
+    for cluster_id, label, members in clusters:
+        for post in members:
+            post["cluster_id"] = cluster_id
+            post["cluster_label"] = label
+
+    elapsed = (time.perf_counter() - started) * 1000
+    grouped = sum(len(members) for cluster_id, _, members in clusters if cluster_id != OTHER_CLUSTER_ID)
+    logger.info(f"🗂️ {'[' + source + '] ' if source else ''}话题聚类: {len(posts)} 篇帖子聚成 "
+                f"{len(clusters) - (1 if others else 0)} 个话题（覆盖 {grouped} 篇，"
+                f"其他 {len(others)} 篇，特征 {matrix.shape[1]} 维，{elapsed:.0f} ms）")
+    return clusters
+
+
+@spool.register("topic_cluster")
+async def _write_clusters(conn, payload):
+    try:
+        await conn.executemany(
+            f"UPDATE {SOURCE_TABLES[payload['source']]} SET topic_cluster = $2, topic_label = $3 WHERE id = $1",
+            [tuple(row) for row in payload["rows"]],
+        )
+    except asyncpg.exceptions.UndefinedColumnError as e:
+        # 表未迁移时重试也不会成功，只记录警告
+        logger.warning(f"⚠️ [{payload['source']}] 保存话题聚类失败（表未迁移）: {e}")
+
+
+async def save(posts, source):
+    """把 cluster_id / cluster_label 提交到写入队列（表未迁移时只记录警告）"""
+    rows = [(str(post["id"]), post["cluster_id"], post["cluster_label"])
+            for post in posts if "cluster_id" in post]
+    if not rows:
+        return
+    spool.writer.write("topic_cluster", {"source": source, "rows": rows}, rows=len(rows),
+                       label=f"{source} 话题聚类", source=source)
+    logger.info(f"✓ [{source}] 已提交 {len(rows)} 篇帖子的话题聚类到写入队列")
@@ -0,0 +1,154 @@
+"""
+标题翻译缓存与批量翻译
+Reddit 原来在每篇帖子的深度分析里顺带生成 title_cn，分析失败时只能退回截断的英文标题，
+同一标题隔天再出现也要重新翻译。这里把标题翻译独立出来：
+
+- 缓存: title_translations 表，键为原文（逐字相同才命中），跨天、跨运行复用；
+  每次运行一条查询载入本批标题的已有译文，新译文经写入队列（common.spool）写回
+- 批量: 未命中的标题按 TRANSLATE_BATCH_SIZE 条一组，一次请求翻译一组（编号 JSON 数组进出），
+  各组并发提交（受 DeepSeek 速率预算限制）
+- 已经是中文的标题不翻译；某一组失败或编号对不上时，该组标题本次保留原文，不写入缓存
+- 输出被截断、只能部分恢复时，最后一条可能只写了一半（补齐引号后看起来是完整的译文），
+  丢弃最后一条，只采用之前的完整条目，丢弃的标题本次保留原文
+
+环境变量:
+- TRANSLATE_BATCH_SIZE: 每次请求翻译的标题数（默认 40）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+
+from common import db, deepseek, llm_json, prompts, spool
+
+logger = logging.getLogger(__name__)
+
+TRANSLATE_BATCH_SIZE = int(os.getenv("TRANSLATE_BATCH_SIZE", "40"))
+
+# 每条译文（含编号和 JSON 结构）预留的输出 token
+OUTPUT_TOKENS_PER_TITLE = 60
+
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+
+TRANSLATE_PROMPT = prompts.StaticPrompt("title-translate", """
+你是专业的科技与游戏开发领域译者。用户消息是一个 JSON 数组，每一项是 [编号, 英文标题]。
+请把每个标题翻译成简洁、自然的简体中文：专有名词、产品名、公司名保留原文，不要添加解释。
+
+**请严格按JSON格式输出（不要包含```json```标记）**，与输入一一对应、顺序相同：
+[[编号, "中文标题"], ...]
+""")
+
+
+def needs_translation(text):
+    """已经以中文为主的标题不需要翻译"""
+    if not text or not text.strip():
+        return False
+    return len(_CJK_RE.findall(text)) * 2 < len(text.strip())
+
+
+def _parse_batch(items, batch, partial=False):
+    """校验 [[编号, 译文]]，格式或编号不对时返回 None；partial（截断后补齐）时丢弃可能不完整的最后一条"""
+    if not isinstance(items, list):
+        return None
+    if partial:
+        items = items[:-1]
+    translations = {}
+    for item in items:
+        if not isinstance(item, list) or len(item) != 2:
+            return None
+        number, text = item
+        if not isinstance(number, int) or not 0 <= number < len(batch):
+            return None
+        if str(text).strip():
+            translations[batch[number]] = str(text).strip()
+    return translations
+
+
+class TitleTranslator:
+    """一次运行中的标题翻译（数据库缓存 + 批量请求）"""
+
+    def __init__(self, source, batch_size=TRANSLATE_BATCH_SIZE, api_key=None, proxies=None):
+        self.source = source
+        self.batch_size = max(1, batch_size)
+        self.api_key = api_key
+        self.proxies = proxies
+        self.cache = {}
+        self.hits = 0
+        self.translated = 0
+        self.failed = 0
+        self.requests = 0
+
+    async def _load(self, texts):
+        try:
+            pool = await db.get_pool()
+            rows = await pool.fetch(
+                "SELECT source_text, translated FROM title_translations WHERE source_text = ANY($1::text[])",
+                texts,
+            )
+            self.cache.update((row["source_text"], row["translated"]) for row in rows)
+        except Exception as e:
+            logger.warning(f"⚠️ [{self.source}] 读取标题翻译缓存失败，本次全部重新翻译: {e}")
+
+    def _save(self, translations):
+        if translations:
+            spool.writer.executemany("""
+                INSERT INTO title_translations (source_text, translated)
+                VALUES ($1, $2)
+                ON CONFLICT (source_text) DO NOTHING
+            """, list(translations.items()), label=f"{self.source} 标题翻译")
+
+    def _translate_batch(self, batch):
+        """同步调用：翻译一组标题，返回 {原文: 译文}，失败返回 {}"""
+        payload = json.dumps([[i, text] for i, text in enumerate(batch)], ensure_ascii=False)
+        try:
+            result = llm_json.complete_json(
+                TRANSLATE_PROMPT.messages(payload),
+                source=self.source,
+                max_tokens=OUTPUT_TOKENS_PER_TITLE * len(batch) + 100,
+                temperature=0.1,
+                timeout=60,
+                proxies=self.proxies,
+                api_key=self.api_key,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ [{self.source}] 批量翻译失败（{len(batch)} 条）: {e}")
+            return {}
+        translations = _parse_batch(result.data, batch, partial=result.outcome == llm_json.PARTIAL)
+        if translations is None:
+            logger.warning(f"⚠️ [{self.source}] 批量翻译结果与输入不一致（{len(batch)} 条），本次保留原文")
+            return {}
+        return translations
+
+    async def translate(self, texts):
+        """
+        翻译一批标题
+
+        Returns:
+            dict: {原文: 中文标题}；不需要翻译或翻译失败的标题映射为原文
+        """
+        unique = list(dict.fromkeys(text for text in texts if text))
+        pending = [text for text in unique if needs_translation(text)]
+        if pending:
+            await self._load(pending)
+        missing = [text for text in pending if text not in self.cache]
+        self.hits += len(pending) - len(missing)
+
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        self.requests += len(batches)
+        results = await asyncio.gather(*(deepseek.run_in_thread(self._translate_batch, batch) for batch in batches))
+        fresh = {}
+        for translations in results:
+            fresh.update(translations)
+        self.cache.update(fresh)
+        self.translated += len(fresh)
+        self.failed += len(missing) - len(fresh)
+        self._save(fresh)
+
+        logger.info(f"🈯 [{self.source}] 标题翻译: {self.summary()}")
+        return {text: self.cache.get(text, text) for text in unique}
+
+    def summary(self):
+        return (f"缓存命中 {self.hits}，新翻译 {self.translated}（{self.requests} 次请求），"
+                f"失败保留原文 {self.failed}")
@@ -0,0 +1,258 @@
+"""
+AI 分析分级（按互动热度分配 token 预算）
+完整的 500-800 字深度分析很贵，但热度最低的帖子多半会被评为「低」价值。
+分析前先按互动信号给帖子打分排序，再分档：
+
+- full: 排名前 TRIAGE_FULL_K 的帖子，使用完整的深度分析提示词
+- brief: 其后 TRIAGE_BRIEF_K 个帖子，只要一句话概括和关键信息的简要提示词
+- skip: 其余帖子不调用 AI，只入库基础信息（post_type 为「未分析」）
+
+互动信号: 回复数、参与者数、点赞数（帖子点赞 + 评论点赞）、评论速度（回复数 / 发布后小时数），
+各项取 log1p 后加权求和，避免单个爆帖的数值压过其他信号。
+本地预分类器（common.classifier）可用时，再加上 CLASSIFIER_WEIGHT × (P(高) - P(低))；
+预测为「低」价值且置信度不低于 CLASSIFIER_GATE_CONFIDENCE 的帖子降一档，
+不分析的帖子用预测的 post_type / value_assessment 预填。
+
+分档按预估 token 消耗装入单次运行的预算 AI_TOKEN_BUDGET 和今日剩余额度
+（common.cost_ledger，每个数据源每天的 token 预算和所有数据源每天的费用预算），放不下时逐级降档；
+各帖子在提交分析前（admit）复核剩余预算并预留预估消耗，调用返回后（charge）换成接口返回的实际 usage，
+没有调用就结束时（release）退回预留；并发提交的帖子因此不会都按同一份剩余预算放行，超出预算后剩余帖子同样降档。
+
+环境变量（均可加 _<SOURCE> 后缀单独配置，如 TRIAGE_FULL_K_HEYBOX）:
+- TRIAGE_FULL_K: 完整分析的帖子数（默认 10；reddit 原本全部完整分析，默认不限，只在预算不足时降档）
+- TRIAGE_BRIEF_K: 简要分析的帖子数（默认 10）
+- AI_TOKEN_BUDGET: 单次运行的 token 预算（默认 60000，0 表示不限）
+- CLASSIFIER_WEIGHT: 预分类价值分在排序中的权重（默认 2.0）
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+from common import classifier, cost_ledger
+
+logger = logging.getLogger(__name__)
+
+FULL, BRIEF, SKIP = "full", "brief", "skip"
+TIER_NAMES = {FULL: "完整分析", BRIEF: "简要分析", SKIP: "不分析"}
+
+# 未调用 AI 且没有预分类结果的帖子的 post_type
+UNANALYZED_TYPE = "未分析"
+
+# 各档提示词模板和输出的典型 token 数（用于预估，实际以接口 usage 为准）
+PROMPT_OVERHEAD = {FULL: 900, BRIEF: 250, SKIP: 0}
+OUTPUT_TOKENS = {FULL: 1200, BRIEF: 250, SKIP: 0}
+# 各档提示词中包含的正文长度和评论条数
+CONTENT_CHARS = {FULL: 800, BRIEF: 300, SKIP: 0}
+COMMENT_COUNT = {FULL: 10, BRIEF: 3, SKIP: 0}
+COMMENT_CHARS = {FULL: 150, BRIEF: 100, SKIP: 0}
+
+WEIGHTS = {
+    "replies": 1.0,
+    "participants": 1.5,
+    "likes": 0.5,
+    "velocity": 2.0,
+}
+
+CLASSIFIER_WEIGHT = float(os.getenv("CLASSIFIER_WEIGHT", "2.0"))
+
+# 各数据源 TRIAGE_FULL_K 的默认值（未列出的为 10）
+DEFAULT_FULL_K = {"reddit": math.inf}
+
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+
+
+def _env_int(name, source, default):
+    value = os.getenv(f"{name}_{source.upper()}", os.getenv(name))
+    return int(value) if value not in (None, "") else default
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：汉字约 0.6 token/字，其他字符约 0.3 token/字"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def engagement_signals(post, now=None):
+    """
+    从帖子数据中提取互动信号（字段在各数据源中不同，缺失的按 0 计）
+
+    - linux.do: replies_count / participants_count（RSS），comments[].likes（详情页），published（RSS pubDate）
+    - 小黑盒: likes_count / comments_count（首页列表），comments[].likes_count
+    - Reddit: num_comments / score（RSS）
+    """
+    comments = post.get("comments") or []
+    replies = max(int(post.get("replies_count") or 0), int(post.get("comments_count") or 0),
+                  int(post.get("num_comments") or 0), len(comments))
+    likes = int(post.get("likes_count") or 0) + max(0, int(post.get("score") or 0)) + sum(
+        int(c.get("likes") or c.get("likes_count") or 0) for c in comments
+    )
+    velocity = 0.0
+    published = post.get("published")
+    if published:
+        now = now if now is not None else time.time()
+        velocity = replies / max(1.0, (now - published) / 3600)
+    return {
+        "replies": replies,
+        "participants": int(post.get("participants_count") or 0),
+        "likes": likes,
+        "velocity": velocity,
+    }
+
+
+def engagement_score(post, now=None):
+    signals = engagement_signals(post, now)
+    return sum(weight * math.log1p(signals[name]) for name, weight in WEIGHTS.items())
+
+
+def estimate_cost(post, tier):
+    """预估某一档分析的 token 消耗（提示词模板 + 帖子内容 + 输出）"""
+    if tier == SKIP:
+        return 0
+    body = post.get("content") or post.get("summary") or ""
+    comments = sorted(post.get("comments") or [],
+                      key=lambda c: c.get("likes") or c.get("likes_count") or 0, reverse=True)
+    text = post.get("title", "") + body[:CONTENT_CHARS[tier]] + "".join(
+        (c.get("content") or "")[:COMMENT_CHARS[tier]] for c in comments[:COMMENT_COUNT[tier]]
+    )
+    return PROMPT_OVERHEAD[tier] + estimate_tokens(text) + OUTPUT_TOKENS[tier]
+
+
+def skipped_analysis(post):
+    """不调用 AI 的帖子使用的占位分析（有预分类结果时预填 post_type / value_assessment）"""
+    predicted = post.get("predicted") or {}
+    return {
+        "core_issue": (post.get("title") or "")[:100],
+        "key_info": [],
+        "post_type": predicted.get("post_type", (UNANALYZED_TYPE,))[0],
+        "value_assessment": predicted.get("value_assessment", ("低",))[0],
+        "detailed_analysis": "",
+        "analysis_tier": SKIP,
+    }
+
+
+def _demote(tier):
+    return {FULL: BRIEF, BRIEF: SKIP, SKIP: SKIP}[tier]
+
+
+class AnalysisBudget:
+    """一次运行中某个数据源的分级计划和 token 预算"""
+
+    def __init__(self, source, full_k=None, brief_k=None, token_budget=None):
+        self.source = source
+        self.full_k = full_k if full_k is not None else _env_int("TRIAGE_FULL_K", source,
+                                                                 DEFAULT_FULL_K.get(source, 10))
+        self.brief_k = brief_k if brief_k is not None else _env_int("TRIAGE_BRIEF_K", source, 10)
+        self.token_budget = token_budget if token_budget is not None else _env_int("AI_TOKEN_BUDGET", source, 60000)
+        self.spent = 0
+        self.reserved = 0
+        self._reservations = {}     # {id(post): 预留的预估 token 数}
+        self.calls = 0
+        self.counts = {FULL: 0, BRIEF: 0, SKIP: 0}
+        self.downgrades = 0
+        self.gated = 0
+        # 分析可能在多个线程中并发进行（并发由 DeepSeek 自适应窗口控制）
+        self._lock = threading.Lock()
+
+    def _remaining(self):
+        """本次运行剩余预算与今日剩余额度中较小者（扣除已预留、尚未结算的部分）"""
+        remaining = self.token_budget - self.spent if self.token_budget else math.inf
+        return min(remaining, cost_ledger.ledger.remaining_tokens(self.source)) - self.reserved
+
+    def _fit(self, post, tier, available):
+        """在可用预算内选出不高于 tier 的最高档"""
+        for candidate in (FULL, BRIEF, SKIP)[(FULL, BRIEF, SKIP).index(tier):]:
+            if estimate_cost(post, candidate) <= available:
+                return candidate
+        return SKIP
+
+    def plan(self, posts, now=None):
+        """
+        按互动热度排序并分档（写入 post['engagement_score'] / post['analysis_tier']）
+
+        Returns:
+            [(post, tier)]，按热度从高到低
+        """
+        now = now if now is not None else time.time()
+        model = classifier.get_classifier()
+        predictions = model.predict(posts, self.source) if model else [{} for _ in posts]
+        for post, predicted in zip(posts, predictions):
+            score = engagement_score(post, now) + CLASSIFIER_WEIGHT * predicted.get("value_score", 0.0)
+            post["engagement_score"] = round(score, 3)
+            if predicted:
+                post["predicted"] = predicted
+        ranked = sorted(posts, key=lambda p: p["engagement_score"], reverse=True)
+
+        available = self._remaining()
+        planned = []
+        for rank, post in enumerate(ranked):
+            tier = FULL if rank < self.full_k else BRIEF if rank < self.full_k + self.brief_k else SKIP
+            label, probability = (post.get("predicted") or {}).get("value_assessment", (None, 0.0))
+            if label == "低" and probability >= classifier.CLASSIFIER_GATE_CONFIDENCE and tier != SKIP:
+                tier = _demote(tier)
+                self.gated += 1
+            fitted = self._fit(post, tier, available)
+            if fitted != tier:
+                self.downgrades += 1
+            available -= estimate_cost(post, fitted)
+            post["analysis_tier"] = fitted
+            planned.append((post, fitted))
+
+        counts = {tier: sum(1 for _, t in planned if t == tier) for tier in (FULL, BRIEF, SKIP)}
+        budget = f"{self.token_budget} tokens" if self.token_budget else "不限"
+        daily = cost_ledger.ledger.remaining_tokens(self.source)
+        if daily != math.inf:
+            budget += f"，今日剩余 {int(daily)} tokens"
+        logger.info(f"📊 [{self.source}] 按热度分级: 完整分析 {counts[FULL]}，简要分析 {counts[BRIEF]}，"
+                    f"不分析 {counts[SKIP]}（预算 {budget}，因预算降档 {self.downgrades}，"
+                    f"预分类为低价值降档 {self.gated}）")
+        return planned
+
+    def admit(self, post, tier):
+        """调用前按实际剩余预算复核，必要时降档，并为这篇帖子预留预估消耗（charge / release 时结算）"""
+        with self._lock:
+            fitted = self._fit(post, tier, self._remaining())
+            cost = estimate_cost(post, fitted)
+            if cost:
+                self.reserved += cost - self._reservations.get(id(post), 0)
+                self._reservations[id(post)] = cost
+            if fitted != tier:
+                self.downgrades += 1
+            self.counts[fitted] += 1
+        if fitted != tier:
+            logger.info(f"  ⬇️ 预算不足，{TIER_NAMES[tier]} → {TIER_NAMES[fitted]}: {post.get('title', '')[:30]}")
+        post["analysis_tier"] = fitted
+        return fitted
+
+    def charge(self, usage=None, post=None, tier=None):
+        """记录一次调用的实际消耗（接口没有返回 usage 时按预估计），同时退回这篇帖子的预留"""
+        tokens = (usage or {}).get("total_tokens")
+        if tokens is None and post is not None and tier is not None:
+            tokens = estimate_cost(post, tier)
+        with self._lock:
+            if post is not None:
+                self.reserved -= self._reservations.pop(id(post), 0)
+            self.spent += int(tokens or 0)
+            self.calls += 1
+
+    def release(self, post):
+        """分析结束但没有结算（调用失败、被放弃）时退回预留"""
+        with self._lock:
+            self.reserved -= self._reservations.pop(id(post), 0)
+
+    def summary(self, posts=()):
+        """posts: 分析完成的帖子，用于统计预分类与 AI 结果的一致率（可选）"""
+        budget = f"/{self.token_budget}" if self.token_budget else ""
+        text = (f"[{self.source}] AI 调用 {self.calls} 次，消耗 {self.spent}{budget} tokens；"
+                f"完整 {self.counts[FULL]}，简要 {self.counts[BRIEF]}，不分析 {self.counts[SKIP]}，"
+                f"降档 {self.downgrades} 次")
+        for field in classifier.FIELDS:
+            agreement = classifier.agreement(posts, field)
+            if agreement:
+                text += f"；预分类 {field} 一致率 {agreement[0] * 100:.0f}%（{agreement[1]} 篇）"
+        return text
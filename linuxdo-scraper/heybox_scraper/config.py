@@ -24,7 +24,6 @@ RETRY_DELAY = 5
 # ========== DeepSeek AI配置 ==========
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
-AI_REQUEST_DELAY = 3  # AI请求间隔（秒）
 
 # ========== 数据库配置 ==========
 DATABASE_URL = os.getenv("DATABASE_URL", "")
@@ -36,38 +36,47 @@ __version__ = "v2.3.0-personalized"
 __update_date__ = "2025-01-11"
 
 import asyncio
-import os
+import sys
 import json
 import logging
 import time
 from datetime import datetime
+from pathlib import Path
 from typing import List, Dict, Any
 from playwright.async_api import async_playwright, Page
 # from playwright_stealth import stealth  # 已禁用：token认证已足够
-import asyncpg
 import re
 
 # 导入配置
 from config import (
     HEYBOX_TOKEN_ID, HEYBOX_USER_PKEY, HEYBOX_HOME_URL,
     POST_LIMIT, COMMENT_LIMIT, REQUEST_INTERVAL,
-    MAX_RETRIES, RETRY_DELAY, AI_REQUEST_DELAY,
-    DEEPSEEK_API_KEY, DEEPSEEK_API_URL,
-    DATABASE_URL, USE_PROXY, get_proxies, check_config
+    MAX_RETRIES, RETRY_DELAY,
+    DEEPSEEK_API_KEY,
+    USE_PROXY, get_proxies, check_config
 )
 
-# ========== 日志配置 ==========
-os.makedirs('logs', exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler('logs/heybox_scraper.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+# 公共模块（linuxdo-scraper/common）
+if str(SCRIPT_DIR.parent) not in sys.path:
+    sys.path.insert(0, str(SCRIPT_DIR.parent))
+from common import (
+    browser_lifecycle, capture, cost_ledger, db, deadline, deepseek, fetch_profile, html_extract,
+    llm_json, log_config, near_dup, prompts, seen_index, spool, topic_cluster, triage,
 )
+
+FETCH_PROFILE = fetch_profile.get_profile("heybox")  # 详情页请求过滤（图片/视频/字体/统计脚本）
+
+# ========== 日志配置 ==========
+# 后台线程写入文本日志和 JSON Lines，按大小 / 天滚动（common.log_config）
+log_config.setup(SCRIPT_DIR / 'logs' / 'heybox_scraper.log', '%(asctime)s [%(levelname)s] %(message)s', source="heybox")
 logger = logging.getLogger(__name__)
 
+def page_timeout(seconds: float, stage: str = "") -> float:
+    """页面操作的超时（毫秒）：不超过本次运行的剩余时间（common.deadline），剩余时间不足时抛出 DeadlineExceeded"""
+    return deadline.current().timeout(seconds, stage=stage) * 1000
+
 # ========== 浏览器初始化 ==========
 
 async def verify_login_status(page: Page) -> bool:
@@ -149,9 +158,10 @@ async def init_browser_with_token(page: Page, token: str, max_retries: int = 3):
     logger.info(f"🌐 访问首页: {HEYBOX_HOME_URL}")
     
     for attempt in range(max_retries):
+        started = time.monotonic()
         try:
             # 访问首页（首次访问时Cookie已在上下文创建时设置）
-            await page.goto(HEYBOX_HOME_URL, wait_until='networkidle', timeout=60000)
+            await page.goto(HEYBOX_HOME_URL, wait_until='networkidle', timeout=page_timeout(60, "个性化首页"))
             logger.info("  ✓ 页面加载完成")
             
             # 注入token和user_pkey（确保所有存储位置都有）
@@ -174,7 +184,7 @@ async def init_browser_with_token(page: Page, token: str, max_retries: int = 3):
             await asyncio.sleep(2)
             
             # 刷新页面使token生效，等待网络请求完成
-            await page.reload(wait_until='networkidle', timeout=60000)
+            await page.reload(wait_until='networkidle', timeout=page_timeout(60, "个性化首页"))
             logger.info("  ✓ 页面刷新，Token已激活")
             
             # 等待个性化内容加载（游戏推荐、关注内容等）
@@ -209,7 +219,7 @@ async def init_browser_with_token(page: Page, token: str, max_retries: int = 3):
                 logger.info("  ✅ 成功访问个性化首页（已登录状态）")
                 return True
             else:
-                if attempt < max_retries - 1:
+                if attempt < max_retries - 1 and deadline.current().can_retry(3, time.monotonic() - started):
                     logger.warning(f"  ⚠ 登录状态验证失败，重试 {attempt + 1}/{max_retries}")
                     await asyncio.sleep(3)
                     continue
@@ -219,7 +229,7 @@ async def init_browser_with_token(page: Page, token: str, max_retries: int = 3):
                     return False
             
         except Exception as e:
-            if attempt < max_retries - 1:
+            if attempt < max_retries - 1 and deadline.current().can_retry(3, time.monotonic() - started):
                 logger.warning(f"  ⚠ 初始化失败（尝试 {attempt + 1}/{max_retries}）: {e}")
                 await asyncio.sleep(3)
                 continue
@@ -360,14 +370,14 @@ async def extract_posts_from_page(page: Page, limit: int = POST_LIMIT, label: st
         logger.error(f"❌ 提取失败: {e}")
         return []
 
-async def extract_comments(page: Page, post_id: str, post_url: str) -> List[Dict]:
-    """提取帖子评论 - MCP调试验证版本"""
+async def extract_comments(page: Page, post_id: str, post_url: str, stats=None) -> List[Dict]:
+    """提取帖子评论 - MCP调试验证版本（stats: 可选的 FetchStats，记录页面传输字节数和就绪时间）"""
     logger.info(f"  💬 抓取评论: {post_id}")
     logger.info(f"     📍 URL: {post_url}")
     
     try:
         # 访问帖子详情页
-        await page.goto(post_url, wait_until='domcontentloaded', timeout=30000)
+        await page.goto(post_url, wait_until='domcontentloaded', timeout=page_timeout(30, "评论抓取"))
         
         # 确保Token和user_pkey在详情页也有效（防止cookie作用域问题）
         user_pkey = HEYBOX_USER_PKEY if HEYBOX_USER_PKEY else ""
@@ -385,8 +395,10 @@ async def extract_comments(page: Page, post_id: str, post_url: str) -> List[Dict
         """)
         
         # ⚠️ 关键：刷新页面使Token生效（MCP调试验证必须步骤）
-        await page.reload(wait_until='domcontentloaded')
+        await page.reload(wait_until='domcontentloaded', timeout=page_timeout(30, "评论抓取"))
         await asyncio.sleep(3)  # 等待评论加载
+        if stats is not None:
+            stats.record_page(await page.evaluate(fetch_profile.PAGE_STATS_JS))
         
         # 尝试滚动加载更多评论
         await page.evaluate("""
@@ -410,58 +422,25 @@ async def extract_comments(page: Page, post_id: str, post_url: str) -> List[Dict
         """)
         logger.info(f"     🔍 页面检测: 评论区={page_info['hasCommentSection']}, 评论项数={page_info['commentItemsCount']}")
         
-        # 提取评论数据 - 通用方法（不依赖具体class）
-        comments_data = await page.evaluate(f"""
-            () => {{
-                const comments = [];
-                const limit = {COMMENT_LIMIT};
-                
-                // 找所有用户链接（评论必有作者链接）
-                const allLinks = document.querySelectorAll('a[href*="/app/user/profile/"]');
-                const processedContainers = new Set();
-                
-                for (const link of allLinks) {{
-                    if (comments.length >= limit) break;
-                    
-                    // 找最近的评论容器
-                    let container = link.closest('div[class*="comment"]') || link.parentElement?.parentElement;
-                    if (!container || processedContainers.has(container)) continue;
-                    processedContainers.add(container);
-                    
-                    // 提取作者
-                    const author = link.textContent.trim().split('\\n')[0].replace(/作者|Lv\\.\\d+/g, '').trim();
-                    
-                    // 提取评论内容（找最长文本）
-                    let content = '';
-                    const textDivs = container.querySelectorAll('div, p, span');
-                    for (const div of textDivs) {{
-                        const text = div.textContent.trim();
-                        if (text.length > Math.max(20, content.length) && 
-                            !text.includes('小时前') && !text.includes('天前') &&
-                            !text.includes('Lv.') && !text.includes('回复')) {{
-                            content = text.substring(0, 200);
-                        }}
-                    }}
-                    
-                    // 提取点赞数
-                    const buttons = Array.from(container.querySelectorAll('button'));
-                    const likeBtn = buttons.find(b => /^\\s*\\d+\\s*$/.test(b.textContent.trim()));
-                    const likes = likeBtn ? parseInt(likeBtn.textContent.trim()) : 0;
-                    
-                    if (author && content.length > 10) {{
-                        comments.push({{
-                            id: `comment_{post_id}_${{comments.length}}`,
-                            author: author,
-                            content: content,
-                            likes_count: likes,
-                            created_at: '最近'
-                        }});
-                    }}
-                }}
-                
-                return comments;
-            }}
-        """)
+        # 提取评论数据 - 通用方法（不依赖具体class）：规则见 common.html_extract.parse_heybox_comments，
+        # 页面 HTML 在线程中解析，与批量重新提取调试存档使用同一份规则
+        html = await page.content()
+        parsed = await asyncio.to_thread(html_extract.parse_heybox_comments, html, COMMENT_LIMIT)
+        comments_data = [
+            {
+                'id': f"comment_{post_id}_{i}",
+                'author': comment['author'],
+                'content': comment['content'],
+                'likes_count': comment['likes'],
+                'created_at': comment['time'],
+            }
+            for i, comment in enumerate(parsed)
+        ]
+        if not comments_data and page_info['commentItemsCount']:
+            # 有评论项却没有解析出评论：保存页面，规则修改后可用 python -m common.html_extract heybox 重新提取
+            debug_file = capture.store.capture(html, url=post_url, reason="小黑盒评论解析为空")
+            if debug_file:
+                logger.info(f"     📄 已保存页面HTML到: {debug_file}")
         
         logger.info(f"    ✓ 获取到 {len(comments_data)} 条评论")
         return comments_data
@@ -472,8 +451,51 @@ async def extract_comments(page: Page, post_id: str, post_url: str) -> List[Dict
 
 # ========== AI分析 ==========
 
-def analyze_with_ai(post: Dict, comments: List[Dict]) -> Dict:
-    """使用DeepSeek AI分析 - 对标Reddit的高质量分析"""
+# 静态前缀 + 帖子数据的布局见 common.prompts
+FULL_PROMPT = prompts.StaticPrompt("heybox-full", """
+你是专业的游戏社区内容分析专家，擅长分析小黑盒等游戏平台的帖子和社区讨论，包括游戏攻略、资讯、讨论和硬件评测。你的分析客观专业，注重实用价值。
+请分析用户消息中的帖子（含社区讨论），生成专业分析报告。
+
+**请严格按JSON格式输出（不要包含```json```标记）**：
+{
+  "title_cn": "中文优化标题（如果原标题已是中文，可优化使其更简洁专业；如果是英文或混杂，翻译为中文）",
+  "core_issue": "核心议题（一句话概括）",
+  "key_info": ["关键信息1", "关键信息2", "关键信息3"],
+  "post_type": "从[游戏攻略, 新闻资讯, 玩家讨论, 硬件评测, 问题求助, 资源分享, 视频内容, 其他]选一个",
+  "value_assessment": "从[高, 中, 低]选一个",
+  "detailed_analysis": "生成600-1200字专业分析，markdown格式，必须包含以下6个维度：\\n\\n## 🎮 内容背景\\n（介绍帖子的游戏/硬件背景、发布时机、社区关注度）\\n\\n## 💡 核心内容\\n（提炼帖子的主要信息、关键观点或攻略要点）\\n\\n## 🛠️ 实用价值\\n（分析对玩家的实际帮助、可操作性、适用场景）\\n\\n## 💬 社区反响\\n（基于评论分析玩家反馈、争议点、共识观点）\\n\\n## 📚 参考价值\\n（对其他玩家的借鉴意义、注意事项）\\n\\n## 🔮 趋势洞察\\n（相关游戏/硬件的发展趋势、潜在影响）"
+}
+
+**分析要求**：
+1. title_cn要简洁专业，去除emoji和过度修饰
+2. 核心议题要准确抓住帖子的本质
+3. key_info要提炼最有价值的3个关键点
+4. post_type要根据内容准确分类
+5. value_assessment要客观评估对玩家的价值
+6. detailed_analysis必须包含完整的6个维度，每个维度2-3句话
+""")
+
+# 简要分析：只要标题、概括、关键信息和分类，不生成长篇 detailed_analysis
+BRIEF_PROMPT = prompts.StaticPrompt("heybox-brief", """
+你是专业的游戏社区内容分析专家。请简要分析用户消息中的小黑盒帖子。
+
+**请严格按JSON格式输出（不要包含```json```标记）**：
+{
+  "title_cn": "简洁专业的中文标题",
+  "core_issue": "核心议题（一句话概括）",
+  "key_info": ["关键信息1", "关键信息2"],
+  "post_type": "从[游戏攻略, 新闻资讯, 玩家讨论, 硬件评测, 问题求助, 资源分享, 视频内容, 其他]选一个",
+  "value_assessment": "从[高, 中, 低]选一个",
+  "detailed_analysis": ""
+}
+""")
+
+def analyze_with_ai(post: Dict, comments: List[Dict], tier: str = triage.FULL, budget=None) -> Dict:
+    """
+    使用DeepSeek AI分析 - 对标Reddit的高质量分析
+
+    tier 为 triage.BRIEF 时使用简要提示词；budget（triage.AnalysisBudget）记录实际 token 消耗
+    """
     logger.info(f"  🤖 AI分析: {post['title'][:30]}...")
     
     if not DEEPSEEK_API_KEY:
@@ -486,10 +508,8 @@ def analyze_with_ai(post: Dict, comments: List[Dict]) -> Dict:
             'detailed_analysis': ''
         }
     
-    import requests
-    
     # 构建内容摘要
-    excerpt = post.get('summary', '')[:1000]
+    excerpt = post.get('summary', '')[:1000 if tier == triage.FULL else triage.CONTENT_CHARS[tier]]
     if not excerpt.strip():
         excerpt = "（无详细内容）"
     
@@ -515,76 +535,45 @@ def analyze_with_ai(post: Dict, comments: List[Dict]) -> Dict:
         else:
             logger.info(f"  ℹ 该帖子无评论")
     
-    # 构建高质量Prompt（对标Reddit，适配游戏社区）
-    prompt = f"""
-你是专业的游戏社区内容分析专家，擅长分析小黑盒等游戏平台的帖子和社区讨论。请分析以下帖子（含社区讨论），生成专业分析报告。
-
-**原始帖子信息**：
-- 标题: {post['title']}
-- 作者: {post['author']}
-- 游戏标签: {post.get('game_tag', '未知')}
-- 内容: {excerpt}{comment_section}
-- 互动数据: {post['likes_count']}赞 / {post['comments_count']}评论
-
-**请严格按JSON格式输出（不要包含```json```标记）**：
-{{
-  "title_cn": "中文优化标题（如果原标题已是中文，可优化使其更简洁专业；如果是英文或混杂，翻译为中文）",
-  "core_issue": "核心议题（一句话概括）",
-  "key_info": ["关键信息1", "关键信息2", "关键信息3"],
-  "post_type": "从[游戏攻略, 新闻资讯, 玩家讨论, 硬件评测, 问题求助, 资源分享, 视频内容, 其他]选一个",
-  "value_assessment": "从[高, 中, 低]选一个",
-  "detailed_analysis": "生成600-1200字专业分析，markdown格式，必须包含以下6个维度：\\n\\n## 🎮 内容背景\\n（介绍帖子的游戏/硬件背景、发布时机、社区关注度）\\n\\n## 💡 核心内容\\n（提炼帖子的主要信息、关键观点或攻略要点）\\n\\n## 🛠️ 实用价值\\n（分析对玩家的实际帮助、可操作性、适用场景）\\n\\n## 💬 社区反响\\n（基于评论分析玩家反馈、争议点、共识观点）\\n\\n## 📚 参考价值\\n（对其他玩家的借鉴意义、注意事项）\\n\\n## 🔮 趋势洞察\\n（相关游戏/硬件的发展趋势、潜在影响）"
-}}
-
-**分析要求**：
-1. title_cn要简洁专业，去除emoji和过度修饰
-2. 核心议题要准确抓住帖子的本质
-3. key_info要提炼最有价值的3个关键点
-4. post_type要根据内容准确分类
-5. value_assessment要客观评估对玩家的价值
-6. detailed_analysis必须包含完整的6个维度，每个维度2-3句话
-"""
+    # 构建高质量Prompt（对标Reddit，适配游戏社区）：静态前缀 + 帖子数据
+    static_prompt = BRIEF_PROMPT if tier == triage.BRIEF else FULL_PROMPT
+    fields = [("标题", post['title'])]
+    if tier == triage.FULL:
+        fields += [("作者", post['author']), ("游戏标签", post.get('game_tag', '未知'))]
+    fields += [
+        ("内容", excerpt),
+        ("互动数据", f"{post['likes_count']}赞 / {post['comments_count']}评论"),
+    ]
+    post_data = prompts.render_post(fields, comment_section, heading="原始帖子信息")
     
     # 调试日志
-    logger.debug(f"  → Prompt长度: {len(prompt)}字符, 评论区长度: {len(comment_section)}字符")
+    logger.debug(f"  → 帖子数据长度: {len(post_data)}字符, 评论区长度: {len(comment_section)}字符")
     
     try:
-        response = requests.post(
-            DEEPSEEK_API_URL,
-            headers={
-                "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "system", 
-                        "content": "你是专业的游戏社区内容分析专家，擅长分析游戏攻略、资讯、讨论和硬件评测。你的分析客观专业，注重实用价值。"
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                "temperature": 0.3,
-                "max_tokens": 2000
-            },
-            timeout=60
+        # 容错解析见 common.llm_json
+        result = llm_json.complete_json(
+            static_prompt.messages(post_data),
+            source="heybox",
+            required=("core_issue",),
+            max_tokens=2000 if tier == triage.FULL else 500,
+            temperature=0.3,
+            timeout=60,
+            api_key=DEEPSEEK_API_KEY,
+            low_priority=True,  # 见 common.deadline（降级）
         )
+        if budget is not None:
+            budget.charge(result.usage, post, tier)
         
-        if response.status_code == 200:
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                analysis = json.loads(json_match.group())
-                logger.info(f"    ✓ AI分析完成")
-                time.sleep(AI_REQUEST_DELAY)
-                return analysis
-        else:
-            logger.warning(f"    ✗ API返回错误: {response.status_code}")
+        if result.data is not None:
+            logger.info(f"    ✓ AI分析完成")
+            return result.data
+        logger.warning(f"    ✗ AI返回的内容无法解析: {result.text[:100]}")
                 
+    except (cost_ledger.BudgetExhausted, deadline.DeadlineExceeded) as e:
+        logger.warning(f"    ⚠️ {e}，该帖子不再调用AI")
+        return triage.skipped_analysis(post)
+    except deepseek.DeepSeekAPIError as e:
+        logger.warning(f"    ✗ API返回错误: {e.status_code}")
     except Exception as e:
         logger.warning(f"    ✗ AI分析失败: {e}")
     
@@ -600,25 +589,23 @@ def analyze_with_ai(post: Dict, comments: List[Dict]) -> Dict:
 
 # ========== 数据库存储 ==========
 
-async def save_to_database(posts_with_analysis: List[Dict]):
-    """保存到PostgreSQL"""
-    logger.info(f"\n💾 保存数据到数据库...")
-    
-    if not DATABASE_URL:
-        logger.error("❌ 未配置DATABASE_URL")
-        return False
-    
-    db_url = DATABASE_URL.split('?')[0] if '?' in DATABASE_URL else DATABASE_URL
-    
-    try:
-        conn = await asyncpg.connect(db_url)
-        logger.info("  ✓ 数据库连接成功")
-        
-        saved_posts = 0
-        saved_comments = 0
-        
-        for post in posts_with_analysis:
-            try:
+async def refresh_post_stats(posts: List[Dict]):
+    """已处理帖子只刷新点赞数和评论数（来自首页列表，不重新抓取评论和分析）"""
+    rows = [(post['id'], post['likes_count'], post['comments_count']) for post in posts]
+    spool.writer.executemany(
+        "UPDATE heybox_posts SET likes_count = $2, comments_count = $3 WHERE id = $1", rows, label="heybox 互动统计", source="heybox"
+    )
+    logger.info(f"✓ 已提交 {len(rows)} 个已处理帖子的互动统计到写入队列")
+
+@spool.register("heybox.posts")
+async def write_posts(conn, items: List[Dict]):
+    """写入队列的写入函数：每个帖子和其评论在同一事务中 upsert（重放安全）；有帖子失败时整批重试"""
+    saved_posts = 0
+    saved_comments = 0
+    last_error = None
+    for item in items:
+        try:
+            async with conn.transaction():
                 await conn.execute('''
                     INSERT INTO heybox_posts (
                         id, title, title_cn, url, author, cover_image,
@@ -627,53 +614,71 @@ async def save_to_database(posts_with_analysis: List[Dict]):
                         value_assessment, detailed_analysis, timestamp
                     ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15)
                     ON CONFLICT (id) DO UPDATE SET
-                        title_cn = $3,
-                        likes_count = $8,
-                        comments_count = $9,
-                        timestamp = $15
-                ''', 
-                    post['id'], post['title'], post['analysis'].get('title_cn', post['title']),
-                    post['url'], post.get('author'), None,
-                    post.get('summary', '')[:1000], post['likes_count'],
-                    post['comments_count'],
-                    post['analysis']['core_issue'],
-                    json.dumps(post['analysis']['key_info']),
-                    post['analysis']['post_type'],
-                    post['analysis']['value_assessment'],
-                    post['analysis']['detailed_analysis'],
-                    datetime.fromtimestamp(post.get('created_time', time.time()))
-                )
-                saved_posts += 1
-                
-                # 保存评论
-                for comment in post.get('comments', []):
-                    try:
-                        await conn.execute('''
-                            INSERT INTO heybox_comments (
-                                id, post_id, author, content, likes_count,
-                                created_at, parent_id, depth
-                            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                            ON CONFLICT (id) DO NOTHING
-                        ''',
-                            comment['id'], post['id'], comment.get('author', ''),
-                            comment.get('content', ''), comment.get('likes_count', 0),
-                            datetime.fromtimestamp(comment.get('created_time', time.time())),
-                            comment.get('parent_id'), comment.get('depth', 0)
-                        )
-                        saved_comments += 1
-                    except Exception as e:
-                        logger.warning(f"    保存评论失败: {e}")
-                        
-            except Exception as e:
-                logger.warning(f"    保存帖子失败 {post['id']}: {e}")
-        
-        await conn.close()
-        logger.info(f"✅ 数据保存完成: {saved_posts}个帖子, {saved_comments}条评论")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ 数据库操作失败: {e}")
-        return False
+                        title_cn = EXCLUDED.title_cn,
+                        content_summary = EXCLUDED.content_summary,
+                        likes_count = EXCLUDED.likes_count,
+                        comments_count = EXCLUDED.comments_count,
+                        core_issue = EXCLUDED.core_issue,
+                        key_info = EXCLUDED.key_info,
+                        post_type = EXCLUDED.post_type,
+                        value_assessment = EXCLUDED.value_assessment,
+                        detailed_analysis = EXCLUDED.detailed_analysis,
+                        timestamp = EXCLUDED.timestamp
+                ''', *item['post'])
+
+                # 保存评论（任何一条失败时帖子和评论一起回滚）
+                for comment in item['comments']:
+                    await conn.execute('''
+                        INSERT INTO heybox_comments (
+                            id, post_id, author, content, likes_count,
+                            created_at, parent_id, depth
+                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                        ON CONFLICT (id) DO NOTHING
+                    ''', *comment)
+            saved_posts += 1
+            saved_comments += len(item['comments'])
+
+        except Exception as e:
+            if spool.is_unreachable(e):
+                raise
+            logger.warning(f"    保存帖子失败 {item['post'][0]}: {e}")
+            last_error = e
+
+    logger.info(f"✅ 数据写入数据库: {saved_posts}个帖子, {saved_comments}条评论")
+    if last_error is not None:
+        raise spool.PartialWrite(len(items) - saved_posts, len(items), last_error)
+
+async def save_to_database(posts_with_analysis: List[Dict]):
+    """把帖子和评论提交到写入队列（落盘后返回，由后台写入PostgreSQL；数据库不可达时保留到下次运行）"""
+    items = []
+    for post in posts_with_analysis:
+        analysis = post['analysis']
+        items.append({
+            'post': [
+                post['id'], post['title'], analysis.get('title_cn', post['title']),
+                post['url'], post.get('author'), None,
+                post.get('summary', '')[:1000], post['likes_count'],
+                post['comments_count'],
+                analysis['core_issue'],
+                json.dumps(analysis['key_info']),
+                analysis['post_type'],
+                analysis['value_assessment'],
+                analysis['detailed_analysis'],
+                datetime.fromtimestamp(post.get('created_time', time.time())),
+            ],
+            'comments': [
+                [
+                    comment['id'], post['id'], comment.get('author', ''),
+                    comment.get('content', ''), comment.get('likes_count', 0),
+                    datetime.fromtimestamp(comment.get('created_time', time.time())),
+                    comment.get('parent_id'), comment.get('depth', 0),
+                ]
+                for comment in post.get('comments', [])
+            ],
+        })
+    spool.writer.write("heybox.posts", items, rows=len(items), label="heybox 帖子", source="heybox")
+    logger.info(f"\n💾 已提交 {len(items)} 个帖子（{sum(len(item['comments']) for item in items)} 条评论）到写入队列")
+    return True
 
 # ========== 主流程 ==========
 
@@ -684,6 +689,7 @@ async def main():
     logger.info(f"📦 版本: {__version__}")
     logger.info(f"🕐 更新时间: {__update_date__}")
     logger.info("=" * 80)
+    run_deadline = deadline.start("heybox")
     
     # 检查配置
     issues = check_config()
@@ -691,7 +697,7 @@ async def main():
         logger.error("\n配置问题：")
         for issue in issues:
             logger.error(f"  {issue}")
-        return
+        return False
     
     logger.info(f"\n配置信息：")
     logger.info(f"  - 目标帖子数: {POST_LIMIT}")
@@ -753,6 +759,10 @@ async def main():
             await context.add_cookies(cookies_to_add)
             logger.info(f"✓ Cookie已预先设置（{len(cookies_to_add)}个Cookie，确保首次请求携带认证）")
         
+        # 拦截图片、视频、字体和统计脚本（对该上下文中的所有页面生效）
+        fetch_stats = fetch_profile.FetchStats("heybox", enabled=FETCH_PROFILE.enabled)
+        await fetch_profile.apply_playwright(context, FETCH_PROFILE, fetch_stats)
+        
         page = await context.new_page()
         
         # 应用反爬虫stealth（已禁用：token认证已足够）
@@ -766,7 +776,7 @@ async def main():
         
         # 创建新页面，不设置Cookie，访问通用首页
         page_no_auth = await context.new_page()
-        await page_no_auth.goto(HEYBOX_HOME_URL, wait_until='networkidle', timeout=60000)
+        await page_no_auth.goto(HEYBOX_HOME_URL, wait_until='networkidle', timeout=page_timeout(60, "通用首页"))
         await asyncio.sleep(5)  # 等待内容加载
         
         # 提取通用首页的帖子
@@ -794,14 +804,14 @@ async def main():
         if not await init_browser_with_token(page, HEYBOX_TOKEN_ID):
             logger.error("❌ 初始化失败")
             await browser.close()
-            return
+            return False
         
         # 提取个性化首页的帖子
         posts = await extract_posts_from_page(page, POST_LIMIT, "个性化首页")
         if not posts:
             logger.error("❌ 未能提取帖子数据")
             await browser.close()
-            return
+            return False
         
         # ========== 对比分析 ==========
         logger.info("\n" + "="*80)
@@ -843,39 +853,103 @@ async def main():
         
         logger.info(f"\n第1步完成：提取到 {len(posts)} 个帖子\n")
         
+        # 先写入上次运行遗留在写入队列中的数据，再丢弃已处理的帖子（在抓取评论和AI分析之前）
+        await spool.writer.drain()
+        seen = await seen_index.SeenIndex.load("heybox")
+        posts, refresh_posts = seen.partition(posts)
+        if refresh_posts:
+            await refresh_post_stats(refresh_posts)
+        if not posts:
+            logger.info("✓ 首页帖子都已处理过，本次无需分析")
+            await browser.close()
+            return True
+        
+        # 近似重复检测：与历史帖子（含其他数据源）高度相似的帖子复用已有分析，不再抓取评论
+        signatures = await near_dup.SignatureIndex.load()
+        posts, duplicates = await signatures.resolve(posts, "heybox")
+        
+        # 按互动热度分级（首页列表已有点赞数和评论数），不分析的帖子也不抓取评论
+        budget = triage.AnalysisBudget("heybox")
+        plan = budget.plan(posts)
+        
+        # 首页已完成使命，详情页在可回收的页面中打开（同一上下文，Cookie 和存储共享）
+        await page.close()
+        recycler = browser_lifecycle.AsyncPageRecycler(context, "heybox")
+        
         # 提取评论
-        for i, post in enumerate(posts, 1):
-            logger.info(f"[{i}/{len(posts)}] 处理: {post['title'][:40]}")
-            
-            # 获取评论
-            comments = await extract_comments(page, post['id'], post['url'])
-            post['comments'] = comments
-            
-            await asyncio.sleep(REQUEST_INTERVAL)
+        try:
+            for i, post in enumerate(posts, 1):
+                if post['analysis_tier'] == triage.SKIP:
+                    continue
+                # 接近截止时间：剩余帖子不再抓取评论，仅基于标题和摘要分析
+                if run_deadline.should_shed():
+                    run_deadline.shed("评论抓取")
+                    post['comments'] = []
+                    continue
+                logger.info(f"[{i}/{len(posts)}] 处理: {post['title'][:40]}")
+                
+                # 获取评论
+                with log_config.bind(post_id=post['id'], stage="评论抓取"):
+                    detail_page = await recycler.get_page()
+                    comments = await extract_comments(detail_page, post['id'], post['url'], fetch_stats)
+                    post['comments'] = comments
+                    await recycler.after_navigation()
+                
+                await asyncio.sleep(REQUEST_INTERVAL)
+        finally:
+            await recycler.close()
         
+        logger.info(f"📶 {fetch_stats.summary()}")
+        logger.info(f"♻️ {recycler.summary()}")
         logger.info(f"\n第2步完成：获取评论\n")
         
-        # AI分析
+        # AI分析：同步HTTP调用放到 DeepSeek 线程池中并发提交，实际并发由自适应并发窗口控制
         logger.info("开始AI分析...")
-        for i, post in enumerate(posts, 1):
-            logger.info(f"[{i}/{len(posts)}] 分析: {post['title'][:40]}")
-            analysis = analyze_with_ai(post, post.get('comments', []))
+        async def analyze(i, post, tier):
+            with log_config.bind(post_id=post['id'], stage="AI分析"):
+                logger.info(f"[{i}/{len(plan)}] {triage.TIER_NAMES[tier]}: {post['title'][:40]}")
+                try:
+                    analysis = await deepseek.run_in_thread(analyze_with_ai, post, post.get('comments', []), tier, budget)
+                finally:
+                    budget.release(post)
+            analysis.setdefault('analysis_tier', tier)
             post['analysis'] = analysis
         
+        tasks = []
+        for i, (post, tier) in enumerate(plan, 1):
+            tier = budget.admit(post, tier)
+            if tier == triage.SKIP:
+                post['analysis'] = triage.skipped_analysis(post)
+            else:
+                tasks.append(analyze(i, post, tier))
+        await asyncio.gather(*tasks)
+        logger.info(f"📊 {budget.summary(posts)}")
+        logger.info(f"📊 {deepseek.cache_stats.summary('heybox')}")
+        logger.info(f"📊 {llm_json.stats.summary('heybox')}")
+        logger.info(f"🎚️ {deepseek.budget.window.summary()}")
+        cost_ledger.ledger.record_posts('heybox', len(posts))
+        logger.info(f"💰 {cost_ledger.ledger.summary('heybox')}")
+        
+        near_dup.fill_batch_duplicates(duplicates)
         logger.info(f"\n第3步完成：AI分析\n")
         
         # 保存数据库（对标Reddit - 仅数据库，不生成JSON文件）
-        await save_to_database(posts)
+        topic_cluster.annotate(posts + duplicates, "heybox")
+        await save_to_database(posts + duplicates)
+        await signatures.save(posts + duplicates, "heybox")
+        await topic_cluster.save(posts + duplicates, "heybox")
         
         logger.info(f"✅ 数据已存入数据库，前端将从数据库读取")
         
         # 关闭浏览器
         await browser.close()
     
+    logger.info(f"⏱️ {run_deadline.summary()}")
     logger.info("\n" + "=" * 80)
     logger.info("🎉 爬虫执行完成！")
     logger.info("=" * 80)
+    return True
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(db.run_and_close(main()))
 
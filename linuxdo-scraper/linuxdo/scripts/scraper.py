@@ -33,8 +33,15 @@ logger.info(f"--- 脚本已配置使用 HTTP 代理: {proxy_for_all} ---")
 # --- 配置 ---
 # 加载环境变量（从项目根目录）
 import pathlib
+import sys
 env_path = pathlib.Path(__file__).parent.parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
+
+# 公共模块（linuxdo-scraper/common）
+PACKAGE_ROOT = pathlib.Path(__file__).resolve().parents[2]
+if str(PACKAGE_ROOT) not in sys.path:
+    sys.path.insert(0, str(PACKAGE_ROOT))
+from common import cost_ledger, deepseek, fetch_profile, insights, topic_cluster, triage
 WARM_UP_URL = "https://linux.do/" 
 RSS_URL = "https://linux.do/latest.rss" 
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
@@ -98,44 +105,30 @@ def analyze_single_post_with_deepseek(post, retry_count=0):
         }}
         """
         
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 400,
-            "temperature": 0.3
-        }
-        
-        response = requests.post(
-            "https://api.deepseek.com/v1/chat/completions",
-            headers=headers,
-            json=data,
+        # 通过公共模块调用（共享速率预算，计入 token / 费用账本）
+        result = deepseek.chat_completion(
+            [{"role": "user", "content": prompt}],
+            source="linuxdo",
+            max_tokens=400,
+            temperature=0.3,
+            timeout=30,
             proxies={"http": proxy_for_all, "https": proxy_for_all},
-            timeout=30
+            api_key=DEEPSEEK_API_KEY,
         )
+        ai_response = deepseek.extract_content(result)
         
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result['choices'][0]['message']['content']
-            
-            # 尝试解析AI返回的文本为JSON
-            cleaned_text = ai_response.strip().replace("```json", "").replace("```", "").strip()
-            analysis_data = json.loads(cleaned_text)
-            logger.info(f"帖子 '{post['title'][:30]}...' AI分析成功")
-            return analysis_data
-        else:
-            logger.error(f"DeepSeek API调用失败: {response.status_code} - {response.text}")
-            return {
-                "error": f"DeepSeek API调用失败: {response.status_code}",
-                "core_issue": "API调用失败", "key_info": [], "post_type": "错误", "value_assessment": "低"
-            }
+        # 尝试解析AI返回的文本为JSON
+        cleaned_text = ai_response.strip().replace("```json", "").replace("```", "").strip()
+        analysis_data = json.loads(cleaned_text)
+        logger.info(f"帖子 '{post['title'][:30]}...' AI分析成功")
+        return analysis_data
         
+    except deepseek.DeepSeekAPIError as e:
+        logger.error(f"DeepSeek API调用失败: {e.status_code} - {e.text}")
+        return {
+            "error": f"DeepSeek API调用失败: {e.status_code}",
+            "core_issue": "API调用失败", "key_info": [], "post_type": "错误", "value_assessment": "低"
+        }
     except json.JSONDecodeError as e:
         logger.error(f"JSON解析失败! AI返回了非JSON格式的内容: '{ai_response[:100] if 'ai_response' in locals() else 'N/A'}...'")
         return {
@@ -190,6 +183,8 @@ async def fetch_linuxdo_posts_improved():
             
             stealth = Stealth()
             await stealth.apply_stealth_async(context)
+            # 只需要 RSS 文本：拦截图片、字体和统计脚本
+            await fetch_profile.apply_playwright(context, fetch_profile.get_profile("linuxdo"))
             page = await context.new_page()
 
             # 预热阶段
@@ -507,6 +502,13 @@ def generate_ai_summary_report(posts_data):
     processed_posts = [] 
     
     for i, post in enumerate(posts_data):
+        # 今日预算用完后，剩余帖子只保留基础信息，不再调用AI
+        if cost_ledger.ledger.remaining_tokens("linuxdo") <= 0:
+            logger.warning(f"今日AI预算已用完，第 {i+1}/{len(posts_data)} 篇起不再分析")
+            post['analysis'] = triage.skipped_analysis(post)
+            processed_posts.append(post)
+            continue
+
         logger.info(f"正在分析第 {i+1}/{len(posts_data)} 篇: {post['title']}")
         
         try:
@@ -527,6 +529,8 @@ def generate_ai_summary_report(posts_data):
             processed_posts.append(post)
             
     logger.info("--- 逐帖分析全部完成 ---\n")
+    cost_ledger.ledger.record_posts("linuxdo", len(processed_posts))
+    logger.info(f"💰 {cost_ledger.ledger.summary('linuxdo')}")
 
     # 生成整体洞察报告
     logger.info("--- 开始生成今日整体洞察报告 (JSON格式) ---")
@@ -546,74 +550,16 @@ def generate_ai_summary_report(posts_data):
             "conclusion": "请检查网络连接和API配置。"
         }
     else:
-        # 使用json.dumps来创建一个紧凑的字符串表示形式
-        all_summaries_text = json.dumps(summaries_for_prompt, ensure_ascii=False, indent=2)
-
-        overall_prompt = f"""
-        你是一名资深的论坛内容分析师。以下是今天论坛热门帖子的JSON格式摘要列表。
-        请根据这些信息，生成一份高度浓缩的中文"今日热点洞察"报告，并严格以指定的JSON格式返回。
-        你的回复必须是一个有效的JSON对象，不要包含任何解释性文字或Markdown的```json ```标记。
-
-        **今日帖子摘要合集 (JSON格式):**
-        {all_summaries_text}
-        ---
-        **请输出以下结构的JSON**:
-        {{
-          "overview": "用一两句话总结今天社区的整体氛围和讨论焦点。",
-          "highlights": {{
-            "tech_savvy": ["提炼1-3条最硬核的技术干货"],
-            "resources_deals": ["提炼1-3条最值得关注的优惠或资源分享"],
-            "hot_topics": ["提炼1-3个引发最广泛讨论的话题"]
-          }},
-          "conclusion": "用一句话对今天的内容做个风趣或深刻的总结。"
-        }}
-        """
-        
-        try:
-            headers = {
-                "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "user", "content": overall_prompt}
-                ],
-                "max_tokens": 800,
-                "temperature": 0.3
-            }
-            
-            response = requests.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                proxies={"http": proxy_for_all, "https": proxy_for_all},
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result['choices'][0]['message']['content']
-                cleaned_text = ai_response.strip().replace("```json", "").replace("```", "").strip()
-                summary_analysis = json.loads(cleaned_text)
-                logger.info("--- 整体洞察报告生成完毕 ---")
-            else:
-                logger.error(f"生成整体洞察报告失败: {response.status_code} - {response.text}")
-                summary_analysis = {
-                    "error": f"DeepSeek API调用失败: {response.status_code}",
-                    "overview": "今日AI总结生成失败，请查看日志。",
-                    "highlights": {},
-                    "conclusion": ""
-                }
-        except Exception as e:
-            logger.error(f"生成整体洞察报告失败: {e}")
-            summary_analysis = {
-                "error": f"AI生成整体报告失败: {e}",
-                "overview": "今日AI总结生成失败，请查看日志。",
-                "highlights": {},
-                "conclusion": ""
-            }
+        # 先按话题聚类，同一话题的帖子落在同一块里；再分层汇总（提示词长度不随帖子数增长）
+        topic_cluster.annotate(summaries_for_prompt, "linuxdo")
+        summarizer = insights.InsightSummarizer(
+            "linuxdo",
+            proxies={"http": proxy_for_all, "https": proxy_for_all},
+            api_key=DEEPSEEK_API_KEY,
+        )
+        summary_analysis = summarizer.summarize(summaries_for_prompt)
+        if 'error' not in summary_analysis:
+            logger.info("--- 整体洞察报告生成完毕 ---")
 
     return {
         "summary_analysis": summary_analysis,
@@ -7,18 +7,21 @@
 #   4. 运行: python scraper_optimized.py
 
 import asyncio
+import contextvars
 import os
 import re
+import sys
 import json
 import logging
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 from DrissionPage import ChromiumPage, ChromiumOptions
-from bs4 import BeautifulSoup
+import asyncpg
 import requests
 from dotenv import load_dotenv
 import xml.etree.ElementTree as ET
 import time
-import asyncpg
+from concurrent.futures import ThreadPoolExecutor
 
 # =============================================================================
 # 配置区域 - 根据你的环境修改
@@ -31,13 +34,22 @@ SCRAPER_ROOT = SCRIPT_DIR.parents[2]
 env_path = SCRAPER_ROOT / '.env'
 load_dotenv(dotenv_path=env_path)
 
+# 公共模块（linuxdo-scraper/common）
+PACKAGE_ROOT = SCRIPT_DIR.parents[1]
+if str(PACKAGE_ROOT) not in sys.path:
+    sys.path.insert(0, str(PACKAGE_ROOT))
+from common import (
+    browser_lifecycle, capture, comment_stats, cost_ledger, db, deadline, deepseek, executors,
+    fetch_profile, html_extract, llm_json, log_config, near_dup, prompts, seen_index, spool,
+    topic_cluster, triage,
+)
+
 # 代理配置（如果不需要代理，设置为 None）
 PROXY_URL = os.getenv("PROXY_URL", "http://127.0.0.1:10809")  # 默认代理地址
 USE_PROXY = PROXY_URL and PROXY_URL.lower() != "none"  # 是否使用代理
 
 # API配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 
 # 数据库配置
 NEON_DB_URL = os.getenv("DATABASE_URL")
@@ -45,11 +57,13 @@ NEON_DB_URL = os.getenv("DATABASE_URL")
 # 爬取配置
 WARM_UP_URL = "https://linux.do/"
 RSS_URL = "https://linux.do/latest.rss"
+DATA_DIR = SCRIPT_DIR.parent / "data"  # JSON报告目录（linuxdo/data）
 POST_COUNT_LIMIT = int(os.getenv("POST_COUNT_LIMIT", "30"))  # 爬取帖子数量
 
 # 评论抓取配置
 REQUEST_INTERVAL = 2  # 帖子间隔时间（秒）
 PAGE_LOAD_WAIT = 2  # 页面加载等待时间（秒）
+PAGE_LOAD_TIMEOUT = 30  # 页面加载超时（秒），不超过本次运行的剩余时间（RUN_TIME_BUDGET）
 COMMENT_SUMMARY_LENGTH = 150  # 评论摘要长度
 TOP_COMMENTS_LIMIT = 10  # 高赞评论数量限制
 
@@ -57,28 +71,20 @@ TOP_COMMENTS_LIMIT = 10  # 高赞评论数量限制
 MAX_RETRIES = 3
 RETRY_DELAY = 5
 
-# AI请求间隔（避免触发速率限制）
-AI_REQUEST_DELAY = 3
-
 # 浏览器配置
 HEADLESS = os.getenv("HEADLESS", "true").lower() == "true"  # 是否无头模式
 CF_CHALLENGE_TIMEOUT = int(os.getenv("CF_CHALLENGE_TIMEOUT", "90"))
 USER_DATA_DIR = os.getenv("USER_DATA_DIR")
 PROFILE_DIRECTORY = os.getenv("PROFILE_DIRECTORY")
 CHROME_PATH = os.getenv("CHROME_PATH")
+FETCH_PROFILE = fetch_profile.get_profile("linuxdo")  # 详情页请求过滤（图片/字体/统计脚本）
 
 # =============================================================================
 # 日志配置
 # =============================================================================
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler('scraper.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# 后台线程写入文本日志和 JSON Lines，按大小 / 天滚动（common.log_config）
+log_config.setup('scraper.log', '%(asctime)s [%(levelname)s] %(message)s', source="linuxdo")
 logger = logging.getLogger(__name__)
 
 # =============================================================================
@@ -119,7 +125,7 @@ def check_environment():
     # 检查配置
     logger.info(f"✓ 爬取数量: {POST_COUNT_LIMIT} 篇帖子")
     logger.info(f"✓ 浏览器模式: {'无头' if HEADLESS else '有界面'}")
-    logger.info(f"✓ AI请求间隔: {AI_REQUEST_DELAY} 秒")
+    logger.info(f"✓ AI并发: 自适应（初始 {deepseek.INITIAL_CONCURRENCY}，上限 {deepseek.MAX_CONCURRENCY}）")
     logger.info(f"✓ CF挑战等待: {CF_CHALLENGE_TIMEOUT} 秒")
     if CHROME_PATH:
         logger.info(f"✓ Chrome路径: {CHROME_PATH}")
@@ -155,6 +161,17 @@ def get_page_html(page):
         except Exception:
             return ""
 
+# 当前文档导航的 HTTP 状态码（Navigation Timing 的 responseStatus，Chromium 109+ 支持）
+NAVIGATION_STATUS_JS = "(performance.getEntriesByType('navigation')[0] || {}).responseStatus || null"
+
+def get_page_status(page):
+    """当前页面的 HTTP 状态码（调试存档用），取不到时返回 None"""
+    try:
+        status = page.run_js(NAVIGATION_STATUS_JS, as_expr=True)
+        return int(status) if status else None
+    except Exception:
+        return None
+
 def wait_for_cloudflare_challenge(page, timeout=30):
     """
     等待 Cloudflare 挑战完成
@@ -250,17 +267,29 @@ def build_browser_page():
     ]:
         _try_call(options, ["set_argument"], arg)
 
-    return ChromiumPage(options)
+    page = ChromiumPage(options)
+    fetch_profile.apply_cdp(page, FETCH_PROFILE)
+    return page
+
+def collect_page_stats(page, stats):
+    """记录当前页面的传输字节数和就绪时间"""
+    if stats is None:
+        return
+    try:
+        stats.record_page(page.run_js(fetch_profile.PAGE_STATS_JS, as_expr=True))
+    except Exception as e:
+        logger.debug(f"页面统计失败: {e}")
 
 # =============================================================================
 # 重试装饰器
 # =============================================================================
 
 def retry_on_failure(max_retries=3, delay=5):
-    """重试装饰器"""
+    """重试装饰器（剩余时间不够再完整执行一次时不再重试）"""
     def decorator(func):
         async def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
+                started = time.monotonic()
                 try:
                     return await func(*args, **kwargs)
                 except Exception as e:
@@ -268,6 +297,9 @@ def retry_on_failure(max_retries=3, delay=5):
                     if attempt == max_retries - 1:
                         logger.error(f"❌ 所有重试失败，函数 {func.__name__} 执行失败")
                         raise e
+                    if not deadline.current().can_retry(delay, time.monotonic() - started):
+                        logger.error(f"❌ 剩余时间不足以再次重试，函数 {func.__name__} 执行失败")
+                        raise e
                     logger.info(f"⏳ 等待 {delay} 秒后重试...")
                     await asyncio.sleep(delay)
             return None
@@ -278,14 +310,68 @@ def retry_on_failure(max_retries=3, delay=5):
 # AI分析函数
 # =============================================================================
 
-def analyze_single_post_with_deepseek(post):
-    """使用DeepSeek对单个帖子进行深度分析（包含真实评论）"""
+# 静态前缀 + 帖子数据的布局见 common.prompts
+FULL_PROMPT = prompts.StaticPrompt("linuxdo-full", """
+你是一名Linux.do社区观察员，擅长捕捉社区热点、资源分享和实用技巧。请基于**楼主内容和评论区真实讨论**，生成一份**轻快实用的分析报告**。帖子内容在用户消息中给出。
+
+**分析角色定位**：
+- 社区风向观察：基于真实评论分析讨论趋势、群体情绪
+- 实用资源挖掘：从帖子和评论中发现有价值的工具、教程、优惠、技巧
+- 接地气表达：通俗易懂，贴近用户实际需求
+- 快速获取要点：让读者3分钟了解核心内容和社区讨论
+
+**重要要求**：
+1. 语言轻快、口语化，避免过于学术
+2. 重点突出实用性和可操作性
+3. 讨论热度和情绪倾向**直接引用评论区统计的数字**，不要自行估算
+4. 提炼评论中的有价值观点和解决方案
+5. 返回格式必须是纯JSON，不要包含```json```标记
+
+**请严格按以下JSON格式输出**：
+{
+  "core_issue": "用一句话概括帖子的核心内容（口语化表达）",
+  "key_info": [
+    "关键信息点1（突出实用性）",
+    "关键信息点2（突出实用性）",
+    "关键信息点3（突出实用性）"
+  ],
+  "post_type": "从[技术问答, 资源分享, 新闻资讯, 优惠活动, 日常闲聊, 求助, 讨论, 产品评测]中选择一个",
+  "value_assessment": "从[高, 中, 低]中选择一个",
+  "detailed_analysis": "生成400-600字的轻快分析，包含以下内容（用markdown格式）：\\n\\n## 📋 话题背景\\n简要说明这个话题为什么火、为什么重要（2-3句话）\\n\\n## 🎯 核心内容\\n用通俗语言展开楼主帖子的主要内容，突出关键点和有用信息\\n\\n## 💡 实用技巧/资源（如适用）\\n**工具/资源**：从帖子和评论中提取的具体工具、网站、软件推荐\\n**操作方法**：简单的使用步骤或配置方法\\n**注意事项**：评论中提到的常见坑点和避免方法\\n\\n## 💬 社区风向（基于N条真实评论，N取评论区给出的条数）\\n**热度与情绪**：用一句话转述评论区统计（热度、支持/反对/中立占比），点明主要讨论方向\\n**热门观点**：总结高赞评论的核心观点（2-3条，注明点赞数）\\n**争议焦点**：评论区的主要分歧和不同看法（如有）\\n**实用建议**：评论中提供的解决方案或经验分享\\n\\n## 🔧 实用价值\\n**适用人群**：谁最需要这个信息\\n**使用场景**：什么时候能用上\\n**推荐理由**：为什么值得关注（结合评论反馈）\\n\\n## 🚀 一句话总结\\n用最简洁的话概括这个帖子的价值和社区共识"
+}
+""")
+
+# 简要分析：只要概括、关键信息和分类，不生成长篇 detailed_analysis
+BRIEF_PROMPT = prompts.StaticPrompt("linuxdo-brief", """
+你是一名Linux.do社区观察员。请用一句话概括用户消息中的帖子，并提炼关键信息。
+返回格式必须是纯JSON，不要包含```json```标记。
+
+**请严格按以下JSON格式输出**：
+{
+  "core_issue": "用一句话概括帖子的核心内容（口语化表达）",
+  "key_info": ["关键信息点1", "关键信息点2"],
+  "post_type": "从[技术问答, 资源分享, 新闻资讯, 优惠活动, 日常闲聊, 求助, 讨论, 产品评测]中选择一个",
+  "value_assessment": "从[高, 中, 低]中选择一个",
+  "detailed_analysis": ""
+}
+""")
+
+def analyze_single_post_with_deepseek(post, tier=triage.FULL, budget=None):
+    """
+    使用DeepSeek对单个帖子进行分析（包含真实评论）
+
+    Args:
+        post: 帖子数据
+        tier: triage.FULL 完整深度分析 / triage.BRIEF 简要分析
+        budget: triage.AnalysisBudget，记录实际 token 消耗（可选）
+    """
     try:
         # 清理楼主内容
         main_content = post.get('content', '')
         clean_content = re.sub(r'<.*?>', ' ', main_content)
         clean_content = re.sub(r'\s+', ' ', clean_content).strip()
-        excerpt = (clean_content[:800] + '...') if len(clean_content) > 800 else clean_content
+        excerpt_length = triage.CONTENT_CHARS[tier]
+        excerpt = (clean_content[:excerpt_length] + '...') if len(clean_content) > excerpt_length else clean_content
 
         if not excerpt or len(excerpt.strip()) < 10:
             logger.warning(f"⚠️ 帖子 '{post.get('title', 'N/A')}' 内容过短，跳过AI分析")
@@ -304,13 +390,15 @@ def analyze_single_post_with_deepseek(post):
         comment_count = len(comments)
         
         if comment_count > 0:
-            # 按点赞数排序，取前N条
-            top_comments = sorted(comments, key=lambda x: x.get('likes', 0), reverse=True)[:TOP_COMMENTS_LIMIT]
+            # 按点赞数排序，取前N条（简要分析只取前3条）
+            comments_limit = TOP_COMMENTS_LIMIT if tier == triage.FULL else triage.COMMENT_COUNT[tier]
+            summary_length = COMMENT_SUMMARY_LENGTH if tier == triage.FULL else triage.COMMENT_CHARS[tier]
+            top_comments = sorted(comments, key=lambda x: x.get('likes', 0), reverse=True)[:comments_limit]
             
             comments_summary = []
             for i, comment in enumerate(top_comments, 1):
                 author = comment.get('author', '匿名')
-                content = comment.get('content', '')[:COMMENT_SUMMARY_LENGTH]  # 限制长度
+                content = comment.get('content', '')[:summary_length]  # 限制长度
                 likes = comment.get('likes', 0)
                 comments_summary.append(f"{i}. [{author}] (👍{likes}): {content}...")
             
@@ -318,83 +406,42 @@ def analyze_single_post_with_deepseek(post):
 
 **评论区讨论** ({comment_count}条真实评论)：
 {chr(10).join(comments_summary)}
-"""
+{comment_stats.prompt_section(post.get('comment_stats'))}"""
         else:
             comments_section = "\n（暂无评论）"
 
-        # 构建AI分析提示词（社区风向观察版 + 真实评论整合）
-        prompt = f"""
-你是一名Linux.do社区观察员，擅长捕捉社区热点、资源分享和实用技巧。请基于**楼主内容和评论区真实讨论**，生成一份**轻快实用的分析报告**。
-
-**分析角色定位**：
-- 社区风向观察：基于真实评论分析讨论趋势、群体情绪
-- 实用资源挖掘：从帖子和评论中发现有价值的工具、教程、优惠、技巧
-- 接地气表达：通俗易懂，贴近用户实际需求
-- 快速获取要点：让读者3分钟了解核心内容和社区讨论
-
-**重要要求**：
-1. 语言轻快、口语化，避免过于学术
-2. 重点突出实用性和可操作性
-3. **基于真实评论**分析社区讨论热度和情绪（不是推测！）
-4. 提炼评论中的有价值观点和解决方案
-5. 返回格式必须是纯JSON，不要包含```json```标记
-
-**帖子内容**：
-- 标题: {post['title']}
-- 楼主内容: {excerpt}{comments_section}
-
-**请严格按以下JSON格式输出**：
-{{
-  "core_issue": "用一句话概括帖子的核心内容（口语化表达）",
-  "key_info": [
-    "关键信息点1（突出实用性）",
-    "关键信息点2（突出实用性）",
-    "关键信息点3（突出实用性）"
-  ],
-  "post_type": "从[技术问答, 资源分享, 新闻资讯, 优惠活动, 日常闲聊, 求助, 讨论, 产品评测]中选择一个",
-  "value_assessment": "从[高, 中, 低]中选择一个",
-  "detailed_analysis": "生成500-800字的轻快分析，包含以下内容（用markdown格式）：\\n\\n## 📋 话题背景\\n简要说明这个话题为什么火、为什么重要（2-3句话）\\n\\n## 🎯 核心内容\\n用通俗语言展开楼主帖子的主要内容，突出关键点和有用信息\\n\\n## 💡 实用技巧/资源（如适用）\\n**工具/资源**：从帖子和评论中提取的具体工具、网站、软件推荐\\n**操作方法**：简单的使用步骤或配置方法\\n**注意事项**：评论中提到的常见坑点和避免方法\\n\\n## 💬 社区风向（基于{comment_count}条真实评论）\\n**讨论热度**：评论数量和活跃度（高/中/低），主要讨论方向\\n**情绪倾向**：统计评论中支持/反对/中立的比例，引用典型观点\\n**热门观点**：总结高赞评论的核心观点（2-3条，注明点赞数）\\n**争议焦点**：评论区的主要分歧和不同看法（如有）\\n**实用建议**：评论中提供的解决方案或经验分享\\n\\n## 🔧 实用价值\\n**适用人群**：谁最需要这个信息\\n**使用场景**：什么时候能用上\\n**推荐理由**：为什么值得关注（结合评论反馈）\\n\\n## 🚀 一句话总结\\n用最简洁的话概括这个帖子的价值和社区共识"
-}}
-"""
-        
-        # 调用DeepSeek API
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 2000,
-            "temperature": 0.5
-        }
+        # 构建AI分析提示词（社区风向观察版 + 真实评论整合）：静态前缀 + 帖子数据
+        static_prompt = BRIEF_PROMPT if tier == triage.BRIEF else FULL_PROMPT
+        post_data = prompts.render_post(
+            [("标题", post['title']), ("楼主内容", excerpt)],
+            comments_section,
+        )
         
+        # 调用DeepSeek API（共享速率预算）
         proxies = {"http": PROXY_URL, "https": PROXY_URL} if USE_PROXY else None
         
-        response = requests.post(
-            DEEPSEEK_API_URL,
-            headers=headers,
-            json=data,
-            proxies=proxies,
-            timeout=90  # 增加超时时间，因为需要生成更长的深度分析
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            ai_response = result['choices'][0]['message']['content']
-            
-            # 解析JSON
-            cleaned_text = ai_response.strip().replace("```json", "").replace("```", "").strip()
-            analysis_data = json.loads(cleaned_text)
-            logger.info(f"✓ AI分析成功: {post['title'][:40]}...")
-            return analysis_data
-        else:
-            logger.error(f"❌ DeepSeek API调用失败: {response.status_code} - {response.text}")
+        try:
+            # 容错解析见 common.llm_json
+            result = llm_json.complete_json(
+                static_prompt.messages(post_data),
+                source="linuxdo",
+                required=("core_issue",),
+                max_tokens=2000 if tier == triage.FULL else 500,
+                temperature=0.5,
+                timeout=90,  # 增加超时时间，因为需要生成更长的深度分析
+                proxies=proxies,
+                api_key=DEEPSEEK_API_KEY,
+                low_priority=True,  # 见 common.deadline（降级）
+            )
+            if budget is not None:
+                budget.charge(result.usage, post, tier)
+        except (cost_ledger.BudgetExhausted, deadline.DeadlineExceeded) as e:
+            logger.warning(f"⚠️ {e}，该帖子不再调用AI")
+            return triage.skipped_analysis(post)
+        except deepseek.DeepSeekAPIError as e:
+            logger.error(f"❌ DeepSeek API调用失败: {e.status_code} - {e.text}")
             return {
-                "error": f"API调用失败: {response.status_code}",
+                "error": f"API调用失败: {e.status_code}",
                 "core_issue": "API调用失败", 
                 "key_info": [], 
                 "post_type": "错误", 
@@ -402,18 +449,21 @@ def analyze_single_post_with_deepseek(post):
                 "detailed_analysis": ""
             }
         
-    except json.JSONDecodeError as e:
-        ai_resp = locals().get('ai_response', 'N/A')
-        logger.error(f"❌ JSON解析失败! AI返回: '{ai_resp[:100] if ai_resp else 'N/A'}...'")
-        return {
-            "error": "AI返回了非JSON格式的内容", 
-            "raw_response": ai_resp[:200] if ai_resp else "N/A",
-            "core_issue": "AI分析失败", 
-            "key_info": [], 
-            "post_type": "错误", 
-            "value_assessment": "低",
-            "detailed_analysis": ""
-        }
+        if result.data is None:
+            ai_resp = result.text
+            logger.error(f"❌ JSON解析失败! AI返回: '{ai_resp[:100] if ai_resp else 'N/A'}...'")
+            return {
+                "error": "AI返回了非JSON格式的内容", 
+                "raw_response": ai_resp[:200] if ai_resp else "N/A",
+                "core_issue": "AI分析失败", 
+                "key_info": [], 
+                "post_type": "错误", 
+                "value_assessment": "低",
+                "detailed_analysis": ""
+            }
+        logger.info(f"✓ AI分析成功: {post['title'][:40]}...")
+        return result.data
+        
     except requests.exceptions.Timeout:
         logger.error(f"❌ DeepSeek API请求超时")
         return {
@@ -439,7 +489,7 @@ def analyze_single_post_with_deepseek(post):
 # 爬虫核心函数
 # =============================================================================
 
-async def fetch_post_replies(page, post_url, post_title):
+async def fetch_post_replies(page, post_url, post_title, browser, parser, stats=None):
     """
     访问帖子详情页并提取真实评论
 
@@ -447,84 +497,48 @@ async def fetch_post_replies(page, post_url, post_title):
         page: DrissionPage 页面对象
         post_url: 帖子URL
         post_title: 帖子标题（用于日志）
+        browser: 浏览器专用线程（TrackedExecutor），所有 DrissionPage 调用都在其中执行
+        parser: HTML 解析线程（TrackedExecutor）
+        stats: FetchStats，记录页面传输字节数和就绪时间（可选）
 
     Returns:
         dict: 包含楼主内容和评论列表的字典
     """
     try:
         logger.info(f"  ⏳ 访问帖子: {post_title[:40]}...")
-        page.get(post_url)
+        run_deadline = deadline.current()
+        await browser.run(page.get, post_url, timeout=run_deadline.timeout(PAGE_LOAD_TIMEOUT, stage="详情页"))
 
-        wait_for_cloudflare_challenge(page, timeout=CF_CHALLENGE_TIMEOUT)
+        await browser.run(wait_for_cloudflare_challenge, page, timeout=run_deadline.timeout(CF_CHALLENGE_TIMEOUT))
         await asyncio.sleep(3)
+        await browser.run(collect_page_stats, page, stats)
 
-        html = get_page_html(page)
-        soup = BeautifulSoup(html, "lxml")
-        posts_elements = soup.select(".topic-post")
+        html = await browser.run(get_page_html, page)
+        parsed = await parser.run(html_extract.parse_linuxdo_topic, html)
 
-        if not posts_elements:
+        if not parsed["posts_found"] or parsed["fallback"]:
             logger.warning("    ⚠️ 未找到.topic-post，额外等待5秒后重试...")
             await asyncio.sleep(5)
-            html = get_page_html(page)
-            soup = BeautifulSoup(html, "lxml")
-            posts_elements = soup.select(".topic-post")
-
-        if not posts_elements:
-            posts_elements = soup.select("article")
-            if not posts_elements:
-                logger.error("    ❌ 页面结构异常，无法找到帖子内容")
-                debug_file = f"../debug_page_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-                with open(debug_file, "w", encoding="utf-8") as f:
-                    f.write(html)
+            html = await browser.run(get_page_html, page)
+            parsed = await parser.run(html_extract.parse_linuxdo_topic, html)
+
+        if not parsed["posts_found"]:
+            logger.error("    ❌ 页面结构异常，无法找到帖子内容")
+            status = await browser.run(get_page_status, page)
+            debug_file = capture.store.capture(html, url=post_url, status=status, reason="详情页结构异常")
+            if debug_file:
                 logger.info(f"    📄 已保存页面HTML到: {debug_file}")
-                return None
+            return None
+        if parsed["fallback"]:
             logger.info("    ✓ 使用article标签作为备用")
 
-        logger.info(f"    ✅ 找到 {len(posts_elements)} 个帖子（1楼主 + {len(posts_elements)-1}评论）")
-
-        main_content = ""
-        main_post_elem = posts_elements[0]
-        content_elem = main_post_elem.select_one(".cooked")
-        if content_elem:
-            main_content = content_elem.get_text(strip=True)
-
-        comments = []
-        for i, reply_elem in enumerate(posts_elements[1:], start=1):
-            try:
-                author_elem = reply_elem.select_one(".username")
-                author = author_elem.get_text(strip=True) if author_elem else ""
-
-                content_elem = reply_elem.select_one(".cooked")
-                content = content_elem.get_text(strip=True) if content_elem else ""
-
-                likes = 0
-                likes_elem = reply_elem.select_one(".likes")
-                if likes_elem:
-                    likes_text = likes_elem.get_text(strip=True)
-                    likes = int("".join(filter(str.isdigit, likes_text)) or "0")
-
-                time_str = ""
-                time_elem = reply_elem.select_one(".post-date")
-                if time_elem:
-                    time_str = time_elem.get("title") or ""
-
-                if content:
-                    comments.append({
-                        "author": author,
-                        "content": content,
-                        "likes": likes,
-                        "time": time_str,
-                    })
-            except Exception as e:
-                logger.warning(f"      ⚠️ 提取评论{i}失败: {e}")
-                continue
-
-        logger.info(f"    ✅ 成功提取 {len(comments)} 条评论")
+        logger.info(f"    ✅ 找到 {parsed['posts_found']} 个帖子（1楼主 + {parsed['posts_found']-1}评论）")
+        logger.info(f"    ✅ 成功提取 {len(parsed['comments'])} 条评论")
 
         return {
-            "main_content": main_content,
-            "comments": comments,
-            "total_replies": len(comments),
+            "main_content": parsed["main_content"],
+            "comments": parsed["comments"],
+            "total_replies": len(parsed["comments"]),
         }
 
     except Exception as e:
@@ -532,22 +546,24 @@ async def fetch_post_replies(page, post_url, post_title):
         import traceback
         logger.error(f"    详细错误:\n{traceback.format_exc()}")
         try:
-            html = get_page_html(page)
-            debug_file = f"linuxdo/debug_page_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-            with open(debug_file, "w", encoding="utf-8") as f:
-                f.write(html)
-            logger.info(f"    📄 已保存页面HTML到: {debug_file}")
+            html = await browser.run(get_page_html, page)
+            status = await browser.run(get_page_status, page)
+            debug_file = capture.store.capture(html, url=post_url, status=status, reason=f"详情页访问失败: {e}")
+            if debug_file:
+                logger.info(f"    📄 已保存页面HTML到: {debug_file}")
         except Exception:
             pass
         return None
 
-async def fetch_posts_with_replies(page, posts):
+async def fetch_posts_with_replies(page, posts, browser, parser):
     """
     为每个帖子抓取真实评论
     
     Args:
         page: DrissionPage 页面对象
         posts: 帖子列表
+        browser: 浏览器专用线程（TrackedExecutor）
+        parser: HTML 解析线程（TrackedExecutor）
     
     Returns:
         list: 包含评论的帖子列表
@@ -557,73 +573,121 @@ async def fetch_posts_with_replies(page, posts):
     logger.info(f"{'='*60}\n")
     
     enhanced_posts = []
+    run_deadline = deadline.current()
+    stats = fetch_profile.FetchStats("linuxdo", enabled=FETCH_PROFILE.enabled)
+    # 详情页在独立标签页中打开，按导航次数/内存定期回收，避免渲染进程内存无限增长
+    recycler = browser_lifecycle.TabRecycler(
+        page, "linuxdo",
+        setup_tab=lambda tab: fetch_profile.apply_cdp(tab, FETCH_PROFILE),
+        browser_factory=build_browser_page,
+    )
     
-    for i, post in enumerate(posts):
-        logger.info(f"[{i+1}/{len(posts)}] 处理: {post['title'][:50]}...")
+    try:
+        for i, post in enumerate(posts):
+            logger.info(f"[{i+1}/{len(posts)}] 处理: {post['title'][:50]}...")
         
-        # 访问帖子详情页获取评论
-        replies_data = await fetch_post_replies(page, post['link'], post['title'])
+            # 接近截止时间：剩余帖子不再访问详情页，直接使用RSS描述
+            if run_deadline.should_shed():
+                run_deadline.shed("详情页抓取")
+                replies_data = None
+            else:
+                # 访问帖子详情页获取评论
+                with log_config.bind(post_id=post.get('id'), stage="详情页"):
+                    tab = await browser.run(lambda: recycler.tab)
+                    replies_data = await fetch_post_replies(tab, post['link'], post['title'], browser, parser, stats)
+                    await browser.run(recycler.after_navigation)
         
-        if replies_data:
-            # 合并数据
-            post['main_content'] = replies_data['main_content']
-            post['comments'] = replies_data['comments']
-            post['total_replies'] = replies_data['total_replies']
+            if replies_data:
+                # 合并数据
+                post['main_content'] = replies_data['main_content']
+                post['comments'] = replies_data['comments']
+                post['total_replies'] = replies_data['total_replies']
             
-            # 如果原来的content是从RSS来的，现在替换为真实内容
-            if replies_data['main_content']:
-                post['content'] = replies_data['main_content']
-        else:
-            # 如果获取失败，保持原有的RSS description
-            post['main_content'] = post.get('content', '')
-            post['comments'] = []
-            post['total_replies'] = 0
-            logger.warning(f"    ⚠️ 使用RSS描述作为降级方案")
+                # 如果原来的content是从RSS来的，现在替换为真实内容
+                if replies_data['main_content']:
+                    post['content'] = replies_data['main_content']
+            else:
+                # 如果获取失败（或已放弃详情页），保持原有的RSS description
+                post['main_content'] = post.get('content', '')
+                post['comments'] = []
+                post['total_replies'] = 0
+                logger.warning(f"    ⚠️ 使用RSS描述作为降级方案")
         
-        enhanced_posts.append(post)
+            enhanced_posts.append(post)
         
-        # 请求间隔，避免被封
-        if i < len(posts) - 1:
-            await asyncio.sleep(REQUEST_INTERVAL)
+            # 请求间隔，避免被封
+            if i < len(posts) - 1 and replies_data is not None:
+                await asyncio.sleep(REQUEST_INTERVAL)
+    finally:
+        await browser.run(recycler.close)
+        if recycler.browser is not page:
+            # 中途重启过浏览器：新浏览器由这里关闭，原浏览器已在重启时关闭
+            try:
+                await browser.run(recycler.browser.quit)
+            except Exception:
+                pass
     
     logger.info(f"\n✅ 完成帖子详情抓取")
     logger.info(f"   总帖子数: {len(enhanced_posts)}")
-    logger.info(f"   总评论数: {sum(p.get('total_replies', 0) for p in enhanced_posts)}\n")
+    logger.info(f"   总评论数: {sum(p.get('total_replies', 0) for p in enhanced_posts)}")
+    logger.info(f"   📶 {stats.summary()}")
+    logger.info(f"   ♻️ {recycler.summary()}\n")
     
     return enhanced_posts
 
+def parse_engagement(rss_content, default=(0, 0)):
+    """从RSS描述中提取互动数据："X 个帖子 - Y 位参与者" -> (回复数, 参与者数)，没有时返回 default"""
+    match = re.search(r'(\d+)\s*个帖子\s*-\s*(\d+)\s*位参与者', rss_content or "")
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return default
+
+def parse_pub_date(text):
+    """RSS pubDate（RFC 822）-> Unix 时间戳，解析失败返回 None"""
+    try:
+        return parsedate_to_datetime(text).timestamp() if text else None
+    except (TypeError, ValueError):
+        return None
+
 @retry_on_failure(max_retries=MAX_RETRIES, delay=RETRY_DELAY)
-async def fetch_linuxdo_posts():
-    """爬取Linux.do帖子"""
+async def fetch_linuxdo_posts(seen=None):
+    """爬取Linux.do帖子（seen: 已处理帖子索引，命中的帖子在访问详情页之前被丢弃）"""
     logger.info("🚀 开始爬取Linux.do帖子...")
     
+    # DrissionPage 是同步库：所有浏览器操作在专用线程中串行执行，HTML 解析放到另一个线程，
+    # 事件循环保持空闲，同进程内其他数据源的数据库写入和 AI 调用可以真正并行。
+    # 每次只有几十个页面，且页面是逐个抓取的，不值得开进程池（fork 时日志、写入队列、浏览器等
+    # 后台线程持有的锁会被复制到子进程，Windows 下 spawn 还会重新导入本脚本）
+    browser = executors.TrackedExecutor.threads("linuxdo-browser", 1)
+    parser = executors.TrackedExecutor.threads("linuxdo-parser", 1)
     page = None
     try:
-        page = build_browser_page()
+        page = await browser.run(build_browser_page)
+        run_deadline = deadline.current()
 
         # 预热：访问首页建立会话
         logger.info(f"⏳ 访问首页预热: {WARM_UP_URL}")
-        page.get(WARM_UP_URL)
+        await browser.run(page.get, WARM_UP_URL, timeout=run_deadline.timeout(PAGE_LOAD_TIMEOUT, stage="首页预热"))
 
         # 检测并等待 Cloudflare 挑战
-        wait_for_cloudflare_challenge(page, timeout=CF_CHALLENGE_TIMEOUT)
+        await browser.run(wait_for_cloudflare_challenge, page, timeout=run_deadline.timeout(CF_CHALLENGE_TIMEOUT))
 
         logger.info("✓ 预热完成")
         await asyncio.sleep(3)
 
         # 访问RSS源
         logger.info(f"⏳ 访问RSS源: {RSS_URL}")
-        page.get(RSS_URL)
+        await browser.run(page.get, RSS_URL, timeout=run_deadline.timeout(PAGE_LOAD_TIMEOUT, stage="RSS"))
         await asyncio.sleep(2)
 
         # 获取RSS内容
-        rss_text = get_page_html(page)
+        rss_text = await browser.run(get_page_html, page)
+        rss_status = await browser.run(get_page_status, page)
 
-        # 保存调试文件
-        debug_filename = f"debug_rss_content_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-        with open(debug_filename, "w", encoding="utf-8") as f:
-            f.write(rss_text)
-        logger.info(f"✓ 已保存调试文件: {debug_filename} ({len(rss_text)} 字符)")
+        # 保存调试存档（后台压缩写入，内容相同的RSS只存一份）
+        debug_filename = capture.store.capture(rss_text, url=RSS_URL, status=rss_status, reason="RSS")
+        if debug_filename:
+            logger.info(f"✓ 已保存调试存档: {debug_filename} ({len(rss_text)} 字符)")
 
         # 解析RSS内容
         all_posts = []
@@ -635,7 +699,7 @@ async def fetch_linuxdo_posts():
             items = root.findall('.//channel/item')
             logger.info(f"✓ 找到 {len(items)} 个帖子")
 
-            for i, item in enumerate(items[:POST_COUNT_LIMIT]):
+            for i, item in enumerate(items):
                 title = item.find('title')
                 link = item.find('link')
                 description = item.find('description')
@@ -653,6 +717,7 @@ async def fetch_linuxdo_posts():
                             "link": link_text,
                             "id": topic_id,
                             "description": description_text,
+                            "published": parse_pub_date(item.findtext('pubDate')),
                         })
 
         except ET.ParseError:
@@ -670,7 +735,7 @@ async def fetch_linuxdo_posts():
                     root = ET.fromstring(xml_content)
                     items = root.findall('.//channel/item')
 
-                    for i, item in enumerate(items[:POST_COUNT_LIMIT]):
+                    for i, item in enumerate(items):
                         title = item.find('title')
                         link = item.find('link')
                         description = item.find('description')
@@ -683,6 +748,7 @@ async def fetch_linuxdo_posts():
                                     "link": link.text,
                                     "id": match.group(1),
                                     "description": description.text if description is not None else "",
+                                    "published": parse_pub_date(item.findtext('pubDate')),
                                 })
 
             except Exception as e2:
@@ -697,8 +763,6 @@ async def fetch_linuxdo_posts():
             links = re.findall(link_pattern, rss_text)
 
             for i, (title, link) in enumerate(zip(titles, links)):
-                if i >= POST_COUNT_LIMIT:
-                    break
                 match = re.search(r'/t/[^/]+/(\d+)', link)
                 if match:
                     all_posts.append({
@@ -714,6 +778,16 @@ async def fetch_linuxdo_posts():
             logger.error("❌ 未能解析到任何帖子")
             return []
 
+        # 丢弃已处理的帖子（在访问详情页和AI分析之前），再按数量限制截断
+        if seen is not None:
+            all_posts, refresh_posts = seen.partition(all_posts)
+            if refresh_posts:
+                await refresh_post_stats(refresh_posts)
+        all_posts = all_posts[:POST_COUNT_LIMIT]
+        if not all_posts:
+            logger.info("✓ 没有需要处理的新帖子")
+            return []
+
         # 处理帖子内容
         posts_with_content = []
         for i, post in enumerate(all_posts):
@@ -721,15 +795,7 @@ async def fetch_linuxdo_posts():
 
             if rss_content:
                 # 提取互动数据："X 个帖子 - Y 位参与者"
-                replies_count = 0
-                participants_count = 0
-                try:
-                    match = re.search(r'(\d+)\s*个帖子\s*-\s*(\d+)\s*位参与者', rss_content)
-                    if match:
-                        replies_count = int(match.group(1))
-                        participants_count = int(match.group(2))
-                except Exception:
-                    pass
+                replies_count, participants_count = parse_engagement(rss_content)
 
                 # 清理HTML标签，并移除互动统计语句
                 clean_content = re.sub(r'<[^>]+>', ' ', rss_content)
@@ -754,7 +820,7 @@ async def fetch_linuxdo_posts():
         logger.info(f"✓ 获取到 {len(posts_with_content)} 篇帖子（仅RSS描述）")
 
         # 新增：访问每个帖子详情页抓取真实评论
-        posts_with_replies = await fetch_posts_with_replies(page, posts_with_content)
+        posts_with_replies = await fetch_posts_with_replies(page, posts_with_content, browser, parser)
 
         return posts_with_replies
 
@@ -762,20 +828,24 @@ async def fetch_linuxdo_posts():
         logger.error(f"❌ 爬取失败: {e}")
         try:
             if page:
-                html = get_page_html(page)
-                debug_file = f"linuxdo/debug_page_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-                with open(debug_file, "w", encoding="utf-8") as f:
-                    f.write(html)
-                logger.info(f"📄 已保存页面HTML到: {debug_file}")
+                html = await browser.run(get_page_html, page)
+                status = await browser.run(get_page_status, page)
+                debug_file = capture.store.capture(html, status=status, reason=f"爬取失败: {e}")
+                if debug_file:
+                    logger.info(f"📄 已保存页面HTML到: {debug_file}")
         except Exception:
             pass
         raise e
     finally:
         if page:
             try:
-                page.quit()
+                await browser.run(page.quit)
             except Exception:
                 pass
+        logger.info(f"⚙️ {browser.summary()}")
+        logger.info(f"⚙️ {parser.summary()}")
+        browser.shutdown(wait=False)
+        parser.shutdown(wait=False)
 
 # =============================================================================
 # 数据库操作
@@ -783,147 +853,208 @@ async def fetch_linuxdo_posts():
 
 async def create_posts_table():
     """创建数据库表"""
-    conn = None
     try:
-        conn = await asyncpg.connect(NEON_DB_URL, timeout=60)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS posts (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                url TEXT NOT NULL,
-                core_issue TEXT,
-                key_info JSONB,
-                post_type TEXT,
-                value_assessment TEXT,
-                detailed_analysis TEXT,
-                timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
+        pool = await db.get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS posts (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    core_issue TEXT,
+                    key_info JSONB,
+                    post_type TEXT,
+                    value_assessment TEXT,
+                    detailed_analysis TEXT,
+                    timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
         logger.info("✓ 数据库表检查完成")
         return True
     except Exception as e:
         logger.error(f"❌ 数据库表创建失败: {e}")
         return False
-    finally:
-        if conn:
-            await conn.close()
 
-async def insert_posts_into_db(posts_data):
-    """插入帖子数据到数据库"""
-    max_db_retries = 3
-    for attempt in range(max_db_retries):
-        conn = None
+async def refresh_post_stats(posts):
+    """
+    已处理帖子只刷新回复数和参与者数（来自RSS描述，不重新抓取详情和分析）；
+    描述中没有互动数据的帖子跳过，不把数据库中的统计覆盖为 0
+    """
+    rows = []
+    for post in posts:
+        engagement = parse_engagement(post.get('description', ''), default=None)
+        if engagement is not None:
+            rows.append((post['id'], *engagement))
+    if rows:
+        spool.writer.executemany(
+            "UPDATE posts SET replies_count = $2, participants_count = $3 WHERE id = $1", rows, label="linuxdo 互动统计", source="linuxdo"
+        )
+    skipped = f"（{len(posts) - len(rows)} 篇描述中没有互动数据，跳过）" if len(rows) < len(posts) else ""
+    logger.info(f"✓ 已提交 {len(rows)} 篇已处理帖子的互动统计到写入队列{skipped}")
+
+@spool.register("linuxdo.posts")
+async def write_posts(conn, posts_data):
+    """写入队列的写入函数：逐篇 upsert（重放安全），表结构未迁移时逐级回退到旧语句；有帖子失败时整批重试"""
+    success_count = 0
+    last_error = None
+    for post in posts_data:
         try:
-            conn = await asyncpg.connect(NEON_DB_URL, timeout=60)
-            logger.info(f"⏳ 开始插入数据到数据库 (尝试 {attempt+1}/{max_db_retries})...")
-            
-            success_count = 0
-            # ... (rest of the insertion logic remains the same, but indented) ...
-            for post in posts_data:
+            post_id = post.get('id')
+            title = post.get('title')
+            url = post.get('link')
+            analysis = post.get('analysis') or {}
+            core_issue = analysis.get('core_issue')
+            key_info = json.dumps(analysis.get('key_info', []))
+            post_type = analysis.get('post_type')
+            value_assessment = analysis.get('value_assessment')
+            detailed_analysis = analysis.get('detailed_analysis')
+
+            # 新字段（若存在）：replies_count / participants_count
+            replies_count = int(post.get('replies_count') or 0)
+            participants_count = int(post.get('participants_count') or 0)
+            stats = post.get('comment_stats') or {}
+            stats_values = (
+                stats.get('support_ratio'), stats.get('oppose_ratio'), stats.get('neutral_ratio'),
+                stats.get('sentiment'), stats.get('controversy'), stats.get('heat'),
+            )
+
+            # 优先尝试插入包含新列的语句；如果失败则逐级回退到旧语句（兼容未迁移的表结构）
+            try:
+                await conn.execute("""
+                    INSERT INTO posts (id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, replies_count, participants_count,
+                                       comment_support_ratio, comment_oppose_ratio, comment_neutral_ratio, comment_sentiment, comment_controversy, discussion_heat)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16)
+                    ON CONFLICT (id) DO UPDATE SET
+                        title = EXCLUDED.title,
+                        url = EXCLUDED.url,
+                        core_issue = EXCLUDED.core_issue,
+                        key_info = EXCLUDED.key_info,
+                        post_type = EXCLUDED.post_type,
+                        value_assessment = EXCLUDED.value_assessment,
+                        detailed_analysis = EXCLUDED.detailed_analysis,
+                        replies_count = EXCLUDED.replies_count,
+                        participants_count = EXCLUDED.participants_count,
+                        comment_support_ratio = EXCLUDED.comment_support_ratio,
+                        comment_oppose_ratio = EXCLUDED.comment_oppose_ratio,
+                        comment_neutral_ratio = EXCLUDED.comment_neutral_ratio,
+                        comment_sentiment = EXCLUDED.comment_sentiment,
+                        comment_controversy = EXCLUDED.comment_controversy,
+                        discussion_heat = EXCLUDED.discussion_heat,
+                        timestamp = CURRENT_TIMESTAMP;
+                """, post_id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, replies_count, participants_count, *stats_values)
+            except asyncpg.exceptions.UndefinedColumnError:
                 try:
-                    post_id = post.get('id')
-                    title = post.get('title')
-                    url = post.get('link')
-                    analysis = post.get('analysis', {})
-                    core_issue = analysis.get('core_issue')
-                    key_info = json.dumps(analysis.get('key_info', []))
-                    post_type = analysis.get('post_type')
-                    value_assessment = analysis.get('value_assessment')
-                    detailed_analysis = analysis.get('detailed_analysis')
-
-                    # 新字段（若存在）：replies_count / participants_count
-                    replies_count = int(post.get('replies_count') or 0)
-                    participants_count = int(post.get('participants_count') or 0)
-
-                    # 优先尝试插入包含新列的语句；如果失败则回退到旧语句（兼容未迁移的表结构）
-                    try:
-                        await conn.execute("""
-                            INSERT INTO posts (id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, replies_count, participants_count)
-                            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                            ON CONFLICT (id) DO UPDATE SET
-                                title = EXCLUDED.title,
-                                url = EXCLUDED.url,
-                                core_issue = EXCLUDED.core_issue,
-                                key_info = EXCLUDED.key_info,
-                                post_type = EXCLUDED.post_type,
-                                value_assessment = EXCLUDED.value_assessment,
-                                detailed_analysis = EXCLUDED.detailed_analysis,
-                                replies_count = EXCLUDED.replies_count,
-                                participants_count = EXCLUDED.participants_count,
-                                timestamp = CURRENT_TIMESTAMP;
-                        """, post_id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, replies_count, participants_count)
-                    except Exception as insert_err:
-                        # logger.warning(f"posts 表缺少新列，回退旧插入语句: {insert_err}")
-                        await conn.execute("""
-                            INSERT INTO posts (id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis)
-                            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                            ON CONFLICT (id) DO UPDATE SET
-                                title = EXCLUDED.title,
-                                url = EXCLUDED.url,
-                                core_issue = EXCLUDED.core_issue,
-                                key_info = EXCLUDED.key_info,
-                                post_type = EXCLUDED.post_type,
-                                value_assessment = EXCLUDED.value_assessment,
-                                detailed_analysis = EXCLUDED.detailed_analysis,
-                                timestamp = CURRENT_TIMESTAMP;
-                        """, post_id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"❌ 插入帖子失败 [{post.get('id', 'N/A')}]: {e}")
-                    continue
+                    await conn.execute("""
+                        INSERT INTO posts (id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, replies_count, participants_count)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                        ON CONFLICT (id) DO UPDATE SET
+                            title = EXCLUDED.title,
+                            url = EXCLUDED.url,
+                            core_issue = EXCLUDED.core_issue,
+                            key_info = EXCLUDED.key_info,
+                            post_type = EXCLUDED.post_type,
+                            value_assessment = EXCLUDED.value_assessment,
+                            detailed_analysis = EXCLUDED.detailed_analysis,
+                            replies_count = EXCLUDED.replies_count,
+                            participants_count = EXCLUDED.participants_count,
+                            timestamp = CURRENT_TIMESTAMP;
+                    """, post_id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, replies_count, participants_count)
+                except asyncpg.exceptions.UndefinedColumnError:
+                    await conn.execute("""
+                        INSERT INTO posts (id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                        ON CONFLICT (id) DO UPDATE SET
+                            title = EXCLUDED.title,
+                            url = EXCLUDED.url,
+                            core_issue = EXCLUDED.core_issue,
+                            key_info = EXCLUDED.key_info,
+                            post_type = EXCLUDED.post_type,
+                            value_assessment = EXCLUDED.value_assessment,
+                            detailed_analysis = EXCLUDED.detailed_analysis,
+                            timestamp = CURRENT_TIMESTAMP;
+                    """, post_id, title, url, core_issue, key_info, post_type, value_assessment, detailed_analysis)
             
-            logger.info(f"✓ 成功插入 {success_count}/{len(posts_data)} 条数据")
-            return success_count > 0
+            success_count += 1
 
         except Exception as e:
-            logger.warning(f"⚠️ 数据库操作失败 (尝试 {attempt+1}): {e}")
-            if attempt < max_db_retries - 1:
-                await asyncio.sleep(5)
-            else:
-                logger.error(f"❌ 最终数据库操作失败: {e}")
-                return False
-        finally:
-            if conn:
-                await conn.close()
+            if spool.is_unreachable(e):
+                raise
+            logger.error(f"❌ 插入帖子失败 [{post.get('id', 'N/A')}]: {e}")
+            last_error = e
+            continue
+
+    logger.info(f"✓ 成功写入数据库 {success_count}/{len(posts_data)} 条数据")
+    if last_error is not None:
+        raise spool.PartialWrite(len(posts_data) - success_count, len(posts_data), last_error)
+
+async def insert_posts_into_db(posts_data):
+    """把帖子数据提交到写入队列（落盘后返回，由后台写入数据库；数据库不可达时保留到下次运行）"""
+    fields = ('id', 'title', 'link', 'analysis', 'replies_count', 'participants_count', 'comment_stats')
+    rows = [{key: post.get(key) for key in fields} for post in posts_data]
+    spool.writer.write("linuxdo.posts", rows, rows=len(rows), label="linuxdo 帖子", source="linuxdo")
+    logger.info(f"✓ 已提交 {len(posts_data)} 条数据到写入队列")
+    return True
 
 # =============================================================================
 # AI报告生成
 # =============================================================================
 
 def generate_ai_analysis(posts_data):
-    """生成AI分析报告"""
+    """
+    生成AI分析报告（按互动热度分级：前K篇完整分析，中间简要分析，其余不调用AI）
+
+    需要调用AI的帖子一起提交到线程池，实际并发由 DeepSeek 的自适应并发窗口控制（common.adaptive_limit），
+    不再在请求之间固定等待
+    """
     if not posts_data:
         logger.warning("⚠️ 没有帖子数据")
         return {"summary_analysis": {"error": "没有帖子数据"}, "processed_posts": []}
 
     logger.info("⏳ 开始AI分析...")
-    processed_posts = []
+    budget = triage.AnalysisBudget("linuxdo")
+    plan = budget.plan(posts_data)
     
-    for i, post in enumerate(posts_data):
-        logger.info(f"  [{i+1}/{len(posts_data)}] 分析: {post['title'][:40]}...")
-        
-        try:
-            post['analysis'] = analyze_single_post_with_deepseek(post)
-            processed_posts.append(post)
-            
-            if i < len(posts_data) - 1:
-                time.sleep(AI_REQUEST_DELAY)
-                
-        except Exception as e:
-            logger.error(f"❌ 分析失败: {e}")
-            post['analysis'] = {
-                "error": f"分析失败: {e}",
-                "core_issue": "分析失败",
-                "key_info": [],
-                "post_type": "错误",
-                "value_assessment": "低",
-                "detailed_analysis": ""
-            }
-            processed_posts.append(post)
+    def analyze(i, post, tier):
+        with log_config.bind(post_id=post.get('id'), stage="AI分析"):
+            logger.info(f"  [{i+1}/{len(plan)}] {triage.TIER_NAMES[tier]}: {post['title'][:40]}...")
+            try:
+                analysis = analyze_single_post_with_deepseek(post, tier, budget)
+                analysis.setdefault('analysis_tier', tier)
+                return analysis
+            except Exception as e:
+                logger.error(f"❌ 分析失败: {e}")
+                return {
+                    "error": f"分析失败: {e}",
+                    "core_issue": "分析失败",
+                    "key_info": [],
+                    "post_type": "错误",
+                    "value_assessment": "低",
+                    "detailed_analysis": ""
+                }
+            finally:
+                budget.release(post)
+    
+    with ThreadPoolExecutor(max_workers=deepseek.MAX_CONCURRENCY, thread_name_prefix="linuxdo-ai") as executor:
+        futures = {}
+        for i, (post, tier) in enumerate(plan):
+            tier = budget.admit(post, tier)
+            if tier == triage.SKIP:
+                post['analysis'] = triage.skipped_analysis(post)
+            else:
+                # 复制上下文，DeepSeek 调用按本次运行的截止时间收紧超时、接近截止时放弃
+                futures[id(post)] = executor.submit(contextvars.copy_context().run, analyze, i, post, tier)
+        for post, _ in plan:
+            if id(post) in futures:
+                post['analysis'] = futures[id(post)].result()
+    processed_posts = [post for post, _ in plan]
             
     logger.info("✓ AI分析完成")
+    logger.info(f"📊 {budget.summary(processed_posts)}")
+    logger.info(f"📊 {deepseek.cache_stats.summary('linuxdo')}")
+    logger.info(f"📊 {llm_json.stats.summary('linuxdo')}")
+    logger.info(f"🎚️ {deepseek.budget.window.summary()}")
+    cost_ledger.ledger.record_posts('linuxdo', len(processed_posts))
+    logger.info(f"💰 {cost_ledger.ledger.summary('linuxdo')}")
 
     return {
         "summary_analysis": {"status": "success"},
@@ -938,7 +1069,7 @@ def generate_json_report(report_data, posts_count):
     """生成JSON报告"""
     try:
         today_str = datetime.now().strftime("%Y-%m-%d")
-        filename = f"../data/linux.do_report_{today_str}.json"
+        filename = str(DATA_DIR / f"linux.do_report_{today_str}.json")
 
         final_json = {
             "meta": {
@@ -958,6 +1089,9 @@ def generate_json_report(report_data, posts_count):
                 "id": post.get('id', 'N/A'),
                 "title": post.get('title', '无标题'),
                 "url": post.get('link', '#'),
+                "comment_stats": post.get('comment_stats'),
+                "cluster_id": post.get('cluster_id'),
+                "cluster_label": post.get('cluster_label'),
                 "analysis": post.get('analysis', {})
             })
 
@@ -981,6 +1115,7 @@ def generate_json_report(report_data, posts_count):
 async def main():
     """主函数"""
     start_time = datetime.now()
+    run_deadline = deadline.start("linuxdo")
     logger.info("")
     
     # 环境检查
@@ -988,29 +1123,49 @@ async def main():
         return False
     
     try:
-        # 1. 创建数据库表
-        db_available = True
-        if not await create_posts_table():
-            logger.warning("⚠️ 数据库连接失败，将仅生成JSON报告")
-            db_available = False
+        # 1. 创建数据库表，先写入上次运行遗留在写入队列中的数据（之后读取已处理帖子）
+        db_available = await create_posts_table()
+        if db_available:
+            await spool.writer.drain()
+        else:
+            logger.warning("⚠️ 数据库连接失败，结果保留在本地写入队列中，恢复后自动写入")
         
-        # 2. 爬取帖子
-        posts_data = await fetch_linuxdo_posts()
+        # 2. 爬取帖子（已处理的帖子在解析RSS时就被丢弃）
+        seen = await seen_index.SeenIndex.load("linuxdo") if db_available else None
+        posts_data = await fetch_linuxdo_posts(seen)
         
         if not posts_data:
+            if seen is not None and seen.all_known():
+                logger.info("✓ RSS中的帖子都已处理过，本次无需分析")
+                return True
             logger.error("❌ 未能获取帖子数据")
             return False
         
         logger.info(f"✓ 获取到 {len(posts_data)} 篇帖子")
         
-        # 3. AI分析
-        report_data = generate_ai_analysis(posts_data)
+        # 评论区统计（立场分布、争议度、讨论热度）在本地批量计算，写入提示词并入库
+        comment_stats.annotate(posts_data)
+        
+        # 3. 近似重复检测：与历史帖子（含其他数据源）高度相似的帖子复用已有分析
+        signatures = await near_dup.SignatureIndex.load() if db_available else near_dup.SignatureIndex()
+        to_analyze, duplicates = await signatures.resolve(posts_data, "linuxdo")
+        
+        # 4. AI分析（同步HTTP调用放到线程中，避免阻塞同进程内的其他数据源）
+        if to_analyze:
+            report_data = await asyncio.to_thread(generate_ai_analysis, to_analyze)
+        else:
+            report_data = {"summary_analysis": {"status": "success"}, "processed_posts": []}
+        near_dup.fill_batch_duplicates(duplicates)
+        report_data.setdefault('processed_posts', []).extend(duplicates)
+        topic_cluster.annotate(report_data['processed_posts'], "linuxdo")
         
-        # 4. 插入数据库
-        if report_data.get('processed_posts') and db_available:
+        # 5. 插入数据库（经写入队列）
+        if report_data.get('processed_posts'):
             await insert_posts_into_db(report_data['processed_posts'])
+            await signatures.save(report_data['processed_posts'], "linuxdo")
+            await topic_cluster.save(report_data['processed_posts'], "linuxdo")
         
-        # 5. 生成报告
+        # 6. 生成报告
         json_file = generate_json_report(report_data, len(posts_data))
         
         # 完成
@@ -1022,6 +1177,8 @@ async def main():
         logger.info(f"  处理时间: {duration:.2f} 秒")
         logger.info(f"  处理帖子: {len(posts_data)} 篇")
         logger.info(f"  生成文件: {json_file}")
+        logger.info(f"  ⏱️ {run_deadline.summary()}")
+        logger.info(f"  🗃️ {capture.store.summary()}")
         logger.info("=" * 80)
         
         return True
@@ -1031,5 +1188,5 @@ async def main():
         return False
 
 if __name__ == "__main__":
-    success = asyncio.run(main())
+    success = asyncio.run(db.run_and_close(main()))
     exit(0 if success else 1)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多数据源统一调度器
+在同一个 asyncio 进程内并发运行 linux.do / reddit / heybox 爬虫：
+- 共享 DeepSeek 速率预算（common/deepseek.py）和数据库连接池（common/db.py）
+- AI 并发由全局自适应窗口控制（DEEPSEEK_INITIAL_CONCURRENCY / DEEPSEEK_MAX_CONCURRENCY），
+  可用 DEEPSEEK_CONCURRENCY_<SOURCE> 另外限制单个数据源，每日 token / 费用预算见 common/cost_ledger.py
+- 按依赖关系编排：reddit 评论采集完成后再运行 reddit 分析
+- 整个调度共用一个截止时间（RUN_TIME_BUDGET，见 common/deadline.py）：各数据源按剩余时间收紧超时和重试，
+  接近截止时放弃低优先级工作并保存已有结果；到达截止时间仍未结束的任务被取消，不会与下一次调度重叠
+- 各数据源的数据库写入先进入本地写入队列（common/spool.py），后台写入数据库；
+  调度结束关闭连接池之前在截止时间内最后写一次，没写完的留到下次运行
+- 日志由后台线程写入 logs/orchestrator.log 和 orchestrator.jsonl（common/log_config.py），每条记录带 source 字段
+- 每日总耗时接近最慢的数据源，而不是各数据源耗时之和
+
+使用方法:
+  python orchestrator.py                           # 运行全部数据源
+  python orchestrator.py --sources reddit heybox   # 只运行指定任务
+  python orchestrator.py --list                    # 列出任务及依赖
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+from dotenv import load_dotenv
+
+SCRAPER_ROOT = Path(__file__).resolve().parent
+if str(SCRAPER_ROOT) not in sys.path:
+    sys.path.insert(0, str(SCRAPER_ROOT))
+
+load_dotenv(dotenv_path=SCRAPER_ROOT.parent / '.env')
+load_dotenv(dotenv_path=SCRAPER_ROOT / '.env')
+
+from common import cost_ledger, db, deadline, deepseek, log_config, spool
+
+# ========== 日志配置 ==========
+# 必须在导入各数据源模块之前配置，统一写入同一个日志文件
+log_config.setup(SCRAPER_ROOT / 'logs' / 'orchestrator.log', '%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+logger = logging.getLogger("orchestrator")
+
+REDDIT_COMMENTS_MAX_POSTS = int(os.getenv("REDDIT_COMMENTS_MAX_POSTS", "20"))
+
+
+def load_source_module(relative_path: str):
+    """按文件路径加载数据源脚本（脚本所在目录加入 sys.path，兼容 `from config import ...`）"""
+    path = SCRAPER_ROOT / relative_path
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    module_name = path.stem
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# ========== 各数据源入口 ==========
+
+async def run_linuxdo():
+    module = load_source_module("linuxdo/scripts/scraper_optimized.py")
+    return await module.main()
+
+
+async def run_heybox():
+    module = load_source_module("heybox_scraper/heybox_playwright_scraper.py")
+    return await module.main()
+
+
+async def run_reddit_comments():
+    module = load_source_module("reddit_scraper/reddit_comments_scraper.py")
+    missing_vars = module.check_config()
+    if missing_vars:
+        logger.error(f"reddit_comments 缺少必需的环境变量: {', '.join(missing_vars)}")
+        return False
+    scraper = module.RedditCommentsScraper()
+    stats = await scraper.scrape_comments_batch(max_posts=REDDIT_COMMENTS_MAX_POSTS)
+    return stats['failed'] == 0
+
+
+async def run_reddit():
+    module = load_source_module("reddit_scraper/reddit_scraper_multi.py")
+    return await module.main()
+
+
+@dataclass
+class Job:
+    """一个调度任务：name 唯一，depends_on 中的任务完成后才开始"""
+    name: str
+    runner: Callable[[], Awaitable]
+    depends_on: List[str] = field(default_factory=list)
+
+
+JOBS = [
+    Job("linuxdo", run_linuxdo),
+    Job("heybox", run_heybox),
+    Job("reddit_comments", run_reddit_comments),
+    # 分析时需要读取评论，必须等评论采集完成
+    Job("reddit", run_reddit, depends_on=["reddit_comments"]),
+]
+
+
+# ========== 调度 ==========
+
+async def run_jobs(jobs: List[Job]) -> Dict[str, dict]:
+    """
+    并发运行所有任务，依赖未完成的任务会等待
+
+    依赖失败不会阻止下游任务（例如评论采集失败时 reddit 分析仍可基于帖子本身进行），
+    只记录警告。只等待本次调度中包含的依赖。
+    """
+    scheduled = {job.name for job in jobs}
+    done_events = {job.name: asyncio.Event() for job in jobs}
+    results: Dict[str, dict] = {}
+
+    async def run_one(job: Job):
+        for dep in job.depends_on:
+            if dep not in scheduled:
+                continue
+            if not done_events[dep].is_set():
+                logger.info(f"⏳ [{job.name}] 等待依赖 {dep} 完成...")
+            await done_events[dep].wait()
+            if not results[dep]['success']:
+                logger.warning(f"⚠️ [{job.name}] 依赖 {dep} 失败，继续执行")
+
+        logger.info(f"🚀 [{job.name}] 开始")
+        start = time.monotonic()
+        remaining = deadline.current().remaining(final=True)
+        try:
+            # 本任务的日志记录都带上 source 字段（common.log_config）
+            with log_config.bind(source=job.name):
+                result = await asyncio.wait_for(job.runner(), timeout=remaining if remaining != math.inf else None)
+            success = result is not False
+        except asyncio.TimeoutError:
+            logger.error(f"❌ [{job.name}] 到达调度截止时间仍未结束，已取消")
+            success = False
+        except SystemExit as e:
+            # 部分脚本在失败时调用 exit()，不能让它结束整个调度进程
+            logger.error(f"❌ [{job.name}] 调用了 exit({e.code})")
+            success = False
+        except Exception as e:
+            logger.exception(f"❌ [{job.name}] 执行失败: {e}")
+            success = False
+        duration = time.monotonic() - start
+        results[job.name] = {'success': success, 'duration': duration}
+        logger.info(f"{'✅' if success else '❌'} [{job.name}] 结束，用时 {duration:.1f} 秒")
+        done_events[job.name].set()
+
+    await asyncio.gather(*(run_one(job) for job in jobs))
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='多数据源统一调度器')
+    parser.add_argument('--sources', '-s', nargs='+', choices=[job.name for job in JOBS],
+                        help='只运行指定任务（默认全部）')
+    parser.add_argument('--list', '-l', action='store_true', help='列出任务及依赖')
+    args = parser.parse_args()
+
+    if args.list:
+        for job in JOBS:
+            deps = f" (依赖: {', '.join(job.depends_on)})" if job.depends_on else ""
+            print(f"  - {job.name}{deps}")
+        return True
+
+    jobs = [job for job in JOBS if not args.sources or job.name in args.sources]
+
+    logger.info("=" * 80)
+    logger.info(f"🗓️ 统一调度启动: {', '.join(job.name for job in jobs)}")
+    logger.info("=" * 80)
+
+    wall_start = time.monotonic()
+    run_deadline = deadline.start("orchestrator", deadline.RUN_TIME_BUDGET)
+    try:
+        results = await run_jobs(jobs)
+    finally:
+        await db.close_pool()
+    wall_time = time.monotonic() - wall_start
+
+    logger.info("=" * 80)
+    logger.info("📊 调度结果:")
+    for name, result in results.items():
+        logger.info(f"  {'✅' if result['success'] else '❌'} {name}: {result['duration']:.1f} 秒")
+    serial_time = sum(result['duration'] for result in results.values())
+    logger.info(f"  总耗时: {wall_time:.1f} 秒（串行执行约需 {serial_time:.1f} 秒）")
+    logger.info(f"  💰 {cost_ledger.ledger.daily_summary()}")
+    logger.info(f"  🎚️ {deepseek.budget.window.summary()}")
+    logger.info(f"  ⏱️ {run_deadline.summary()}")
+    logger.info(f"  🗄️ {spool.writer.summary()}")
+    logger.info("=" * 80)
+
+    return all(result['success'] for result in results.values())
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    exit(0 if success else 1)
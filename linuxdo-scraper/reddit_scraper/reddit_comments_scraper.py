@@ -15,29 +15,46 @@ Reddit 评论采集器
 - REDDIT_USER_AGENT: 用户代理字符串 (格式: platform:app_id:version (by /u/username))
 - REDDIT_REFRESH_TOKEN: 可选，用于需要认证的操作
 - DATABASE_URL: PostgreSQL 数据库连接 URL
+- REDDIT_COMMENTS_WORKERS: 并发采集的帖子数初始值（默认 4），之后按延迟和 429 / 5xx / 超时自适应调整
+  （common.adaptive_limit）
+- REDDIT_COMMENTS_MAX_WORKERS: 并发采集的帖子数上限（默认 12）
+- REDDIT_REPLACE_MORE_LIMIT: 每个帖子最多展开的"更多评论"次数，每次一个 API 请求（默认 8）
+- REDDIT_MAX_COMMENT_DEPTH: 保留的最大评论深度（默认 4，顶层为 0）
+- REDDIT_MIN_COMMENT_SCORE: 保留的最低评论分数（默认 1）
+- REDDIT_MAX_COMMENTS_PER_POST: 每个帖子最多保存的评论数（默认 200）
+- 评论和采集标记经写入队列（common.spool）写入数据库：采集结果先落盘，数据库不可达时保留到下次运行，
+  下次运行先写入遗留数据再查询待采集的帖子
+- RUN_TIME_BUDGET_REDDIT_COMMENTS: 本次采集的时长（秒，见 common.deadline）；接近截止时间时不再展开"更多评论"，
+  截止后还没开始的帖子跳过（不标记，下次运行继续）
 """
 
 import asyncio
+import contextvars
 import os
+import sys
 import json
 import logging
+import pathlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import praw
+import prawcore
 from dotenv import load_dotenv
-import asyncpg
 import re
 
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent
+
+# 公共模块（linuxdo-scraper/common）
+if str(SCRIPT_DIR.parent) not in sys.path:
+    sys.path.insert(0, str(SCRIPT_DIR.parent))
+from common import adaptive_limit, db, deadline, log_config, spool
+
 # --- 配置日志 ---
-os.makedirs('logs', exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/reddit_comments_scraper.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+log_config.setup(SCRIPT_DIR / 'logs' / 'reddit_comments_scraper.log', '%(asctime)s - %(levelname)s - %(message)s',
+                 source="reddit_comments")
 logger = logging.getLogger(__name__)
 
 # --- 配置 ---
@@ -49,18 +66,91 @@ REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
 REDDIT_REFRESH_TOKEN = os.getenv("REDDIT_REFRESH_TOKEN")  # 可选
 
+# 采集配置
+COMMENTS_WORKERS = int(os.getenv("REDDIT_COMMENTS_WORKERS", "4"))
+COMMENTS_MAX_WORKERS = max(COMMENTS_WORKERS, int(os.getenv("REDDIT_COMMENTS_MAX_WORKERS", "12")))
+REPLACE_MORE_LIMIT = int(os.getenv("REDDIT_REPLACE_MORE_LIMIT", "8"))
+REPLACE_MORE_THRESHOLD = 5  # 只展开至少包含这么多条评论的"更多评论"节点
+MAX_COMMENT_DEPTH = int(os.getenv("REDDIT_MAX_COMMENT_DEPTH", "4"))
+MIN_COMMENT_SCORE = int(os.getenv("REDDIT_MIN_COMMENT_SCORE", "1"))
+MAX_COMMENTS_PER_POST = int(os.getenv("REDDIT_MAX_COMMENTS_PER_POST", "200"))
+RATE_LIMIT_RESERVE = 10  # 剩余请求数低于该值时暂停，等待限流窗口重置
+
 # 数据库配置
 NEON_DB_URL = os.getenv("DATABASE_URL")
 if NEON_DB_URL and '?' in NEON_DB_URL:
     NEON_DB_URL = NEON_DB_URL.split('?')[0]
     logger.info("已清理DATABASE_URL中的查询参数")
 
-# 验证必需的环境变量
-required_vars = ["REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT", "DATABASE_URL"]
-missing_vars = [var for var in required_vars if not os.getenv(var)]
-if missing_vars:
-    logger.error(f"缺少必需的环境变量: {', '.join(missing_vars)}")
-    exit(1)
+# 必需的环境变量
+REQUIRED_VARS = ["REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT", "DATABASE_URL"]
+
+def check_config() -> List[str]:
+    """返回缺失的必需环境变量（被统一调度器导入时不能直接退出进程）"""
+    return [var for var in REQUIRED_VARS if not os.getenv(var)]
+
+class RedditRateGovernor:
+    """
+    多个工作线程共享的 Reddit OAuth 限流器
+
+    每个线程有自己的 PRAW 实例，但限额属于同一个 OAuth 应用；
+    这里汇总各实例从 X-Ratelimit-* 响应头解析出的剩余额度，额度不足时让所有线程等待重置。
+    """
+
+    def __init__(self, reserve: int = RATE_LIMIT_RESERVE):
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        self._remaining = None
+        self._reset_timestamp = None
+
+    def update(self, limits: Dict[str, Any]):
+        """用 reddit.auth.limits 更新额度（remaining / reset_timestamp）"""
+        remaining = limits.get('remaining')
+        reset_timestamp = limits.get('reset_timestamp')
+        if remaining is None or reset_timestamp is None:
+            return
+        with self._lock:
+            # 取最新的窗口；同一窗口内取最小剩余额度
+            if self._reset_timestamp is None or reset_timestamp > self._reset_timestamp + 1:
+                self._remaining = remaining
+                self._reset_timestamp = reset_timestamp
+            else:
+                self._remaining = min(self._remaining, remaining)
+
+    def wait(self, run_deadline=deadline.UNLIMITED):
+        """剩余额度不足时阻塞到窗口重置；截止前等不到重置时抛出 DeadlineExceeded"""
+        with self._lock:
+            if self._remaining is None or self._remaining > self.reserve:
+                return
+            sleep_for = self._reset_timestamp - time.time()
+        if sleep_for >= run_deadline.remaining():
+            raise deadline.DeadlineExceeded(run_deadline.name, "等待限流窗口重置")
+        if sleep_for > 0:
+            logger.warning(f"Reddit API 剩余额度 {self._remaining:.0f}，等待 {sleep_for:.0f} 秒后继续")
+            time.sleep(sleep_for)
+
+def is_reddit_overload(error: Exception) -> bool:
+    """过载信号：429、服务端错误、超时和连接错误（并发窗口减半）"""
+    return isinstance(error, (prawcore.exceptions.TooManyRequests, prawcore.exceptions.ServerError,
+                              prawcore.exceptions.RequestException))
+
+@spool.register("reddit.comments")
+async def write_comments(conn, payload: Dict[str, Any]):
+    """写入队列的写入函数：评论 upsert 与采集标记在同一事务中（重放安全）"""
+    insert_query = """
+    INSERT INTO reddit_comments 
+    (comment_id, post_id, reddit_post_id, author, body, score, created_utc, 
+     parent_id, depth, is_submitter, permalink, scraped_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+    ON CONFLICT (comment_id) DO UPDATE SET
+        score = EXCLUDED.score,
+        scraped_at = EXCLUDED.scraped_at
+    """
+    mark_query = "UPDATE reddit_posts SET comments_fetched_at = $2 WHERE id = $1"
+    async with conn.transaction():
+        await conn.executemany(insert_query, [tuple(row) for row in payload['rows']])
+        await conn.execute(mark_query, payload['post_id'], payload['scraped_at'])
+
 
 class RedditCommentsScraper:
     """Reddit 评论采集器"""
@@ -79,6 +169,13 @@ class RedditCommentsScraper:
             if REDDIT_REFRESH_TOKEN:
                 kwargs['refresh_token'] = REDDIT_REFRESH_TOKEN
             
+            self._praw_kwargs = kwargs
+            self._local = threading.local()
+            self.rate_governor = RedditRateGovernor()
+            # 并发采集的帖子数按延迟和过载信号自适应调整（OAuth 额度仍由 rate_governor 控制）
+            self.api_limit = adaptive_limit.AdaptiveLimit(
+                "reddit-api", COMMENTS_WORKERS, maximum=COMMENTS_MAX_WORKERS, is_overload=is_reddit_overload,
+            )
             self.reddit = praw.Reddit(**kwargs)
             
             # 测试连接
@@ -89,25 +186,26 @@ class RedditCommentsScraper:
             raise
     
     async def get_posts_without_comments(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """从数据库获取还没有采集评论的 Reddit 帖子"""
+        """
+        从数据库获取还没有采集评论的 Reddit 帖子
+        
+        以 reddit_posts.comments_fetched_at 为标记，部分索引只包含待采集的帖子，
+        查询代价与待采集数量相关，而不是与帖子/评论总量相关；
+        没有评论的帖子采集后同样会被标记，不会每次都被重新抓取。
+        """
         try:
-            conn = await asyncpg.connect(NEON_DB_URL)
+            pool = await db.get_pool()
             
-            # 查询没有评论数据的帖子
+            # 走部分索引 reddit_posts_comments_pending_idx
             query = """
-            SELECT DISTINCT p.id, p.url, p.title
-            FROM posts p 
-            WHERE p.id LIKE 'reddit_%' 
-            AND NOT EXISTS (
-                SELECT 1 FROM reddit_comments rc 
-                WHERE rc.post_id = p.id
-            )
-            ORDER BY p.timestamp DESC 
+            SELECT id, url, title
+            FROM reddit_posts
+            WHERE comments_fetched_at IS NULL
+            ORDER BY timestamp DESC
             LIMIT $1
             """
             
-            rows = await conn.fetch(query, limit)
-            await conn.close()
+            rows = await pool.fetch(query, limit)
             
             posts = []
             for row in rows:
@@ -134,31 +232,63 @@ class RedditCommentsScraper:
         match = re.search(r'/comments/([a-zA-Z0-9]+)/', url)
         return match.group(1) if match else None
     
-    def fetch_comments_for_post(self, reddit_id: str, title: str) -> List[Dict[str, Any]]:
-        """获取指定帖子的所有评论"""
+    def _thread_client(self) -> praw.Reddit:
+        """PRAW 不是线程安全的，每个工作线程使用自己的实例"""
+        client = getattr(self._local, 'reddit', None)
+        if client is None:
+            client = praw.Reddit(**self._praw_kwargs)
+            self._local.reddit = client
+        return client
+    
+    def fetch_comments_for_post(self, reddit_id: str, title: str,
+                                run_deadline: deadline.Deadline = deadline.UNLIMITED) -> Optional[List[Dict[str, Any]]]:
+        """
+        获取指定帖子的高分评论（可在工作线程中调用），失败时返回 None
+        
+        按 top 排序获取评论树，"更多评论"按包含的评论数从多到少展开，最多 REPLACE_MORE_LIMIT 次；
+        超过 MAX_COMMENT_DEPTH 或低于 MIN_COMMENT_SCORE 的评论被丢弃，结果按分数降序截断。
+        run_deadline 进入降级区间后不再展开"更多评论"；已过截止时间时抛出 DeadlineExceeded（不发出请求）。
+        """
+        reddit = self._thread_client()
         try:
             logger.info(f"开始获取帖子 {reddit_id} 的评论: {title}")
+            self.rate_governor.wait(run_deadline)
             
-            # 获取 submission 对象
-            submission = self.reddit.submission(id=reddit_id)
-            
-            # 展开所有评论（包括被折叠的）
-            submission.comments.replace_more(limit=None)
+            with self.api_limit.slot():
+                # 排队等到名额时可能已经过了截止时间
+                if run_deadline.expired():
+                    raise deadline.DeadlineExceeded(run_deadline.name, "评论采集")
+                
+                # 获取 submission 对象，高分评论优先
+                submission = reddit.submission(id=reddit_id)
+                submission.comment_sort = "top"
+                
+                # 有限度地展开被折叠的评论（replace_more(limit=None) 在大帖子上会发出数百个请求）；
+                # 接近截止时间时只保留已加载的评论，不再发出展开请求
+                replace_more_limit = REPLACE_MORE_LIMIT
+                if run_deadline.should_shed():
+                    run_deadline.shed("评论展开")
+                    replace_more_limit = 0
+                submission.comments.replace_more(limit=replace_more_limit, threshold=REPLACE_MORE_THRESHOLD)
             
             # 扁平化评论树并收集数据
             comments = []
             for comment in submission.comments.list():
                 try:
+                    depth = getattr(comment, 'depth', 0)
+                    score = getattr(comment, 'score', 0)
+                    if depth > MAX_COMMENT_DEPTH or score < MIN_COMMENT_SCORE:
+                        continue
                     # 跳过已删除的评论
                     if hasattr(comment, 'author') and comment.author and hasattr(comment, 'body'):
                         comment_data = {
                             'id': comment.id,
                             'author': str(comment.author) if comment.author else '[deleted]',
                             'body': comment.body,
-                            'score': getattr(comment, 'score', 0),
+                            'score': score,
                             'created_utc': datetime.fromtimestamp(comment.created_utc),
                             'parent_id': comment.parent_id,
-                            'depth': getattr(comment, 'depth', 0),
+                            'depth': depth,
                             'is_submitter': getattr(comment, 'is_submitter', False),
                             'permalink': f"https://reddit.com{comment.permalink}" if hasattr(comment, 'permalink') else '',
                         }
@@ -167,61 +297,55 @@ class RedditCommentsScraper:
                     logger.warning(f"处理评论时出错: {e}")
                     continue
             
+            comments.sort(key=lambda c: c['score'], reverse=True)
+            comments = comments[:MAX_COMMENTS_PER_POST]
             logger.info(f"帖子 {reddit_id} 获取到 {len(comments)} 条评论")
             return comments
             
+        except deadline.DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"获取帖子 {reddit_id} 评论失败: {e}")
-            return []
+            return None
+        finally:
+            self.rate_governor.update(reddit.auth.limits)
     
     async def save_comments_to_db(self, post_db_id: str, reddit_id: str, comments: List[Dict[str, Any]]) -> bool:
-        """保存评论到数据库"""
-        if not comments:
-            logger.info(f"帖子 {reddit_id} 无评论需要保存")
-            return True
-        
+        """把评论和采集标记提交到写入队列（写入时在同一事务中标记帖子评论已采集，无评论的帖子也会被标记）"""
+        # 注意：reddit_comments 表由 Prisma 迁移管理（prisma/migrations/20251024_add_reddit_comments_model）
+        # 无需手动创建表
+        scraped_at = datetime.now()
+        rows = [
+            [
+                comment['id'],
+                post_db_id,
+                reddit_id,
+                comment['author'],
+                comment['body'],
+                comment['score'],
+                comment['created_utc'],
+                comment['parent_id'],
+                comment['depth'],
+                comment['is_submitter'],
+                comment['permalink'],
+                scraped_at
+            ]
+            for comment in comments
+        ]
         try:
-            conn = await asyncpg.connect(NEON_DB_URL)
-            
-            # 注意：reddit_comments 表由 Prisma 迁移管理（prisma/migrations/20251024_add_reddit_comments_model）
-            # 无需手动创建表
-            
-            # 批量插入评论
-            insert_query = """
-            INSERT INTO reddit_comments 
-            (comment_id, post_id, reddit_post_id, author, body, score, created_utc, 
-             parent_id, depth, is_submitter, permalink, scraped_at)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-            ON CONFLICT (comment_id) DO UPDATE SET
-                score = EXCLUDED.score,
-                scraped_at = EXCLUDED.scraped_at
-            """
-            
-            scraped_at = datetime.now()
-            for comment in comments:
-                await conn.execute(
-                    insert_query,
-                    comment['id'],
-                    post_db_id,
-                    reddit_id,
-                    comment['author'],
-                    comment['body'],
-                    comment['score'],
-                    comment['created_utc'],
-                    comment['parent_id'],
-                    comment['depth'],
-                    comment['is_submitter'],
-                    comment['permalink'],
-                    scraped_at
-                )
-            
-            await conn.close()
-            logger.info(f"成功保存 {len(comments)} 条评论到数据库")
-            return True
-            
+            spool.writer.write(
+                "reddit.comments", {'post_id': post_db_id, 'scraped_at': scraped_at, 'rows': rows},
+                rows=len(rows), label=f"reddit 评论 {reddit_id}", source="reddit"
+            )
         except Exception as e:
-            logger.error(f"保存评论到数据库失败: {e}")
+            logger.error(f"保存评论到写入队列失败: {e}")
             return False
+
+        if comments:
+            logger.info(f"已提交 {len(comments)} 条评论到写入队列")
+        else:
+            logger.info(f"帖子 {reddit_id} 无评论需要保存，已提交采集标记")
+        return True
     
     async def _ensure_comments_table_exists(self, conn):
         """
@@ -256,43 +380,74 @@ class RedditCommentsScraper:
     async def scrape_comments_batch(self, max_posts: int = 10) -> Dict[str, int]:
         """批量采集评论"""
         logger.info(f"开始批量采集评论，最多处理 {max_posts} 个帖子")
+        run_deadline = deadline.start("reddit_comments")
         
-        # 获取待处理的帖子
+        # 先写入上次运行遗留在写入队列中的评论（写入后帖子已标记），再获取待处理的帖子
+        await spool.writer.drain()
         posts = await self.get_posts_without_comments(max_posts)
         
         if not posts:
             logger.info("没有需要采集评论的帖子")
-            return {'processed': 0, 'success': 0, 'failed': 0}
+            return {'processed': 0, 'success': 0, 'failed': 0, 'skipped': 0}
         
-        stats = {'processed': 0, 'success': 0, 'failed': 0}
+        stats = {'processed': 0, 'success': 0, 'failed': 0, 'skipped': 0}
         
-        for post in posts:
-            try:
-                stats['processed'] += 1
-                logger.info(f"处理帖子 {stats['processed']}/{len(posts)}: {post['title']}")
-                
-                # 获取评论
-                comments = self.fetch_comments_for_post(post['reddit_id'], post['title'])
-                
-                # 保存到数据库
-                if await self.save_comments_to_db(post['db_id'], post['reddit_id'], comments):
-                    stats['success'] += 1
-                else:
+        # PRAW 是同步库：在线程池中并发采集（实际并发由自适应窗口控制），每个帖子采集完成后立即入库
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=COMMENTS_MAX_WORKERS, thread_name_prefix="reddit-comments")
+        
+        async def harvest(post):
+            # run_in_executor 不复制上下文：在复制的上下文中执行，线程中的日志也带上 post_id / stage
+            with log_config.bind(post_id=post['reddit_id'], stage="评论采集"):
+                comments = await loop.run_in_executor(
+                    executor, contextvars.copy_context().run,
+                    self.fetch_comments_for_post, post['reddit_id'], post['title'], run_deadline
+                )
+            return post, comments
+        
+        try:
+            for future in asyncio.as_completed([harvest(post) for post in posts]):
+                try:
+                    post, comments = await future
+                    stats['processed'] += 1
+                    logger.info(f"处理帖子 {stats['processed']}/{len(posts)}: {post['title']}")
+                    
+                    # 采集失败的帖子不标记，下次运行重试
+                    if comments is None:
+                        stats['failed'] += 1
+                        continue
+                    
+                    # 保存到数据库（经写入队列）
+                    if await self.save_comments_to_db(post['db_id'], post['reddit_id'], comments):
+                        stats['success'] += 1
+                    else:
+                        stats['failed'] += 1
+                    
+                except deadline.DeadlineExceeded:
+                    # 截止前没有开始采集的帖子不标记，下次运行继续
+                    run_deadline.shed("评论采集")
+                    stats['skipped'] += 1
+                    continue
+                except Exception as e:
+                    logger.error(f"处理帖子时出错: {e}")
                     stats['failed'] += 1
-                
-                # 避免 API 限流，添加延迟
-                await asyncio.sleep(2)
-                
-            except Exception as e:
-                logger.error(f"处理帖子 {post['reddit_id']} 时出错: {e}")
-                stats['failed'] += 1
-                continue
+                    continue
+        finally:
+            executor.shutdown(wait=False)
         
-        logger.info(f"批量采集完成: 处理 {stats['processed']} 个帖子，成功 {stats['success']} 个，失败 {stats['failed']} 个")
+        logger.info(f"批量采集完成: 处理 {stats['processed']} 个帖子，成功 {stats['success']} 个，失败 {stats['failed']} 个，"
+                    f"截止前未开始 {stats['skipped']} 个")
+        logger.info(f"🎚️ {self.api_limit.summary()}")
+        logger.info(f"⏱️ {run_deadline.summary()}")
         return stats
 
 async def main():
     """主函数"""
+    missing_vars = check_config()
+    if missing_vars:
+        logger.error(f"缺少必需的环境变量: {', '.join(missing_vars)}")
+        exit(1)
+    
     try:
         scraper = RedditCommentsScraper()
         
@@ -304,6 +459,7 @@ async def main():
         print(f"处理帖子数: {stats['processed']}")
         print(f"成功数: {stats['success']}")
         print(f"失败数: {stats['failed']}")
+        print(f"跳过数: {stats['skipped']}")
         
         if stats['failed'] > 0:
             exit(1)  # 如果有失败，退出码为1
@@ -313,7 +469,7 @@ async def main():
         exit(1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(db.run_and_close(main()))
 
 
 
@@ -2,26 +2,28 @@
 import asyncio
 import os
 import re
+import sys
 import json
 import logging
+import pathlib
 from datetime import datetime
 import requests
 from dotenv import load_dotenv
 import xml.etree.ElementTree as ET
 import time
-import asyncpg
-import ssl
 
-# --- 配置日志 ---
-os.makedirs('logs', exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/reddit_scraper.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent
+
+# 公共模块（linuxdo-scraper/common）
+if str(SCRIPT_DIR.parent) not in sys.path:
+    sys.path.insert(0, str(SCRIPT_DIR.parent))
+from common import (
+    classifier, cost_ledger, db, deadline, deepseek, llm_json, log_config, near_dup, prompts,
+    seen_index, spool, topic_cluster, translate, triage,
 )
+
+# --- 配置日志 ---
+log_config.setup(SCRIPT_DIR / 'logs' / 'reddit_scraper.log', '%(asctime)s - %(levelname)s - %(message)s', source="reddit")
 logger = logging.getLogger(__name__)
 
 # --- 配置 ---
@@ -37,8 +39,8 @@ SUBREDDITS = [
 ]
 
 POST_COUNT_PER_SUB = 5  # 每个subreddit取5个帖子
+TOP_COMMENTS_PER_POST = 5  # 每个帖子从数据库取评分最高的评论数
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 NEON_DB_URL = os.getenv("DATABASE_URL")
 
 # asyncpg不支持URL中的查询参数，需要清理
@@ -78,8 +80,8 @@ if not IS_GITHUB_ACTIONS and os.path.exists(".env"):
         logger.info(f"使用代理: {proxy_for_all}")
 
 # --- Reddit 爬虫函数 ---
-def fetch_reddit_posts_from_subreddit(subreddit):
-    """从单个Subreddit RSS获取帖子数据"""
+def fetch_reddit_posts_from_subreddit(subreddit, seen=None):
+    """从单个Subreddit RSS获取帖子数据（seen: 已处理帖子索引，命中的帖子不进入分析）"""
     RSS_URL = f"https://www.reddit.com/r/{subreddit}/.rss?sort=hot"
     logger.info(f"  开始爬取 r/{subreddit}...")
     headers = {
@@ -92,15 +94,13 @@ def fetch_reddit_posts_from_subreddit(subreddit):
         proxies = {"http": proxy_url, "https": proxy_url}
     
     try:
-        response = requests.get(RSS_URL, headers=headers, timeout=30, proxies=proxies)
+        response = requests.get(RSS_URL, headers=headers, proxies=proxies,
+                                timeout=deadline.current().timeout(30, stage=f"r/{subreddit}"))
         response.raise_for_status()
         root = ET.fromstring(response.content)
         posts = []
         
-        for i, entry in enumerate(root.findall('{http://www.w3.org/2005/Atom}entry')):
-            if i >= POST_COUNT_PER_SUB:
-                break
-                
+        for entry in root.findall('{http://www.w3.org/2005/Atom}entry'):
             title_tag = entry.find('{http://www.w3.org/2005/Atom}title')
             link_tag = entry.find('{http://www.w3.org/2005/Atom}link')
             content_tag = entry.find('{http://www.w3.org/2005/Atom}content')
@@ -135,6 +135,12 @@ def fetch_reddit_posts_from_subreddit(subreddit):
                     "num_comments": 0
                 })
         
+        # 先丢弃已处理的帖子再截断，名额留给新帖子
+        # RSS 中没有分数和评论数，refresh 策略在这里等同于 skip
+        if seen is not None:
+            posts, _ = seen.partition(posts, label=f"r/{subreddit}")
+        posts = posts[:POST_COUNT_PER_SUB]
+        
         logger.info(f"    ✓ r/{subreddit} 获取到 {len(posts)} 个帖子")
         return posts
         
@@ -148,13 +154,13 @@ def fetch_reddit_posts_from_subreddit(subreddit):
         logger.error(f"    ✗ 处理 r/{subreddit} 时发生错误: {e}")
         return []
 
-def fetch_all_reddit_posts():
+def fetch_all_reddit_posts(seen=None):
     """从所有配置的subreddit获取帖子"""
     logger.info("=== 开始爬取所有Subreddit ===")
     all_posts = []
     
     for subreddit in SUBREDDITS:
-        posts = fetch_reddit_posts_from_subreddit(subreddit)
+        posts = fetch_reddit_posts_from_subreddit(subreddit, seen)
         all_posts.extend(posts)
         time.sleep(2)  # 避免请求过快
     
@@ -162,26 +168,77 @@ def fetch_all_reddit_posts():
     return all_posts
 
 # --- AI分析函数 (优化中文输出 + 评论集成) ---
-async def fetch_post_comments(post_id):
-    """从数据库获取帖子的高质量评论"""
+async def fetch_comments_for_posts(post_ids, limit=TOP_COMMENTS_PER_POST):
+    """
+    批量获取多个帖子的高质量评论（一次查询、一个连接）
+
+    Returns:
+        dict: {post_id: [{"author", "body", "score"}, ...]}，按评分降序
+    """
+    if not post_ids:
+        return {}
     try:
-        conn = await asyncpg.connect(NEON_DB_URL)
-        # 获取评分最高的前5条评论
-        comments = await conn.fetch("""
-            SELECT author, body, score 
-            FROM reddit_comments 
-            WHERE post_id = $1 
-            ORDER BY score DESC 
-            LIMIT 5
-        """, post_id)
-        await conn.close()
-        return [dict(c) for c in comments]
-    except:
-        return []
+        pool = await db.get_pool()
+        # 窗口函数：每个帖子取评分最高的前N条评论
+        rows = await pool.fetch("""
+            SELECT post_id, author, body, score
+            FROM (
+                SELECT post_id, author, body, score,
+                       ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY score DESC) AS rn
+                FROM reddit_comments
+                WHERE post_id = ANY($1::text[])
+            ) ranked
+            WHERE rn <= $2
+            ORDER BY post_id, score DESC
+        """, list(post_ids), limit)
+    except Exception as e:
+        logger.error(f"✗ 批量获取评论失败，本次分析不包含评论: {e}")
+        return {}
+
+    comments_by_post = {}
+    for row in rows:
+        comments_by_post.setdefault(row['post_id'], []).append({
+            "author": row['author'],
+            "body": row['body'],
+            "score": row['score'],
+        })
+    return comments_by_post
+
+# 静态前缀 + 帖子数据的布局见 common.prompts
+ANALYSIS_PROMPT = prompts.StaticPrompt("reddit", """
+你是专业的Reddit技术内容分析专家。请分析用户消息中的帖子（含社区讨论），生成专业技术分析报告。
+
+**请严格按JSON格式输出（不要包含```json```标记）**：
+{
+  "core_issue": "核心议题（一句话）",
+  "key_info": ["关键信息1", "关键信息2", "关键信息3"],
+  "post_type": "从[技术讨论, 新闻分享, 问题求助, 观点讨论, 资源分享, 教程指南, 项目展示, 其他]选一个",
+  "value_assessment": "从[高, 中, 低]选一个",
+  "detailed_analysis": "生成600-1200字专业技术分析，markdown格式，包含：技术背景、核心方案、工程实践、社区讨论、应用指南、技术趋势"
+}
+""")
 
-async def analyze_single_post_with_deepseek(post, retry_count=0, comments=None):
-    """使用Gemini分析Reddit帖子并输出完整中文（包含评论精华）"""
-    excerpt = post.get('content', '')[:1000]
+# 简要分析（预算不足时降档）：只要概括、关键信息和分类，不生成长篇 detailed_analysis
+BRIEF_PROMPT = prompts.StaticPrompt("reddit-brief", """
+你是专业的Reddit技术内容分析专家。请简要分析用户消息中的帖子。
+
+**请严格按JSON格式输出（不要包含```json```标记）**：
+{
+  "core_issue": "核心议题（一句话）",
+  "key_info": ["关键信息1", "关键信息2"],
+  "post_type": "从[技术讨论, 新闻分享, 问题求助, 观点讨论, 资源分享, 教程指南, 项目展示, 其他]选一个",
+  "value_assessment": "从[高, 中, 低]选一个",
+  "detailed_analysis": ""
+}
+""")
+
+async def analyze_single_post_with_deepseek(post, retry_count=0, comments=None, tier=triage.FULL, budget=None):
+    """
+    使用DeepSeek分析Reddit帖子并输出完整中文（包含评论精华）
+
+    tier 为 triage.BRIEF 时使用简要提示词；budget（triage.AnalysisBudget）记录实际 token 消耗
+    """
+    excerpt = post.get('content', '')[:1000 if tier == triage.FULL else triage.CONTENT_CHARS[tier]]
     if not excerpt.strip():
         excerpt = "（无详细内容）"
     
@@ -189,10 +246,11 @@ async def analyze_single_post_with_deepseek(post, retry_count=0, comments=None):
     comment_section = ""
     if comments and len(comments) > 0:
         comment_section = "\n\n**社区讨论精华**（高赞评论）：\n"
-        for i, comment in enumerate(comments[:3], 1):
-            comment_body = comment['body'][:200]
+        comment_limit = 3 if tier == triage.FULL else triage.COMMENT_COUNT[tier]
+        for i, comment in enumerate(comments[:comment_limit], 1):
+            comment_body = comment['body'][:200 if tier == triage.FULL else triage.COMMENT_CHARS[tier]]
             comment_section += f"{i}. [{comment['author']}] (👍{comment['score']}): {comment_body}...\n"
-        logger.info(f"  ✓ 包含 {len(comments[:3])} 条评论到分析 Prompt")
+        logger.info(f"  ✓ 包含 {len(comments[:comment_limit])} 条评论到分析 Prompt")
     else:
         num_comments = post.get('num_comments', 0)
         if num_comments > 0:
@@ -202,91 +260,62 @@ async def analyze_single_post_with_deepseek(post, retry_count=0, comments=None):
             comment_section = ""
             logger.info(f"  ℹ 该帖子无评论")
 
-    prompt = f"""
-你是专业的Reddit技术内容分析专家。请分析以下帖子（含社区讨论），生成专业技术分析报告。
-
-**原始帖子信息**：
-- 标题: {post['title']}
-- 板块: r/{post['subreddit']}
-- 内容: {excerpt}{comment_section}
-
-**请严格按JSON格式输出（不要包含```json```标记）**：
-{{
-  "title_cn": "中文标题翻译",
-  "core_issue": "核心议题（一句话）",
-  "key_info": ["关键信息1", "关键信息2", "关键信息3"],
-  "post_type": "从[技术讨论, 新闻分享, 问题求助, 观点讨论, 资源分享, 教程指南, 项目展示, 其他]选一个",
-  "value_assessment": "从[高, 中, 低]选一个",
-  "detailed_analysis": "生成600-1200字专业技术分析，markdown格式，包含：技术背景、核心方案、工程实践、社区讨论、应用指南、技术趋势"
-}}
-"""
+    post_data = prompts.render_post(
+        [("标题", post['title']), ("中文标题", post.get('title_cn')), ("板块", f"r/{post['subreddit']}"),
+         ("内容", excerpt)],
+        comment_section,
+        heading="原始帖子信息",
+    )
     
     # 调试：输出 Prompt 的关键部分（避免日志过长）
-    logger.debug(f"  → Prompt 长度: {len(prompt)} 字符, 评论区长度: {len(comment_section)} 字符")
+    logger.debug(f"  → 帖子数据长度: {len(post_data)} 字符, 评论区长度: {len(comment_section)} 字符")
     
     try:
-        # 使用 DeepSeek API (REST)
-        def call_deepseek():
-            response = requests.post(
-                DEEPSEEK_API_URL,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                },
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 2000,
-                },
-                timeout=60,
-            )
-            
-            if not response.ok:
-                raise Exception(f"DeepSeek API error: {response.status_code}")
-            
-            return response.json()
-        
-        data = await asyncio.to_thread(call_deepseek)
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-        
-        # 清理JSON内容
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.startswith('```'):
-            content = content[3:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
+        # 使用 DeepSeek API (REST)，限流见 common.deepseek，容错解析见 common.llm_json
+        result = await deepseek.run_in_thread(
+            llm_json.complete_json,
+            (BRIEF_PROMPT if tier == triage.BRIEF else ANALYSIS_PROMPT).messages(post_data),
+            source="reddit",
+            required=("core_issue",),
+            max_tokens=2000 if tier == triage.FULL else 500,
+            temperature=0.3,
+            timeout=60,
+            api_key=DEEPSEEK_API_KEY,
+            low_priority=True,  # 见 common.deadline（降级）
+        )
+        if budget is not None:
+            budget.charge(result.usage, post, tier)
         
-        try:
-            analysis = json.loads(content)
-            logger.info(f"  ✓ 帖子分析成功: {analysis.get('title_cn', 'N/A')[:30]}...")
+        if result.data is not None:
+            analysis = result.data
+            # title_cn 由翻译缓存提供（common.translate），不再由分析生成
+            analysis['title_cn'] = post.get('title_cn', post['title'])
+            logger.info(f"  ✓ 帖子分析成功: {analysis['title_cn'][:30]}...")
             return analysis
-        except json.JSONDecodeError:
-            logger.error(f"  ✗ DeepSeek返回的内容不是有效JSON: {content[:100]}...")
+        else:
+            logger.error(f"  ✗ DeepSeek返回的内容不是有效JSON: {result.text[:100]}...")
             return {
-                "title_cn": post['title'][:50] + "...",
+                "title_cn": post.get('title_cn', post['title']),
                 "core_issue": "JSON解析失败",
                 "key_info": ["解析失败"],
                 "post_type": "其他",
                 "value_assessment": "低"
             }
             
+    except (cost_ledger.BudgetExhausted, deadline.DeadlineExceeded) as e:
+        logger.warning(f"  ⚠️ {e}，该帖子不再调用AI")
+        analysis = triage.skipped_analysis(post)
+        analysis['title_cn'] = post.get('title_cn', post['title'])
+        return analysis
     except Exception as e:
         logger.error(f"  ✗ AI分析失败: {e}")
-        if retry_count < 2:
+        if retry_count < 2 and deadline.current().can_retry(2):
             logger.info(f"  ⟳ 重试AI分析 ({retry_count + 1}/2)...")
             await asyncio.sleep(2)
-            return await analyze_single_post_with_deepseek(post, retry_count + 1, comments)
+            return await analyze_single_post_with_deepseek(post, retry_count + 1, comments, tier, budget)
         else:
             return {
-                "title_cn": post['title'][:50] + "...",
+                "title_cn": post.get('title_cn', post['title']),
                 "core_issue": "分析失败",
                 "key_info": ["分析失败"],
                 "post_type": "其他",
@@ -300,7 +329,6 @@ async def create_posts_table():
         logger.error("未找到 DATABASE_URL 环境变量")
         return False
 
-    conn = None
     try:
         # Neon需要SSL连接
         logger.info(f"尝试连接数据库...")
@@ -322,20 +350,10 @@ async def create_posts_table():
             logger.error(f"  ✗ DNS测试异常: {e}")
             raise
         
-        logger.info(f"  步骤2: 配置SSL上下文...")
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        logger.info(f"  ✓ SSL配置完成")
-        
-        logger.info(f"  步骤3: 尝试建立数据库连接...")
-        conn = await asyncpg.connect(
-            dsn=NEON_DB_URL,
-            ssl=ssl_context,
-            timeout=60
-        )
+        logger.info(f"  步骤2: 尝试建立数据库连接池（SSL）...")
+        pool = await db.get_pool()
         logger.info("✓ 数据库连接成功")
-        await conn.execute("""
+        await pool.execute("""
             CREATE TABLE IF NOT EXISTS reddit_posts (
                 id TEXT PRIMARY KEY,
                 title TEXT NOT NULL,
@@ -348,7 +366,8 @@ async def create_posts_table():
                 subreddit TEXT,
                 score INTEGER,
                 num_comments INTEGER,
-                timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                comments_fetched_at TIMESTAMPTZ
             );
         """)
         logger.info("✓ 数据库表 'reddit_posts' 检查完成")
@@ -356,82 +375,83 @@ async def create_posts_table():
     except Exception as e:
         logger.error(f"✗ 创建数据库表失败: {e}")
         return False
-    finally:
-        if conn:
-            await conn.close()
 
-async def insert_posts_into_db(posts_data):
-    """将帖子数据插入到数据库"""
-    if not NEON_DB_URL:
-        logger.error("未找到 DATABASE_URL 环境变量")
-        return False
+@spool.register("reddit.posts")
+async def write_posts(conn, posts_data):
+    """写入队列的写入函数：逐篇 upsert（重放安全）；有帖子失败时整批重试"""
+    success_count = 0
+    last_error = None
+    for post in posts_data:
+        try:
+            post_id = post.get('id')
+            title = post.get('title')
+            analysis = post.get('analysis') or {}
+            title_cn = analysis.get('title_cn', title)
+            url = post.get('link')
+            core_issue = analysis.get('core_issue')
+            key_info = json.dumps(analysis.get('key_info', []), ensure_ascii=False)
+            post_type = analysis.get('post_type')
+            value_assessment = analysis.get('value_assessment')
+            detailed_analysis = analysis.get('detailed_analysis')
+            subreddit = post.get('subreddit')
+            score = post.get('score') or 0
+            num_comments = post.get('num_comments') or 0
+
+            await conn.execute("""
+                INSERT INTO reddit_posts (id, title, title_cn, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, subreddit, score, num_comments)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+                ON CONFLICT (id) DO UPDATE SET
+                    title = EXCLUDED.title,
+                    title_cn = EXCLUDED.title_cn,
+                    url = EXCLUDED.url,
+                    core_issue = EXCLUDED.core_issue,
+                    key_info = EXCLUDED.key_info,
+                    post_type = EXCLUDED.post_type,
+                    value_assessment = EXCLUDED.value_assessment,
+                    detailed_analysis = EXCLUDED.detailed_analysis,
+                    subreddit = EXCLUDED.subreddit,
+                    score = EXCLUDED.score,
+                    num_comments = EXCLUDED.num_comments,
+                    timestamp = CURRENT_TIMESTAMP;
+            """, post_id, title, title_cn, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, subreddit, score, num_comments)
+
+            success_count += 1
 
-    conn = None
-    try:
-        # Neon需要SSL连接
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        conn = await asyncpg.connect(
-            dsn=NEON_DB_URL,
-            ssl=ssl_context,
-            timeout=60
-        )
-        logger.info("开始插入数据到数据库...")
-        
-        success_count = 0
-        for post in posts_data:
-            try:
-                post_id = post.get('id')
-                title = post.get('title')
-                title_cn = post.get('analysis', {}).get('title_cn', title)
-                url = post.get('link')
-                analysis = post.get('analysis', {})
-                core_issue = analysis.get('core_issue')
-                key_info = json.dumps(analysis.get('key_info', []), ensure_ascii=False)
-                post_type = analysis.get('post_type')
-                value_assessment = analysis.get('value_assessment')
-                detailed_analysis = analysis.get('detailed_analysis')
-                subreddit = post.get('subreddit')
-                score = post.get('score', 0)
-                num_comments = post.get('num_comments', 0)
-
-                await conn.execute("""
-                    INSERT INTO reddit_posts (id, title, title_cn, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, subreddit, score, num_comments)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                    ON CONFLICT (id) DO UPDATE SET
-                        title = EXCLUDED.title,
-                        title_cn = EXCLUDED.title_cn,
-                        url = EXCLUDED.url,
-                        core_issue = EXCLUDED.core_issue,
-                        key_info = EXCLUDED.key_info,
-                        post_type = EXCLUDED.post_type,
-                        value_assessment = EXCLUDED.value_assessment,
-                        detailed_analysis = EXCLUDED.detailed_analysis,
-                        subreddit = EXCLUDED.subreddit,
-                        score = EXCLUDED.score,
-                        num_comments = EXCLUDED.num_comments,
-                        timestamp = CURRENT_TIMESTAMP;
-                """, post_id, title, title_cn, url, core_issue, key_info, post_type, value_assessment, detailed_analysis, subreddit, score, num_comments)
-                
-                success_count += 1
-                
-            except Exception as e:
-                logger.error(f"  ✗ 插入帖子 {post.get('id', 'N/A')} 失败: {e}")
-                continue
-        
-        logger.info(f"✓ 成功插入/更新 {success_count}/{len(posts_data)} 条数据")
-        return success_count > 0
-        
-    except Exception as e:
-        logger.error(f"✗ 数据库操作失败: {e}")
-        return False
-    finally:
-        if conn:
-            await conn.close()
+        except Exception as e:
+            if spool.is_unreachable(e):
+                raise
+            logger.error(f"  ✗ 插入帖子 {post.get('id', 'N/A')} 失败: {e}")
+            last_error = e
+            continue
+
+    logger.info(f"✓ 成功写入数据库 {success_count}/{len(posts_data)} 条数据")
+    if last_error is not None:
+        raise spool.PartialWrite(len(posts_data) - success_count, len(posts_data), last_error)
+
+async def insert_posts_into_db(posts_data):
+    """将帖子数据提交到写入队列（落盘后返回，由后台写入数据库；数据库不可达时保留到下次运行）"""
+    fields = ('id', 'title', 'link', 'analysis', 'subreddit', 'score', 'num_comments')
+    rows = [{key: post.get(key) for key in fields} for post in posts_data]
+    spool.writer.write("reddit.posts", rows, rows=len(rows), label="reddit 帖子", source="reddit")
+    logger.info(f"✓ 已提交 {len(rows)} 条数据到写入队列")
+    return True
 
 # --- AI整体洞察报告 ---
+def build_processed_post(post, analysis):
+    """报告和入库使用的帖子记录"""
+    return {
+        "id": post.get('id'),
+        "title": post.get('title'),
+        "title_cn": analysis.get('title_cn', post.get('title')),
+        "link": post.get('link'),
+        "author": post.get('author'),
+        "content": post.get('content'),
+        "analysis": analysis,
+        "subreddit": post.get('subreddit'),
+        "score": post.get('score', 0),
+        "num_comments": post.get('num_comments', 0)
+    }
+
 async def generate_ai_summary_report(posts_data):
     """生成整体分析报告（异步版本，支持评论查询，使用DeepSeek）"""
     processed_posts = []
@@ -439,41 +459,50 @@ async def generate_ai_summary_report(posts_data):
 
     logger.info("=== 开始AI分析（包含评论）===")
 
-    # 预先获取所有评论
-    all_comments = []
+    # 预先批量获取所有评论（一次查询）
+    comments_by_post = await fetch_comments_for_posts([post.get('id') for post in posts_data])
+    all_comments = [comments_by_post.get(post.get('id'), []) for post in posts_data]
+    logger.info(f"✓ {len(comments_by_post)}/{len(posts_data)} 个帖子获取到高质量评论")
+
+    # 批量翻译标题（先查翻译缓存，未命中的一次请求翻译一组），与深度分析是否成功无关
+    translator = translate.TitleTranslator("reddit", api_key=DEEPSEEK_API_KEY)
+    titles_cn = await translator.translate([post['title'] for post in posts_data])
     for post in posts_data:
-        logger.info(f"→ 获取评论: r/{post['subreddit']} - {post['title'][:40]}...")
-        comments = await fetch_post_comments(post.get('id'))
-        if comments:
-            logger.info(f"  ✓ 获取到 {len(comments)} 条高质量评论")
-        all_comments.append(comments)
+        post['title_cn'] = titles_cn.get(post['title'], post['title'])
+
+    # 按热度分级（默认全部完整分析，本次运行预算和今日剩余额度不足时逐级降档），再并发分析
+    budget = triage.AnalysisBudget("reddit")
+    budget.plan(posts_data)
 
-    # 并发分析所有帖子
+    async def analyze(post, comments):
+        tier = budget.admit(post, post['analysis_tier'])
+        if tier == triage.SKIP:
+            analysis = triage.skipped_analysis(post)
+            analysis['title_cn'] = post.get('title_cn', post['title'])
+            return analysis
+        with log_config.bind(post_id=post['id'], stage="AI分析"):
+            try:
+                analysis = await analyze_single_post_with_deepseek(post, comments=comments, tier=tier, budget=budget)
+            finally:
+                budget.release(post)
+        analysis.setdefault('analysis_tier', tier)
+        return analysis
+
+    # 所有帖子一起提交，实际并发由 DeepSeek 的自适应并发窗口控制
     logger.info(f"=== 开始并发分析 {len(posts_data)} 个帖子 ===")
-    tasks = [
-        analyze_single_post_with_deepseek(post, comments=comments) 
-        for post, comments in zip(posts_data, all_comments)
-    ]
-    analyses = await asyncio.gather(*tasks)
+    analyses = await asyncio.gather(*(
+        analyze(post, comments) for post, comments in zip(posts_data, all_comments)
+    ))
 
     logger.info("=== AI分析完成 ===")
+    logger.info(f"📊 {budget.summary()}")
     
     # 处理分析结果
     for i, analysis in enumerate(analyses):
         post = posts_data[i]
         if analysis and analysis.get("core_issue") not in ["分析失败", "JSON解析失败"]:
-            processed_posts.append({
-                "id": post.get('id'),
-                "title": post.get('title'),
-                "title_cn": analysis.get('title_cn', post.get('title')),
-                "link": post.get('link'),
-                "author": post.get('author'),
-                "content": post.get('content'),
-                "analysis": analysis,
-                "subreddit": post.get('subreddit'),
-                "score": post.get('score', 0),
-                "num_comments": post.get('num_comments', 0)
-            })
+            post['analysis'] = analysis
+            processed_posts.append(build_processed_post(post, analysis))
             
             post_summaries.append({
                 "subreddit": post.get('subreddit'),
@@ -502,9 +531,9 @@ async def generate_ai_summary_report(posts_data):
 def generate_json_report(report_data, posts_count):
     """生成JSON报告"""
     try:
-        os.makedirs('data', exist_ok=True)
+        os.makedirs(SCRIPT_DIR / 'data', exist_ok=True)
         today_str = datetime.now().strftime("%Y-%m-%d")
-        filename = f"data/reddit_multi_report_{today_str}.json"
+        filename = str(SCRIPT_DIR / 'data' / f"reddit_multi_report_{today_str}.json")
 
         final_json = {
             "meta": {
@@ -526,6 +555,8 @@ def generate_json_report(report_data, posts_count):
                 "title": post.get('title', '无标题'),
                 "title_cn": post.get('title_cn', '无标题'),
                 "url": post.get('link', '#'),
+                "cluster_id": post.get('cluster_id'),
+                "cluster_label": post.get('cluster_label'),
                 "analysis": post.get('analysis', {})
             })
 
@@ -542,9 +573,9 @@ def generate_json_report(report_data, posts_count):
 def generate_markdown_report(report_data, posts_count):
     """生成Markdown报告"""
     try:
-        os.makedirs('reports', exist_ok=True)
+        os.makedirs(SCRIPT_DIR / 'reports', exist_ok=True)
         today_str = datetime.now().strftime("%Y-%m-%d")
-        filename = f"reports/Reddit_Multi_Daily_Report_{today_str}.md"
+        filename = str(SCRIPT_DIR / 'reports' / f"Reddit_Multi_Daily_Report_{today_str}.md")
 
         with open(filename, 'w', encoding='utf-8') as f:
             f.write(f"# Reddit技术+游戏开发每日报告 ({today_str})\n\n")
@@ -581,22 +612,27 @@ def generate_markdown_report(report_data, posts_count):
             f.write("---\n\n")
             f.write(f"## 📋 帖子列表 (共 {posts_count} 篇)\n\n")
             
-            # 按subreddit分组
+            # 按话题分组（未聚类时按subreddit分组），「其他话题」排在最后
             posts = report_data.get('processed_posts', [])
             if posts:
-                current_sub = None
+                if all('cluster_id' in post for post in posts):
+                    posts = sorted(posts, key=lambda post: post['cluster_id'] or float('inf'))
+                    group_of = lambda post: f"🗂️ {post['cluster_label']}"
+                else:
+                    group_of = lambda post: f"r/{post.get('subreddit')}"
+                current_group = None
                 for i, post in enumerate(posts, 1):
-                    subreddit = post.get('subreddit')
-                    if subreddit != current_sub:
-                        current_sub = subreddit
-                        f.write(f"\n### r/{subreddit}\n\n")
+                    group = group_of(post)
+                    if group != current_group:
+                        current_group = group
+                        f.write(f"\n### {group}\n\n")
                     
                     title_cn = post.get('title_cn', post.get('title', '无标题'))
                     link = post.get('link', '#')
                     analysis = post.get('analysis', {})
                     
                     f.write(f"{i}. **{title_cn}**\n")
-                    f.write(f"   - 原标题: {post.get('title', 'N/A')}\n")
+                    f.write(f"   - 原标题: {post.get('title', 'N/A')}（r/{post.get('subreddit')}）\n")
                     f.write(f"   - 链接: {link}\n")
                     f.write(f"   - 核心议题: {analysis.get('core_issue', 'N/A')}\n")
                     f.write(f"   - 类型: {analysis.get('post_type', 'N/A')} | 价值: {analysis.get('value_assessment', 'N/A')}\n\n")
@@ -614,6 +650,7 @@ def generate_markdown_report(report_data, posts_count):
 async def main():
     """主函数"""
     start_time = datetime.now()
+    run_deadline = deadline.start("reddit")
     logger.info("=" * 60)
     logger.info("🚀 Reddit多板块爬虫任务启动")
     logger.info(f"📋 目标板块: {', '.join(SUBREDDITS)}")
@@ -633,26 +670,58 @@ async def main():
         # 验证 DeepSeek API 配置
         logger.info("✓ DeepSeek API 配置已加载")
         
-        # 创建数据库表
-        if not await create_posts_table():
-            logger.error("❌ 数据库表创建失败")
-            return False
+        # 创建数据库表，先写入上次运行遗留在写入队列中的数据（之后读取已处理帖子）
+        if await create_posts_table():
+            await spool.writer.drain()
+        else:
+            logger.warning("⚠️ 数据库表创建失败，结果保留在本地写入队列中，恢复后自动写入")
         
-        # 获取所有帖子
-        posts_data = fetch_all_reddit_posts()
+        # 获取所有帖子（同步请求放到线程中），已处理的帖子在解析RSS时就被丢弃
+        seen = await seen_index.SeenIndex.load("reddit")
+        posts_data = await asyncio.to_thread(fetch_all_reddit_posts, seen)
         
         if not posts_data:
+            if seen.all_known():
+                logger.info("✓ RSS中的帖子都已处理过，本次无需分析")
+                return True
             logger.error("❌ 未能获取到任何帖子")
             return False
         
         logger.info(f"✓ 共获取 {len(posts_data)} 个帖子")
         
-        # 生成AI报告（包含评论分析，使用DeepSeek）
-        report_data = await generate_ai_summary_report(posts_data)
+        # 近似重复检测：与历史帖子（含其他数据源）高度相似的帖子复用已有分析
+        signatures = await near_dup.SignatureIndex.load()
+        to_analyze, duplicates = await signatures.resolve(posts_data, "reddit")
+        
+        # 生成AI报告（包含评论分析，使用DeepSeek；本地预分类结果在分级时写入 post['predicted']）
+        report_data = await generate_ai_summary_report(to_analyze)
+        for field in classifier.FIELDS:
+            agreement = classifier.agreement(to_analyze, field)
+            if agreement:
+                logger.info(f"📊 预分类 {field} 与AI结果一致率 {agreement[0] * 100:.0f}%（{agreement[1]} 篇）")
+        logger.info(f"📊 {deepseek.cache_stats.summary('reddit')}")
+        logger.info(f"📊 {llm_json.stats.summary('reddit')}")
+        logger.info(f"🎚️ {deepseek.budget.window.summary()}")
+        cost_ledger.ledger.record_posts('reddit', len(to_analyze))
+        logger.info(f"💰 {cost_ledger.ledger.summary('reddit')}")
+        
+        # 重复帖子的原帖分析失败时一并丢弃；报告保持原有顺序（按板块分组）
+        near_dup.fill_batch_duplicates(duplicates)
+        report_data['processed_posts'].extend(
+            build_processed_post(post, post['analysis'])
+            for post in duplicates if post.get('analysis', {}).get('core_issue')
+        )
+        order = {post['id']: i for i, post in enumerate(posts_data)}
+        report_data['processed_posts'].sort(key=lambda post: order[post['id']])
+        
+        # 按话题聚类（报告按话题分组，聚类结果写入JSON和数据库）
+        topic_cluster.annotate(report_data['processed_posts'], "reddit")
         
         # 插入数据库
         if report_data.get('processed_posts'):
             await insert_posts_into_db(report_data['processed_posts'])
+            await topic_cluster.save(report_data['processed_posts'], "reddit")
+            await signatures.save([post for post in posts_data if post.get('analysis')], "reddit")
         
         # 生成报告文件
         json_file = generate_json_report(report_data, len(posts_data))
@@ -667,6 +736,7 @@ async def main():
         logger.info(f"📊 处理: {len(posts_data)} 个帖子")
         logger.info(f"📄 报告: {json_file}")
         logger.info(f"📄 报告: {md_file}")
+        logger.info(f"⏱️ {run_deadline.summary()}")
         logger.info("=" * 60)
         
         return True
@@ -678,6 +748,6 @@ async def main():
         return False
 
 if __name__ == "__main__":
-    success = asyncio.run(main())
+    success = asyncio.run(db.run_and_close(main()))
     exit(0 if success else 1)
 
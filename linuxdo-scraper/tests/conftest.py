@@ -0,0 +1,12 @@
+"""
+common 模块的单元测试（在 linuxdo-scraper 目录下运行: python -m pytest tests）
+不访问 DeepSeek 和数据库：需要时用 monkeypatch 替换 deepseek.chat_completion / db.get_pool
+"""
+
+import sys
+from pathlib import Path
+
+# 公共模块（linuxdo-scraper/common）
+PACKAGE_ROOT = Path(__file__).resolve().parents[1]
+if str(PACKAGE_ROOT) not in sys.path:
+    sys.path.insert(0, str(PACKAGE_ROOT))
@@ -0,0 +1,91 @@
+"""common.llm_json: 本地修复、截断恢复和续写"""
+
+import pytest
+
+from common import deepseek, llm_json
+
+
+def test_clean_output():
+    result = llm_json.parse('{"core_issue": "a", "key_info": ["b"]}')
+    assert result.outcome == llm_json.CLEAN
+    assert result.data == {"core_issue": "a", "key_info": ["b"]}
+
+
+def test_strips_fences_and_surrounding_text():
+    result = llm_json.parse('好的，分析如下：\n```json\n{"a": 1}\n```\n以上。')
+    assert result.outcome == llm_json.REPAIRED
+    assert result.data == {"a": 1}
+
+
+def test_repairs_trailing_commas_and_raw_newlines():
+    result = llm_json.parse('{"a": "第一行\n第二行\t结束", "b": [1, 2,],}')
+    assert result.outcome == llm_json.REPAIRED
+    assert result.data == {"a": "第一行\n第二行\t结束", "b": [1, 2]}
+
+
+def test_keeps_code_fences_inside_strings():
+    text = '{"detailed_analysis": "示例:\\n```python\\nprint(1)\\n```"}'
+    assert llm_json.parse(text).data["detailed_analysis"].startswith("示例:\n```python")
+
+
+def test_truncated_string_is_closed():
+    result = llm_json.parse('{"core_issue": "完整", "detailed_analysis": "写到一半')
+    assert result.outcome == llm_json.PARTIAL
+    assert result.truncated
+    assert result.data == {"core_issue": "完整", "detailed_analysis": "写到一半"}
+
+
+def test_truncated_after_key_falls_back_to_last_complete_field():
+    result = llm_json.parse('{"core_issue": "完整", "key_info": ["x", "y"], "post_type":')
+    assert result.outcome == llm_json.PARTIAL
+    assert result.truncated
+    assert result.data == {"core_issue": "完整", "key_info": ["x", "y"]}
+
+
+def test_recovers_fields_with_unescaped_quotes():
+    result = llm_json.parse('{"core_issue": "他说"好用"就买了", "value_assessment": "高"}')
+    assert result.outcome == llm_json.PARTIAL
+    assert result.data == {"core_issue": '他说"好用"就买了', "value_assessment": "高"}
+
+
+def test_unrecoverable_output():
+    result = llm_json.parse("抱歉，我无法分析这篇帖子。")
+    assert result.outcome == llm_json.FAILED
+    assert result.data is None
+    with pytest.raises(ValueError):
+        llm_json.loads("抱歉，我无法分析这篇帖子。")
+
+
+def _response(content, finish_reason="stop", tokens=10):
+    return {
+        "choices": [{"message": {"content": content}, "finish_reason": finish_reason}],
+        "usage": {"total_tokens": tokens},
+    }
+
+
+def test_complete_json_continues_truncated_output(monkeypatch):
+    responses = [_response('{"core_issue": "a", "key_info": ["b",', "length"), _response(' "c"]}')]
+    calls = []
+
+    def fake_chat_completion(messages, source, **kwargs):
+        calls.append(messages)
+        return responses.pop(0)
+
+    monkeypatch.setattr(deepseek, "chat_completion", fake_chat_completion)
+    messages = [{"role": "user", "content": "帖子"}]
+    result = llm_json.complete_json(messages, "test", required=("core_issue",), max_continuations=1)
+
+    assert result.outcome == llm_json.CONTINUED
+    assert result.data == {"core_issue": "a", "key_info": ["b", "c"]}
+    assert result.continuations == 1
+    assert result.usage == {"total_tokens": 20}
+    # 续写请求带上已有输出，只要求输出剩余部分
+    assert calls[1][-2] == {"role": "assistant", "content": '{"core_issue": "a", "key_info": ["b",'}
+    assert calls[1][-1]["content"] == llm_json.CONTINUE_PROMPT
+
+
+def test_complete_json_missing_required_field_fails(monkeypatch):
+    monkeypatch.setattr(deepseek, "chat_completion", lambda messages, source, **kwargs: _response('{"a": 1}'))
+    result = llm_json.complete_json([{"role": "user", "content": "帖子"}], "test", required=("core_issue",))
+    assert result.outcome == llm_json.FAILED
+    assert result.data is None
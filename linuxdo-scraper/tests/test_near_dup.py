@@ -0,0 +1,86 @@
+"""common.near_dup: SimHash 指纹、多索引查找和批次内 / 历史去重"""
+
+import asyncio
+
+import pytest
+
+from common import near_dup
+
+TEXT = "OpenAI 发布了新的开源模型，支持本地部署，上下文长度达到 128k，社区反响热烈"
+ANALYSIS = {"core_issue": "新模型发布", "key_info": ["128k"], "post_type": "资讯",
+            "value_assessment": "高", "detailed_analysis": "..."}
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(near_dup, "NEAR_DUP_ENABLED", True)
+
+
+def _fetch(analyses):
+    async def fetch_analyses(keys):
+        return {key: analyses[key] for key in keys if key in analyses}
+    return fetch_analyses
+
+
+def test_simhash_is_stable_under_formatting_changes():
+    value = near_dup.simhash(TEXT)
+    assert value == near_dup.simhash("  " + TEXT.upper() + " https://example.com/x ！")
+    assert near_dup.hamming(value, near_dup.simhash(TEXT + "，转载")) <= near_dup.NEAR_DUP_MAX_DISTANCE
+
+
+def test_short_text_has_no_signature():
+    assert near_dup.simhash("短标题") is None
+
+
+def test_lookup_finds_neighbours_within_distance():
+    value = near_dup.simhash(TEXT)
+    index = near_dup.SignatureIndex([("reddit:1", value)], max_distance=6)
+    assert index.lookup(value ^ 0b1011) == ("reddit:1", 3)
+    assert index.lookup(value ^ ((1 << 7) - 1)) is None
+    assert index.lookup(value, exclude="reddit:1") is None
+
+
+def test_lookup_matches_all_bands():
+    value = near_dup.simhash(TEXT)
+    index = near_dup.SignatureIndex([("reddit:1", value)], max_distance=6)
+    # 差异分散在 4 段中，每段最多 1 位（距离 4），仍能通过某一段找到
+    flipped = value ^ sum(1 << (offset + 3) for offset in range(0, 64, near_dup.BAND_BITS))
+    assert index.lookup(flipped) == ("reddit:1", 4)
+
+
+def test_resolve_reuses_stored_analysis_from_same_source(monkeypatch):
+    value = near_dup.simhash(TEXT)
+    index = near_dup.SignatureIndex([("reddit:old", value), ("heybox:other", value)])
+    monkeypatch.setattr(near_dup, "fetch_analyses", _fetch({"reddit:old": ANALYSIS, "heybox:other": ANALYSIS}))
+
+    to_analyze, duplicates = asyncio.run(index.resolve([{"id": "new", "title": TEXT}], "reddit"))
+    assert to_analyze == []
+    assert duplicates[0]["duplicate_of"] == "reddit:old"
+    assert duplicates[0]["analysis"] == {**ANALYSIS, "duplicate_of": "reddit:old"}
+
+
+def test_resolve_ignores_other_sources(monkeypatch):
+    value = near_dup.simhash(TEXT)
+    index = near_dup.SignatureIndex([("heybox:other", value)])
+    monkeypatch.setattr(near_dup, "fetch_analyses", _fetch({"heybox:other": ANALYSIS}))
+
+    to_analyze, duplicates = asyncio.run(index.resolve([{"id": "new", "title": TEXT}], "reddit"))
+    assert [post["id"] for post in to_analyze] == ["new"]
+    assert duplicates == []
+
+
+def test_stored_match_without_analysis_is_analyzed_and_indexed(monkeypatch):
+    value = near_dup.simhash(TEXT)
+    index = near_dup.SignatureIndex([("reddit:failed", value)])
+    monkeypatch.setattr(near_dup, "fetch_analyses", _fetch({}))
+
+    posts = [{"id": "first", "title": TEXT}, {"id": "second", "title": TEXT}]
+    to_analyze, duplicates = asyncio.run(index.resolve(posts, "reddit"))
+    # 第一篇按新帖分析并加入索引，第二篇复用第一篇的分析
+    assert [post["id"] for post in to_analyze] == ["first"]
+    assert duplicates[0]["duplicate_of"] == "reddit:first"
+
+    to_analyze[0]["analysis"] = ANALYSIS
+    near_dup.fill_batch_duplicates(duplicates)
+    assert duplicates[0]["analysis"] == {**ANALYSIS, "duplicate_of": "reddit:first"}
+    assert "_duplicate_post" not in duplicates[0]
@@ -0,0 +1,56 @@
+"""common.seen_index: 已处理帖子的判定策略"""
+
+from datetime import datetime, timedelta
+
+from common import seen_index
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+
+def _index(policy, rows, stale_hours=72):
+    return seen_index.SeenIndex("reddit", rows, policy=policy, stale_hours=stale_hours)
+
+
+def test_unknown_posts_are_new():
+    index = _index("skip", [("a", NOW)])
+    assert index.decide("b", NOW.timestamp()) == seen_index.NEW
+    assert "a" in index and "b" not in index
+
+
+def test_skip_policy():
+    index = _index("skip", [("a", NOW - timedelta(days=30))])
+    assert index.decide("a", NOW.timestamp()) == seen_index.SKIP
+
+
+def test_refresh_policy():
+    index = _index("refresh", [("a", NOW)])
+    assert index.decide("a", NOW.timestamp()) == seen_index.REFRESH
+
+
+def test_stale_policy_reanalyzes_old_posts():
+    index = _index("stale", [("old", NOW - timedelta(hours=73)), ("recent", NOW - timedelta(hours=1))])
+    assert index.decide("old", NOW.timestamp()) == seen_index.REANALYZE
+    assert index.decide("recent", NOW.timestamp()) == seen_index.SKIP
+
+
+def test_data_added_after_analysis_is_reanalyzed():
+    index = _index("skip", [
+        ("commented", NOW - timedelta(hours=2), NOW - timedelta(hours=1)),
+        ("analyzed", NOW - timedelta(hours=1), NOW - timedelta(hours=2)),
+        ("no-comments", NOW - timedelta(hours=1), None),
+    ])
+    assert index.decide("commented", NOW.timestamp()) == seen_index.REANALYZE
+    assert index.decide("analyzed", NOW.timestamp()) == seen_index.SKIP
+    assert index.decide("no-comments", NOW.timestamp()) == seen_index.SKIP
+
+
+def test_partition_keeps_order_and_counts():
+    index = _index("skip", [(1, NOW), (3, NOW)])
+    to_process, to_refresh = index.partition([{"id": 3}, {"id": 2}, {"id": 1}, {"id": 4}])
+    assert [item["id"] for item in to_process] == [2, 4]
+    assert to_refresh == []
+    assert index.totals[seen_index.SKIP] == 2
+    assert not index.all_known()
+
+    index.partition([{"id": 1}])
+    assert index.totals[seen_index.NEW] == 2
@@ -0,0 +1,182 @@
+"""common.spool: 同一数据源按写入顺序写入、失败重试和数据库不可达"""
+
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import asyncpg
+import pytest
+
+from common import db, spool
+
+WRITER = "test-record"
+
+
+class FakePool:
+    """只提供 acquire() 的连接池，写入函数在 conn 上记录调用"""
+
+    def __init__(self, conn=None):
+        self.conn = conn if conn is not None else object()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    writer = spool.WriteSpool(tmp_path / "spool.sqlite3")
+    writer._kick = lambda: None     # 不启动后台刷新任务，由测试调用 flush()
+    monkeypatch.setattr(spool, "_writers", dict(spool._writers))
+
+    async def get_pool():
+        return FakePool()
+
+    monkeypatch.setattr(db, "get_pool", get_pool)
+    return writer
+
+
+@pytest.fixture
+def written(queue):
+    """注册测试写入函数：payload 为 {"name": ..., "fail": 剩余失败次数}"""
+    names, failures = [], {}
+
+    @spool.register(WRITER)
+    async def write(conn, payload):
+        remaining = failures.setdefault(payload["name"], payload.get("fail", 0))
+        if remaining:
+            failures[payload["name"]] = remaining - 1
+            raise RuntimeError(f"{payload['name']} 写入失败")
+        names.append(payload["name"])
+
+    return names
+
+
+def _rows(queue):
+    return queue._db().execute("SELECT label, status, attempts FROM spool ORDER BY id").fetchall()
+
+
+def _expire_backoff(queue):
+    queue._db().execute("UPDATE spool SET not_before = 0")
+
+
+def test_writes_in_order_and_removes_batches(queue, written):
+    for name in ("a", "b", "c"):
+        queue.write(WRITER, {"name": name}, label=name, source="reddit")
+    assert asyncio.run(queue.flush()) is True
+    assert written == ["a", "b", "c"]
+    assert _rows(queue) == []
+    assert queue.flushed_batches == 3
+
+
+def test_failed_batch_blocks_later_batches_of_same_source(queue, written):
+    queue.write(WRITER, {"name": "insert", "fail": 1}, label="insert", source="reddit")
+    queue.write(WRITER, {"name": "update"}, label="update", source="reddit")
+    queue.write(WRITER, {"name": "other"}, label="other", source="heybox")
+
+    assert asyncio.run(queue.flush()) is True
+    # 失败的插入在退避中，同一数据源后面的 UPDATE 等待；其他数据源不受影响
+    assert written == ["other"]
+    assert _rows(queue) == [("insert", spool.PENDING, 1), ("update", spool.PENDING, 0)]
+
+    asyncio.run(queue.flush())
+    assert written == ["other"]
+
+    _expire_backoff(queue)
+    asyncio.run(queue.flush())
+    assert written == ["other", "insert", "update"]
+    assert _rows(queue) == []
+
+
+def test_dead_letter_does_not_block_later_batches(queue, written, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_MAX_ATTEMPTS", 1)
+    queue.write(WRITER, {"name": "bad", "fail": 5}, label="bad", source="reddit")
+    queue.write(WRITER, {"name": "next"}, label="next", source="reddit")
+
+    asyncio.run(queue.flush())
+    asyncio.run(queue.flush())
+    assert written == ["next"]
+    assert _rows(queue) == [("bad", spool.DEAD, 1)]
+    assert queue.dead == 1
+
+
+def test_unreachable_database_keeps_batches_without_counting_attempts(queue, written, monkeypatch):
+    queue.write(WRITER, {"name": "a"}, label="a", source="reddit")
+
+    async def unreachable():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(db, "get_pool", unreachable)
+    assert asyncio.run(queue.flush()) is False
+    assert queue.unreachable_since is not None
+    assert _rows(queue) == [("a", spool.PENDING, 0)]
+
+    async def get_pool():
+        return FakePool()
+
+    monkeypatch.setattr(db, "get_pool", get_pool)
+    assert asyncio.run(queue.flush()) is True
+    assert written == ["a"]
+    assert queue.unreachable_since is None
+
+
+def test_unregistered_writer_blocks_only_its_source(queue, written):
+    queue.write(WRITER, {"name": "legacy"}, label="legacy", source="linuxdo")
+    queue.write(WRITER, {"name": "after"}, label="after", source="linuxdo")
+    queue.write(WRITER, {"name": "reddit"}, label="reddit", source="reddit")
+    # 模拟其他数据源的遗留数据：本进程没有注册它的写入函数
+    queue._db().execute("UPDATE spool SET writer = 'other-writer' WHERE label = 'legacy'")
+
+    asyncio.run(queue.flush())
+    assert written == ["reddit"]
+    assert [row[0] for row in _rows(queue)] == ["legacy", "after"]
+
+
+def test_payload_round_trips_datetimes(queue):
+    seen = []
+
+    @spool.register("test-datetime")
+    async def write(conn, payload):
+        seen.append(payload["at"])
+
+    at = datetime(2024, 5, 1, 12, 30)
+    queue.write("test-datetime", {"at": at})
+    asyncio.run(queue.flush())
+    assert seen == [at]
+
+
+def test_write_requires_registered_writer(queue):
+    with pytest.raises(KeyError):
+        queue.write("missing-writer", {})
+
+
+def test_sql_writer_skips_unmigrated_columns(queue, monkeypatch):
+    class Conn:
+        @asynccontextmanager
+        async def transaction(self):
+            yield
+
+        async def executemany(self, sql, rows):
+            raise asyncpg.exceptions.UndefinedColumnError('column "simhash" does not exist')
+
+    async def get_pool():
+        return FakePool(Conn())
+
+    monkeypatch.setattr(db, "get_pool", get_pool)
+    queue.executemany("UPDATE posts SET simhash = $1 WHERE id = $2", [(1, "a")], label="指纹", source="linuxdo")
+    assert asyncio.run(queue.flush()) is True
+    assert _rows(queue) == []
+    assert queue.failures == 0
+
+
+def test_migrates_queue_without_source_column(tmp_path):
+    path = tmp_path / "old.sqlite3"
+    conn = sqlite3.connect(str(path))
+    conn.executescript(spool.SCHEMA.replace(",\n    source TEXT NOT NULL DEFAULT ''", ""))
+    conn.execute("INSERT INTO spool (writer, payload, rows, created) VALUES ('sql', '{}', 1, 0)")
+    conn.commit()
+    conn.close()
+
+    queue = spool.WriteSpool(path)
+    assert queue._db().execute("SELECT source FROM spool").fetchall() == [("",)]
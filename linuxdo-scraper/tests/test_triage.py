@@ -0,0 +1,76 @@
+"""common.triage: 并发分析时的预算预留和结算"""
+
+import math
+
+import pytest
+
+from common import cost_ledger, triage
+
+
+@pytest.fixture(autouse=True)
+def unlimited_daily_budget(monkeypatch):
+    monkeypatch.setattr(cost_ledger.ledger, "remaining_tokens", lambda source: math.inf)
+
+
+def _post(title="帖子", content="正文" * 50):
+    return {"title": title, "content": content}
+
+
+def test_admit_reserves_estimated_cost():
+    post = _post()
+    full = triage.estimate_cost(post, triage.FULL)
+    budget = triage.AnalysisBudget("test", token_budget=full * 2)
+
+    assert budget.admit(post, triage.FULL) == triage.FULL
+    assert budget.reserved == full
+    # 再次 admit 同一篇帖子不会重复预留
+    budget.admit(post, triage.FULL)
+    assert budget.reserved == full
+
+
+def test_concurrent_admits_are_downgraded_by_reservations():
+    posts = [_post(f"帖子{i}") for i in range(3)]
+    full = triage.estimate_cost(posts[0], triage.FULL)
+    brief = triage.estimate_cost(posts[0], triage.BRIEF)
+    budget = triage.AnalysisBudget("test", token_budget=full + brief)
+
+    tiers = [budget.admit(post, triage.FULL) for post in posts]
+    assert tiers == [triage.FULL, triage.BRIEF, triage.SKIP]
+    assert budget.downgrades == 2
+    assert budget.counts == {triage.FULL: 1, triage.BRIEF: 1, triage.SKIP: 1}
+
+
+def test_charge_replaces_reservation_with_actual_usage():
+    post = _post()
+    budget = triage.AnalysisBudget("test", token_budget=100000)
+    budget.admit(post, triage.FULL)
+
+    budget.charge({"total_tokens": 123}, post, triage.FULL)
+    assert budget.reserved == 0
+    assert budget.spent == 123
+    assert budget.calls == 1
+
+
+def test_charge_without_usage_uses_estimate():
+    post = _post()
+    budget = triage.AnalysisBudget("test", token_budget=100000)
+    budget.admit(post, triage.BRIEF)
+    budget.charge(None, post, triage.BRIEF)
+    assert budget.spent == triage.estimate_cost(post, triage.BRIEF)
+
+
+def test_release_returns_reservation():
+    post = _post()
+    budget = triage.AnalysisBudget("test", token_budget=100000)
+    budget.admit(post, triage.FULL)
+    budget.release(post)
+    assert budget.reserved == 0
+    assert budget.spent == 0
+
+
+def test_remaining_respects_daily_ledger(monkeypatch):
+    post = _post()
+    monkeypatch.setattr(cost_ledger.ledger, "remaining_tokens",
+                        lambda source: triage.estimate_cost(post, triage.BRIEF))
+    budget = triage.AnalysisBudget("test", token_budget=0)
+    assert budget.admit(post, triage.FULL) == triage.BRIEF
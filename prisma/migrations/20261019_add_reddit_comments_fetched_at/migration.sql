@@ -0,0 +1,24 @@
+-- AlterTable: 为 reddit_posts 添加评论采集标记
+-- 这是安全操作，只添加字段和索引，不删除数据
+
+ALTER TABLE "reddit_posts" ADD COLUMN IF NOT EXISTS "comments_fetched_at" TIMESTAMPTZ(6);
+
+-- 已有评论的帖子视为已采集，避免上线后重复抓取
+UPDATE "reddit_posts" p
+SET "comments_fetched_at" = c."last_scraped_at"
+FROM (
+    SELECT "post_id", MAX("scraped_at") AS "last_scraped_at"
+    FROM "reddit_comments"
+    GROUP BY "post_id"
+) c
+WHERE c."post_id" = p."id" AND p."comments_fetched_at" IS NULL;
+
+-- 部分索引：只包含待采集评论的帖子，按时间倒序取最新的 N 条
+-- （Prisma schema 无法表达 WHERE 条件，此索引只在迁移中维护）
+CREATE INDEX IF NOT EXISTS "reddit_posts_comments_pending_idx"
+    ON "reddit_posts"("timestamp" DESC)
+    WHERE "comments_fetched_at" IS NULL;
+
+-- 每个帖子按分数取前 N 条评论（reddit_scraper_multi.fetch_comments_for_posts）
+CREATE INDEX IF NOT EXISTS "reddit_comments_post_id_score_idx"
+    ON "reddit_comments"("post_id", "score" DESC);
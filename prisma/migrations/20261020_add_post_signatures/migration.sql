@@ -0,0 +1,16 @@
+-- CreateTable: 帖子 SimHash 指纹（跨数据源近似重复检测）
+-- 这是安全操作，只新建表，不修改已有数据
+
+CREATE TABLE IF NOT EXISTS "post_signatures" (
+    "source" TEXT NOT NULL,
+    "post_id" TEXT NOT NULL,
+    "simhash" BIGINT NOT NULL,
+    "duplicate_of" TEXT,
+    "created_at" TIMESTAMPTZ(6) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "post_signatures_pkey" PRIMARY KEY ("source", "post_id")
+);
+
+-- 查询某篇帖子的所有重复转发
+CREATE INDEX IF NOT EXISTS "post_signatures_duplicate_of_idx"
+    ON "post_signatures"("duplicate_of");
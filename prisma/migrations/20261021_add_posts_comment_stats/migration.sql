@@ -0,0 +1,9 @@
+-- AlterTable: 为 posts 添加本地计算的评论区统计（common/comment_stats.py）
+-- 这是安全操作，只添加字段，不删除数据
+
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "comment_support_ratio" REAL;
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "comment_oppose_ratio" REAL;
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "comment_neutral_ratio" REAL;
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "comment_sentiment" REAL;
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "comment_controversy" REAL;
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "discussion_heat" INTEGER;
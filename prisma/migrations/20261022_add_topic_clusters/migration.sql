@@ -0,0 +1,12 @@
+-- AlterTable: 为三个数据源的帖子表添加当日话题聚类结果（common/topic_cluster.py）
+-- topic_cluster 只在同一天、同一数据源内有意义，0 表示未归入任何话题（「其他话题」）
+-- 这是安全操作，只添加字段，不删除数据
+
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "topic_cluster" INTEGER;
+ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "topic_label" TEXT;
+
+ALTER TABLE "reddit_posts" ADD COLUMN IF NOT EXISTS "topic_cluster" INTEGER;
+ALTER TABLE "reddit_posts" ADD COLUMN IF NOT EXISTS "topic_label" TEXT;
+
+ALTER TABLE "heybox_posts" ADD COLUMN IF NOT EXISTS "topic_cluster" INTEGER;
+ALTER TABLE "heybox_posts" ADD COLUMN IF NOT EXISTS "topic_label" TEXT;
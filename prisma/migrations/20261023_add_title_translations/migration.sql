@@ -0,0 +1,10 @@
+-- CreateTable: 标题翻译缓存（common/translate.py），键为原文，跨天复用
+-- 这是安全操作，只新建表，不修改已有数据
+
+CREATE TABLE IF NOT EXISTS "title_translations" (
+    "source_text" TEXT NOT NULL,
+    "translated" TEXT NOT NULL,
+    "created_at" TIMESTAMPTZ(6) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "title_translations_pkey" PRIMARY KEY ("source_text")
+);